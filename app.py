@@ -1,8 +1,16 @@
 import subprocess
 import os
+import math
+import io
 import uuid
 import sys
-from flask import Flask, request, jsonify, send_from_directory
+import time
+import json
+import asyncio
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, stream_with_context, g
 from flask_cors import CORS
 
 # --- Add the project's root directory (Backend) to the Python path ---
@@ -11,136 +19,600 @@ if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
 # --- Final, API-driven imports ---
-from main.agent import get_ganesh_response, GaneshResponse
-from main.tts import speak
-from main.stt import transcribe_audio_gemini
+from main.agent import aget_ganesh_response, stream_ganesh_response, GaneshResponse, response_cache, canned_responses
+from main.agent import warm_up as warm_up_models, models_loaded
+from main.tts import synthesize, asynthesize, presynthesize, AUDIO_EXTENSION, AUDIO_MIMETYPES
+from main.stt import atranscribe_audio_gemini, get_backend as get_stt_backend
+from main.streaming import SentenceSplitter, IncrementalJSONParser
+from main.sessions import create_session_store
+from main.lifecycle import SessionSweeper, AudioOutputStore, AUDIO_OUTPUT_STORE, touch
+from main.audio import adecode_to_pcm, pcm_to_wav
+from main.telemetry import get_logger, stage, traced, start_trace, finish_trace, metrics_response, ADMISSION_SHED, ADMISSION_DEGRADED
+from main.tts_jobs import TTSJob, QueueFullError, create_job_queue, TTS_JOB_MODE, PRIORITY_VOICE, PRIORITY_TEXT
+from main.admission import AdmissionController, Saturated, ADMISSION_DEGRADED_CACHE_THRESHOLD
 
 app = Flask(__name__)
 CORS(app)
 
-# --- In-memory chat history storage ---
-chat_histories = {}
+log = get_logger("app")
+
+# --- Chat history storage (memory, SQLite or Redis; see main/sessions.py) ---
+session_store = create_session_store()
 
 # --- Configuration ---
 SESSIONS_DIR = os.path.join(PROJECT_ROOT, "sessions")
 os.makedirs(SESSIONS_DIR, exist_ok=True)
-# --- FIX: Define a base URL for constructing full audio URLs ---
-BASE_URL = "http://localhost:5000"
+# --- Public origin of this server, used for the absolute audio URLs in responses ---
+BASE_URL = os.getenv("BASE_URL", "http://localhost:5000").rstrip("/")
+# Every reply's audio gets its own file name and is never rewritten, so browsers may keep it.
+AUDIO_MAX_AGE_SECONDS = int(os.getenv("AUDIO_MAX_AGE_SECONDS", "86400"))
+# --- Per-sentence TTS runs here while the LLM keeps generating ---
+TTS_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+# --- Session lifecycle: idle session folders are deleted in the background ---
+session_sweeper = SessionSweeper(SESSIONS_DIR)
+# --- How long /audio-jobs/<id>/events holds a subscription open ---
+AUDIO_JOB_SUBSCRIBE_SECONDS = float(os.getenv("AUDIO_JOB_SUBSCRIBE_SECONDS", "120"))
+# --- Reply audio kept in memory instead of on disk (AUDIO_OUTPUT_STORE=memory) ---
+audio_output_store = AudioOutputStore() if AUDIO_OUTPUT_STORE == "memory" else None
+# --- Admission control: rate limits per session/IP and bounded STT, LLM and TTS slots ---
+admission = AdmissionController()
+
+def empty_transcription_response():
+    return GaneshResponse(
+        lang='en', blessing_open='',
+        answer='I am sorry, I could not hear anything in your message. Please speak clearly.',
+        blessing_close='', refusal=True, refusal_reason='Empty transcription'
+    )
+
+def presynthesize_canned_audio():
+    """Puts the speech for every fixed reply into the TTS cache so it is never synthesized on a request."""
+    utterances = [(r.blessing_open + r.answer + r.blessing_close, r.lang) for r in canned_responses()]
+    apology = empty_transcription_response()
+    utterances.append((apology.answer, apology.lang))
+    presynthesize(utterances)
+
+# --- Lifecycle: models load once per process, or once in the gunicorn master (gunicorn.conf.py) ---
+# Importing this module does no heavy work and starts no threads, so it is safe before fork().
+worker_ready = threading.Event()
+_started_pid = None
+_start_lock = threading.Lock()
+
+def preload():
+    """Loads the models and indexes without starting threads or opening connections (safe before fork)."""
+    started = time.perf_counter()
+    warm_up_models(run_inference=False)
+    get_stt_backend()
+    log.info("Models and indexes loaded in %.1f s.", time.perf_counter() - started)
+
+def warm_up_worker():
+    started = time.perf_counter()
+    try:
+        warm_up_models()
+    except Exception:
+        log.exception("Warm-up failed; this worker stays unready.")
+        return
+    worker_ready.set()
+    log.info("Worker %d ready after %.1f s of warm-up.", os.getpid(), time.perf_counter() - started)
+    # After readiness: a slow TTS call must not hold the worker out of rotation.
+    presynthesize_canned_audio()
+
+def start_worker():
+    """Starts this process's background work once (per pid, so forked workers start their own)."""
+    global _started_pid
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    session_sweeper.start()
+    threading.Thread(target=warm_up_worker, name="warm-up", daemon=True).start()
+
+# Servers without gunicorn.conf.py's post_fork hook start the worker on its first request.
+@app.before_request
+def ensure_worker_started():
+    if _started_pid != os.getpid():
+        start_worker()
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process is up and serving."""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 200 only once this worker's warm-up has finished."""
+    ready = worker_ready.is_set()
+    return jsonify({"status": "ready" if ready else "warming_up", **models_loaded()}), 200 if ready else 503
+
+# --- Per-request tracing: stage timings, request metrics and one summary log line ---
+UNTRACED_ENDPOINTS = {"metrics", "healthz", "readyz", None}
+
+@app.before_request
+def begin_trace():
+    if request.endpoint not in UNTRACED_ENDPOINTS:
+        request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.trace = start_trace(request_id, request.endpoint)
+
+@app.after_request
+def tag_response(response):
+    trace = g.get("trace")
+    if trace is not None:
+        trace.status = response.status_code
+        response.headers["X-Request-ID"] = trace.request_id
+    return response
+
+# Streaming responses run teardown twice: when the view returns and again after the
+# last event has been sent. Only the second one closes their trace.
+@app.teardown_request
+def end_trace(exc):
+    trace = g.get("trace")
+    if trace is None or g.pop("streaming", False):
+        return
+    g.trace = None
+    finish_trace(trace)
+
+# --- Admission control: over-limit clients get a 429 before any work is done ---
+ADMITTED_ENDPOINTS = {"transcribe", "process_text_message"}
+
+def overloaded_response(status, message, retry_after):
+    """429/503 with Retry-After, so clients back off instead of retrying at once."""
+    retry_after = max(1, math.ceil(retry_after))
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+@app.before_request
+def admit_request():
+    if request.endpoint not in ADMITTED_ENDPOINTS:
+        return None
+    fields = request.get_json(silent=True) if request.is_json else request.form
+    session_id = fields.get("session_id") if hasattr(fields, "get") else None
+    retry_after, reason = admission.check_rate(session_id, admission.client_ip(request))
+    if retry_after:
+        return overloaded_response(429, f"Too many requests from this {reason}. Please slow down.", retry_after)
+
+def mark_degraded(mode):
+    """Records a fallback taken under load; it is reported in the response's "degraded" list."""
+    ADMISSION_DEGRADED.labels(mode).inc()
+    g.degraded = g.get("degraded", []) + [mode]
+    log.warning("Degraded: %s", mode)
+
+def degraded_lookup(text, history):
+    """With no LLM slot free, a looser match from the response cache beats a 503; raises Saturated otherwise."""
+    lookup = response_cache.lookup(text, history, threshold=ADMISSION_DEGRADED_CACHE_THRESHOLD)
+    if not lookup.hit:
+        ADMISSION_SHED.labels("llm").inc()
+        raise Saturated("llm")
+    return lookup
+
+@app.route("/metrics")
+def metrics():
+    body, content_type = metrics_response()
+    return Response(body, content_type=content_type)
 
 def get_session_paths(session_id):
     """Helper function to generate all necessary paths for a given session_id."""
     session_folder = os.path.join(SESSIONS_DIR, session_id)
     paths = {
         "session": session_folder,
-        "uploads": os.path.join(session_folder, "uploads"),
-        "converted": os.path.join(session_folder, "converted"),
         "audio_out": os.path.join(session_folder, "audio_out")
     }
     for path in paths.values():
         os.makedirs(path, exist_ok=True)
+    touch(session_folder)
     return paths
 
+def save_audio(session_id, paths, filename, data):
+    """Stores synthesized reply audio where serve_audio will look for it; returns False if there is none."""
+    if data is None:
+        return False
+    if audio_output_store is not None:
+        audio_output_store.put(session_id, filename, data)
+    else:
+        with open(os.path.join(paths["audio_out"], filename), "wb") as f:
+            f.write(data)
+    return True
+
+def is_truthy(value):
+    """Form fields arrive as strings, JSON bodies as booleans."""
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+def sse_event(event, data):
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def answer_question(text, history):
+    """Serves the answer from the semantic cache when possible; returns (GaneshResponse, CacheLookup)."""
+    lookup = await asyncio.to_thread(response_cache.lookup, text, history)
+    if lookup.hit:
+        return lookup.entry.response, lookup
+    if not await admission.llm.aacquire():
+        lookup = await asyncio.to_thread(degraded_lookup, text, history)
+        mark_degraded("cached_answer")
+        return lookup.entry.response, lookup
+    try:
+        ganesha_response = await aget_ganesh_response(text, history)
+    finally:
+        admission.llm.release()
+    response_cache.store(lookup, text, ganesha_response)
+    return ganesha_response, lookup
+
+def run_tts_job(job):
+    """Worker side of a background audio job (main/tts_jobs.py); shares cached speech like speak_answer."""
+    lookup = job.cache_lookup
+    data = response_cache.cached_audio(lookup) if lookup is not None else None
+    if data is None:
+        data = synthesize(job.text, job.lang)
+        if lookup is not None:
+            response_cache.attach_audio(lookup, data)
+    return save_audio(job.session_id, get_session_paths(job.session_id), job.filename, data)
+
+# --- Background speech: replies can return before their audio exists ---
+tts_jobs = create_job_queue(run_tts_job)
+
+def audio_job_view(job):
+    view = {"id": job.id, "status": job.status, "error": job.error,
+            "status_url": f"{BASE_URL}/audio-jobs/{job.id}", "events_url": f"{BASE_URL}/audio-jobs/{job.id}/events",
+            "audio_url": f"{BASE_URL}/audio/{job.session_id}/{job.filename}" if job.status == "done" else None}
+    view.update(job.timings())
+    return view
+
+async def speak_answer(lookup, text, lang, session_id, paths, filename):
+    """
+    Reuses the cached WAV of a cache hit, otherwise synthesizes it and keeps it for later hits.
+    Returns False if synthesis produced no audio.
+    """
+    data = response_cache.cached_audio(lookup) if lookup is not None else None
+    if data is None:
+        data = await asynthesize(text, lang)
+        if lookup is not None:
+            response_cache.attach_audio(lookup, data)
+    return await asyncio.to_thread(save_audio, session_id, paths, filename, data)
+
+async def deliver_audio(lookup, text, lang, session_id, paths, response_id, deferred, priority):
+    """
+    Speaks the reply inline, or queues it as a background job when deferred.
+    Returns (audio_url, audio_job); audio_job is only set while the audio is still being made.
+    """
+    filename = f"{response_id}{AUDIO_EXTENSION}"
+    audio_url = f"{BASE_URL}/audio/{session_id}/{filename}"
+    data = response_cache.cached_audio(lookup) if lookup is not None else None
+    if data is not None:
+        await asyncio.to_thread(save_audio, session_id, paths, filename, data)
+        return audio_url, None
+    if deferred:
+        try:
+            job = await asyncio.to_thread(tts_jobs.submit, TTSJob(session_id, filename, text, lang, priority, cache_lookup=lookup))
+            return None, audio_job_view(job)
+        except QueueFullError as e:
+            # Backpressure: with the workers saturated this request speaks its own reply.
+            log.warning("%s Speaking inline.", e)
+    # Under load the text reply goes out without audio rather than waiting on TTS.
+    if not await admission.tts.aacquire():
+        mark_degraded("tts_skipped")
+        return None, None
+    try:
+        spoken = await speak_answer(lookup, text, lang, session_id, paths, filename)
+    finally:
+        admission.tts.release()
+    return (audio_url if spoken else None), None
+
+def stream_ganesha_reply(session_id, text, history, paths, speak_response, response_id, transcription, lookup):
+    """
+    Generator behind the streaming mode of /transcribe and /text-message.
+
+    Emits `token` events as the spoken text (blessings + answer) is decoded from the
+    model's JSON, each with the new text and the answer so far; an `audio` event for every
+    sentence as soon as its speech is synthesized (sentences are spoken while later
+    ones are still being generated); and a final `response` event carrying the same
+    JSON the non-streaming endpoints return.
+    """
+    splitter = SentenceSplitter()
+    pending = []  # (index, sentence, filename, future) in spoken order
+    queued = []  # every sentence handed to TTS, in order
+    audio_segments = []
+    sentence_numbers = itertools.count()
+    parser = IncrementalJSONParser()
+    streamed = False
+    spoken = ""
+
+    def synthesize_and_save(sentence, lang, filename):
+        # Streamed sentences draw on the same per-worker TTS budget as whole replies;
+        # a sentence that finds no slot in time is left unspoken. Returns None in that case,
+        # otherwise whether any audio was saved.
+        if not admission.tts.wait_for_slot():
+            return None
+        try:
+            return save_audio(session_id, paths, filename, synthesize(sentence, lang))
+        finally:
+            admission.tts.release()
+
+    def synthesize_sentences(sentences, lang):
+        for sentence in sentences:
+            index = next(sentence_numbers)
+            filename = f"{response_id}_{index}{AUDIO_EXTENSION}"
+            future = TTS_EXECUTOR.submit(traced(synthesize_and_save), sentence, lang, filename)
+            pending.append((index, sentence, filename, future))
+            queued.append(sentence)
+
+    def unspoken_sentences(final_text):
+        # Streaming speaks only what the parser could read in order, so a skipped field or a
+        # repaired/fallback reply can leave the final text partly or wholly unspoken.
+        if final_text.startswith(spoken):
+            return splitter.feed(final_text) + splitter.flush()
+        final_splitter = SentenceSplitter()
+        sentences = final_splitter.feed(final_text) + final_splitter.flush()
+        already = 0
+        while already < min(len(sentences), len(queued)) and sentences[already] == queued[already]:
+            already += 1
+        return sentences[already:]
+
+    def skip_audio():
+        if "tts_skipped" not in g.get("degraded", []):
+            mark_degraded("tts_skipped")
+
+    def ready_audio(wait=False):
+        # Audio events are released strictly in sentence order.
+        while pending and (wait or pending[0][3].done()):
+            index, sentence, filename, future = pending.pop(0)
+            saved = future.result()
+            if saved is None:
+                skip_audio()
+            if not saved:
+                continue
+            segment = {"index": index, "text": sentence, "audio_url": f"{BASE_URL}/audio/{session_id}/{filename}"}
+            audio_segments.append(segment)
+            yield sse_event("audio", segment)
+
+    try:
+        if lookup.hit:
+            replies = [("response", lookup.entry.response)]
+        else:
+            replies = stream_ganesh_response(text, history)
+
+        for kind, payload in replies:
+            if kind == "token":
+                streamed = True
+                parser.feed(payload)
+                # Clients get decoded text, not fragments of the JSON the model is writing.
+                decoded = parser.spoken_text()
+                if len(decoded) > len(spoken):
+                    answer, _ = parser.value("answer")
+                    yield sse_event("token", {"text": decoded[len(spoken):], "answer": answer or ""})
+                    spoken = decoded
+                if speak_response:
+                    synthesize_sentences(splitter.feed(decoded), parser.lang())
+                    yield from ready_audio()
+                continue
+
+            ganesha_response = payload
+            response_cache.store(lookup, text, ganesha_response)
+            session_store.append_turn(session_id, text, ganesha_response.to_dict())
+
+            if speak_response:
+                if streamed:
+                    res = ganesha_response.blessing_open + ganesha_response.answer + ganesha_response.blessing_close
+                    synthesize_sentences(unspoken_sentences(res), ganesha_response.lang)
+                    yield from ready_audio(wait=True)
+                else:
+                    # Cached and canned responses never stream tokens; they are spoken as one segment.
+                    filename = f"{response_id}_0{AUDIO_EXTENSION}"
+                    res = ganesha_response.blessing_open + ganesha_response.answer + ganesha_response.blessing_close
+                    data = response_cache.cached_audio(lookup)
+                    if data is None:
+                        if admission.tts.wait_for_slot():
+                            try:
+                                data = synthesize(res, ganesha_response.lang)
+                            finally:
+                                admission.tts.release()
+                            response_cache.attach_audio(lookup, data)
+                        else:
+                            skip_audio()
+                    if save_audio(session_id, paths, filename, data):
+                        segment = {"index": 0, "text": res, "audio_url": f"{BASE_URL}/audio/{session_id}/{filename}"}
+                        audio_segments.append(segment)
+                        yield sse_event("audio", segment)
+
+            yield sse_event("response", {
+                "id": response_id,
+                "transcription": transcription,
+                "ganesha_response": ganesha_response.to_dict(),
+                "audio_url": None,
+                "audio_segments": audio_segments,
+                "degraded": g.get("degraded", [])
+            })
+    except Exception as e:
+        log.exception("Streaming reply failed")
+        yield sse_event("error", {"error": "An unexpected server error occurred.", "details": str(e)})
+
+def stream_response(generator):
+    g.streaming = True
+    return Response(stream_with_context(generator), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def start_streamed_reply(session_id, text, history, paths, speak_response, response_id, transcription):
+    """
+    Admits a streaming reply before its 200 goes out: the LLM slot is taken here and held
+    until the stream closes, so a saturated stage still gets a proper 503.
+    """
+    lookup = await asyncio.to_thread(response_cache.lookup, text, history)
+    holds_llm = False
+    if not lookup.hit:
+        holds_llm = await admission.llm.aacquire()
+        if not holds_llm:
+            lookup = await asyncio.to_thread(degraded_lookup, text, history)
+            mark_degraded("cached_answer")
+    if speak_response and admission.tts.saturated():
+        speak_response = False
+        mark_degraded("tts_skipped")
+    generator = stream_ganesha_reply(session_id, text, history, paths, speak_response, response_id, transcription, lookup)
+    if not holds_llm:
+        return stream_response(generator)
+    # Freed after the last event, or on close if the client goes away first.
+    release = admission.llm.releaser()
+
+    def holding_llm_slot():
+        try:
+            yield from generator
+        finally:
+            release()
+
+    response = stream_response(holding_llm_slot())
+    response.call_on_close(release)
+    return response
+
 @app.route("/transcribe", methods=["POST"])
-def transcribe():
+async def transcribe():
     try:
         session_id = request.form.get("session_id")
         if not session_id or "audio" not in request.files:
             return jsonify({"error": "session_id and audio file are required"}), 400
 
         paths = get_session_paths(session_id)
-        history = chat_histories.get(session_id, [])
+        history = await asyncio.to_thread(session_store.get_history, session_id)
 
-        audio_file = request.files["audio"]
         file_id = str(uuid.uuid4())
-        input_path = os.path.join(paths["uploads"], f"{file_id}.webm")
-        audio_file.save(input_path)
+        audio_bytes = request.files["audio"].read()
 
-        # Convert to WAV format for the Gemini API
-        wav_path = os.path.join(paths["converted"], f"{file_id}.wav")
-        convert_cmd = ["ffmpeg", "-y", "-i", input_path, "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", wav_path]
-        subprocess.run(convert_cmd, check=True, capture_output=True, text=True)
+        # Decode to 16 kHz mono PCM in memory (ffmpeg over pipes only for formats we can't decode natively)
+        with stage("conversion"):
+            wav = pcm_to_wav(await adecode_to_pcm(audio_bytes))
 
         # --- Transcription via Gemini API ---
-        text = transcribe_audio_gemini(wav_path)
-        
-        output_audio_path = os.path.join(paths["audio_out"], "output.wav")
+        async with admission.stt.slot():
+            text = await atranscribe_audio_gemini(wav)
+
+        if text and is_truthy(request.form.get("stream", False)):
+            log.debug("[%s] Transcribed: %s (streaming)", session_id, text)
+            return await start_streamed_reply(session_id, text, history, paths, True, file_id, text)
 
         if not text:
-            ganesha_response = GaneshResponse(
-                lang='en', blessing_open='',
-                answer='I am sorry, I could not hear anything in your message. Please speak clearly.',
-                blessing_close='', refusal=True, refusal_reason='Empty transcription'
-            )
-            speak(ganesha_response.answer, ganesha_response.lang, output_audio_path)
+            ganesha_response, lookup = empty_transcription_response(), None
+            res = ganesha_response.answer
         else:
-            print(f"[{session_id}] Transcribed: {text}")
-            ganesha_response = get_ganesh_response(text, history)
-            history.append({"role": "user", "content": text})
-            history.append({"role": "ganesha", "content": ganesha_response.to_dict()})
-            chat_histories[session_id] = history
+            log.debug("[%s] Transcribed: %s", session_id, text)
+            ganesha_response, lookup = await answer_question(text, history)
+            await asyncio.to_thread(session_store.append_turn, session_id, text, ganesha_response.to_dict())
             
             res = ganesha_response.blessing_open + ganesha_response.answer + ganesha_response.blessing_close
-            speak(res, ganesha_response.lang, output_audio_path)
+
+        deferred = is_truthy(request.form.get("defer_audio", TTS_JOB_MODE == "background"))
+        audio_url, audio_job = await deliver_audio(lookup, res, ganesha_response.lang, session_id, paths,
+                                                   file_id, deferred, PRIORITY_VOICE)
 
         return jsonify({
             "id": file_id,
             "transcription": text,
             "ganesha_response": ganesha_response.to_dict(),
             # --- FIX: Use the full, absolute URL for audio playback ---
-            "audio_url": f"{BASE_URL}/audio/{session_id}/output.wav"
+            "audio_url": audio_url,
+            "audio_job": audio_job,
+            "degraded": g.get("degraded", [])
         })
 
+    except Saturated as e:
+        return overloaded_response(503, str(e), e.retry_after)
     except subprocess.CalledProcessError as e:
+        log.error("ffmpeg failed: %s", e.stderr)
         return jsonify({"error": "A subprocess (ffmpeg) failed.", "details": e.stderr}), 500
     except Exception as e:
+        log.exception("/transcribe failed")
         return jsonify({"error": "An unexpected server error occurred.", "details": str(e)}), 500
 
 @app.route('/audio/<session_id>/<filename>')
 def serve_audio(session_id, filename):
-    session_audio_path = os.path.join(SESSIONS_DIR, session_id, "audio_out")
-    return send_from_directory(session_audio_path, filename)
+    # Range requests (seeking, Safari's probing) and If-None-Match revalidation are handled by send_file.
+    mimetype = AUDIO_MIMETYPES.get(os.path.splitext(filename)[1], "application/octet-stream")
+    response = None
+    if audio_output_store is not None:
+        data = audio_output_store.get(session_id, filename)
+        if data is not None:
+            # The name is unique per reply and the contents never change, so it doubles as the ETag.
+            response = send_file(io.BytesIO(data), mimetype=mimetype, etag=f"{session_id}-{filename}",
+                                 max_age=AUDIO_MAX_AGE_SECONDS, conditional=True)
+    if response is None:
+        session_audio_path = os.path.join(SESSIONS_DIR, session_id, "audio_out")
+        response = send_from_directory(session_audio_path, filename, mimetype=mimetype, max_age=AUDIO_MAX_AGE_SECONDS)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/text-message', methods=['POST'])
-def process_text_message():
+async def process_text_message():
     try:
         data = request.get_json()
         session_id = data.get("session_id")
         text = data.get("message")
         # --- NEW: Get the speak_response flag from the frontend ---
         speak_response = data.get("speak_response", False)
+        # --- Streaming mode: Server-Sent Events instead of a single JSON body ---
+        stream = data.get("stream", False)
 
         if not session_id or not text:
             return jsonify({"error": "session_id and message are required"}), 400
 
         paths = get_session_paths(session_id)
-        history = chat_histories.get(session_id, [])
+        history = await asyncio.to_thread(session_store.get_history, session_id)
         
-        print(f"[{session_id}] Received text: '{text}' (Speak response: {speak_response})")
+        log.debug("[%s] Received text: '%s' (Speak response: %s)", session_id, text, speak_response)
+
+        if is_truthy(stream):
+            return await start_streamed_reply(session_id, text, history, paths, is_truthy(speak_response), str(uuid.uuid4()), text)
         
-        ganesha_response = get_ganesh_response(text, history)
-        history.append({"role": "user", "content": text})
-        history.append({"role": "ganesha", "content": ganesha_response.to_dict()})
-        chat_histories[session_id] = history
+        ganesha_response, lookup = await answer_question(text, history)
+        await asyncio.to_thread(session_store.append_turn, session_id, text, ganesha_response.to_dict())
 
-        audio_url = None
+        response_id = str(uuid.uuid4())
+        audio_url, audio_job = None, None
         # --- NEW: Conditionally generate audio based on the flag ---
         if speak_response:
-            output_audio_path = os.path.join(paths["audio_out"], "output.wav")
             res = ganesha_response.blessing_open + ganesha_response.answer + ganesha_response.blessing_close
-            speak(res, ganesha_response.lang, output_audio_path)
-            # --- FIX: Use the full, absolute URL for audio playback ---
-            audio_url = f"{BASE_URL}/audio/{session_id}/output.wav"
+            deferred = is_truthy(data.get("defer_audio", TTS_JOB_MODE == "background"))
+            audio_url, audio_job = await deliver_audio(lookup, res, ganesha_response.lang, session_id, paths,
+                                                       response_id, deferred, PRIORITY_TEXT)
 
         return jsonify({
-            "id": str(uuid.uuid4()),
+            "id": response_id,
             "transcription": text,
             "ganesha_response": ganesha_response.to_dict(),
-            "audio_url": audio_url
+            "audio_url": audio_url,
+            "audio_job": audio_job,
+            "degraded": g.get("degraded", [])
         })
 
+    except Saturated as e:
+        return overloaded_response(503, str(e), e.retry_after)
     except Exception as e:
+        log.exception("/text-message failed")
         return jsonify({"error": "An unexpected server error occurred.", "details": str(e)}), 500
 
+@app.route('/audio-jobs/<job_id>')
+def audio_job_status(job_id):
+    job = tts_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired audio job."}), 404
+    return jsonify(audio_job_view(job))
+
+@app.route('/audio-jobs/<job_id>/events')
+def audio_job_events(job_id):
+    """Server-Sent Events: one `audio` event when the job finishes (comments keep the connection alive until then)."""
+    if tts_jobs.get(job_id) is None:
+        return jsonify({"error": "Unknown or expired audio job."}), 404
+
+    def events():
+        job = tts_jobs.get(job_id)
+        deadline = time.monotonic() + AUDIO_JOB_SUBSCRIBE_SECONDS
+        while time.monotonic() < deadline:
+            job = tts_jobs.wait(job_id, timeout=min(15.0, max(0.0, deadline - time.monotonic())))
+            if job is None or job.finished:
+                break
+            yield ": waiting\n\n"
+        yield sse_event("audio", audio_job_view(job)) if job is not None else sse_event("error", {"error": "Audio job expired."})
+
+    return stream_response(events())
+
 if __name__ == "__main__":
+    start_worker()
     app.run(debug=True, port=5000)
 
@@ -0,0 +1,86 @@
+# Bytes on the wire and encoding cost per reply for each TTS_AUDIO_FORMAT (main/tts.py).
+#
+# Usage:
+#   python bench/audio_bandwidth.py [--wav reply1.wav reply2.wav ...] [--compression 0.5]
+# Without --wav, replies are synthesized as speech-like signals (harmonic voice with a pitch
+# contour, syllable-rate envelope and pauses) sized to the answers in bench/retrieval_eval.json
+# at ~14 characters per second. Real clips from the TTS model give the most faithful numbers;
+# any 16-bit mono WAV works (the files under tts_cache/ are such clips).
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+import numpy as np
+import soundfile as sf
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+EVAL_SET = os.path.join(PROJECT_ROOT, "bench", "retrieval_eval.json")
+CHARS_PER_SECOND = 14
+
+
+def speech_like(seconds, rate, seed):
+    """Voiced harmonics at 100-220 Hz, modulated at syllable rate, with word gaps and breath noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 160 + 40 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, 6)) + 15 * np.sin(2 * np.pi * 2.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = sum(np.sin(h * phase) / h for h in range(1, 12))
+    syllables = np.clip(np.sin(2 * np.pi * 4.5 * t + rng.uniform(0, 6)), 0, None) ** 0.7
+    words = (rng.random(int(seconds * 3) + 1) > 0.15).repeat(rate // 3 + 1)[:len(t)]
+    signal = 0.25 * voice * syllables * words + 0.004 * rng.standard_normal(len(t))
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+
+def load_clips(args, rate):
+    if args.wav:
+        clips = []
+        for path in args.wav:
+            samples, clip_rate = sf.read(path, dtype="int16")
+            clips.append((os.path.basename(path), samples if samples.ndim == 1 else samples[:, 0], clip_rate))
+        return clips
+    with open(EVAL_SET, encoding="utf-8") as f:
+        questions = [example["question"] for example in json.load(f)]
+    # Replies run 100-250 words; size them from the question index so the set is fixed.
+    lengths = [600 + (i * 97) % 900 for i in range(args.replies)]
+    return [(questions[i % len(questions)][:30], speech_like(chars / CHARS_PER_SECOND, rate, i), rate)
+            for i, chars in enumerate(lengths)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reply audio size per output format.")
+    parser.add_argument("--wav", nargs="*", help="real reply clips to encode instead of synthetic ones")
+    parser.add_argument("--replies", type=int, default=8, help="number of synthetic replies")
+    parser.add_argument("--compression", type=float, default=None, help="TTS_AUDIO_COMPRESSION to apply")
+    args = parser.parse_args()
+    if args.compression is not None:
+        os.environ["TTS_AUDIO_COMPRESSION"] = str(args.compression)
+
+    from main.tts import encode_audio, AUDIO_FORMATS, SAMPLE_RATE
+
+    clips = load_clips(args, SAMPLE_RATE)
+    seconds = sum(len(samples) / rate for _, samples, rate in clips)
+    print(f"{len(clips)} replies, {seconds:.0f} s of speech, mean {seconds / len(clips):.1f} s\n")
+    print(f"{'format':<6} {'KB/reply':>9} {'kbit/s':>7} {'vs wav':>7} {'encode ms/reply':>16}")
+
+    baseline = None
+    for name in AUDIO_FORMATS:
+        sizes, encode_ms = [], []
+        for _, samples, rate in clips:
+            start = time.perf_counter()
+            data = encode_audio(samples.tobytes(), name, rate)
+            encode_ms.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(data))
+        total = sum(sizes)
+        baseline = baseline or total
+        print(f"{name:<6} {statistics.mean(sizes) / 1024:9.1f} {total * 8 / 1000 / seconds:7.1f} "
+              f"{baseline / total:6.1f}x {statistics.mean(encode_ms):16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# Upstream Gemini calls made for a burst of identical requests, with and without the
+# single-flight groups (main/coalesce.py). Uses the stub models of bench/load_test.py,
+# counting every call they receive.
+#
+# Usage:
+#   python bench/coalescing.py [--burst 50] [--llm-ms 400] [--classify-ms 150] [--tts-ms 250]
+# Every request comes from a fresh session (no history) with the same question and asks for
+# spoken audio; the response and TTS caches are off so each one reaches Gemini.
+#
+# A call only coalesces with one already in flight, so requests that reach a stage after the
+# first flight has landed start another; "flights" counts them. Exits with status 1 unless,
+# with coalescing on, every upstream call was a flight's leader and every other request shared one.
+import os
+import sys
+import time
+import uuid
+import shutil
+import argparse
+import threading
+from collections import Counter
+
+# The burst shares one IP and would otherwise be rate limited or shed by admission control.
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "0")
+os.environ.setdefault("TTS_CACHE_BACKEND", "none")
+os.environ.setdefault("ROUTER_MODE", "llm")
+for name in ("RATE_LIMIT_SESSION_PER_MINUTE", "RATE_LIMIT_IP_PER_MINUTE",
+             "ADMISSION_STT_CONCURRENCY", "ADMISSION_LLM_CONCURRENCY", "ADMISSION_TTS_CONCURRENCY"):
+    os.environ.setdefault(name, "0")
+
+from load_test import StubModel, StubTTSModel, load_app, percentile, GANESHA_REPLY
+
+QUESTION = "Happy Ganesh Chaturthi! Please bless my family."
+
+
+class CountingModel(StubModel):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def _reply(self, contents, generation_config):
+        text, latency_ms = super()._reply(contents, generation_config)
+        with self.lock:
+            self.calls["classify" if text == "YES" else "answer"] += 1
+        return text, latency_ms
+
+
+class CountingTTSModel(StubTTSModel):
+    def __init__(self, latency_ms):
+        super().__init__(latency_ms)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, contents, **kwargs):
+        # Canned replies are pre-synthesized in the background at startup; only the burst's reply counts.
+        if GANESHA_REPLY["answer"] in contents:
+            with self.lock:
+                self.calls += 1
+        return super().generate_content(contents, **kwargs)
+
+
+def flight_counts():
+    """Leaders and followers per single-flight group, from the /metrics counter."""
+    from main.telemetry import COALESCED_CALLS
+    counts = Counter()
+    for metric in COALESCED_CALLS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_total"):
+                counts[sample.labels["group"], sample.labels["role"]] = sample.value
+    return counts
+
+
+def burst(app_module, size, session_ids):
+    """Fires size identical requests at the same instant; returns their latencies. Appends the sessions used to session_ids."""
+    barrier = threading.Barrier(size)
+    latencies, errors = [], []
+
+    def send():
+        client = app_module.app.test_client()
+        session_id = f"burst-{uuid.uuid4().hex[:8]}"
+        session_ids.append(session_id)
+        body = {"session_id": session_id, "message": QUESTION, "speak_response": True}
+        barrier.wait()
+        start = time.perf_counter()
+        response = client.post("/text-message", json=body)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200 or not response.json.get("audio_url"):
+            errors.append(response.status_code)
+
+    threads = [threading.Thread(target=send) for _ in range(size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count upstream calls for a burst of identical requests.")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--llm-ms", type=float, default=400.0)
+    parser.add_argument("--classify-ms", type=float, default=150.0)
+    parser.add_argument("--tts-ms", type=float, default=250.0)
+    args = parser.parse_args()
+    args.token_ms, args.stt_ms = 20.0, 0.0
+
+    app_module = load_app(args, [QUESTION])
+    import main.agent
+    import main.tts
+    groups = [main.agent.classifier_flights, main.agent.generation_flights, main.tts.tts_flights]
+
+    print(f"Burst of {args.burst} identical history-free /text-message requests with speech:\n")
+    print(f"{'coalescing':<11} {'upstream calls (flights)':^36} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    print(f"{'':<11} {'classifier':>12} {'answer':>11} {'tts':>11}")
+    failed = False
+    session_ids = []
+    for enabled in (False, True):
+        for group in groups:
+            group.enabled = enabled
+        model = main.agent.client = CountingModel(args.llm_ms, args.classify_ms, args.token_ms)
+        tts_model = main.tts.tts_model = CountingTTSModel(args.tts_ms)
+        before = flight_counts()
+        latencies, errors = burst(app_module, args.burst, session_ids)
+        after = flight_counts()
+
+        calls = {"classify": model.calls["classify"], "generate": model.calls["answer"], "tts": tts_model.calls}
+        cells = []
+        for group in groups:
+            leaders = after[group.name, "leader"] - before[group.name, "leader"]
+            followers = after[group.name, "follower"] - before[group.name, "follower"]
+            cells.append(f"{calls[group.name]:>5} ({int(leaders):>3})" if enabled else f"{calls[group.name]:>5}      ")
+            if enabled and (calls[group.name] != leaders or leaders + followers != args.burst):
+                failed = True
+        print(f"{'on' if enabled else 'off':<11} {cells[0]:>12} {cells[1]:>11} {cells[2]:>11} "
+              f"{percentile(latencies, 0.5) * 1000:8.1f} {percentile(latencies, 0.99) * 1000:8.1f} {len(errors):>7}")
+        failed = failed or bool(errors)
+
+    for session_id in session_ids:
+        shutil.rmtree(os.path.join(app_module.SESSIONS_DIR, session_id), ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Compares per-request decode latency and CPU of the in-process path (main/audio.py)
+# against the previous ffmpeg subprocess path (write upload, ffmpeg to a WAV file, read it back).
+#
+# Usage:
+#   python bench/decode_audio.py [--input recording.webm] [--runs 50]
+# Without --input a 5 s WebM/Opus clip is synthesized with PyAV.
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from main.audio import decode_native, decode_ffmpeg, av
+
+
+def synthesize_webm(seconds: float = 5.0, rate: int = 48000) -> bytes:
+    """A speech-band test tone in the container/codec browsers' MediaRecorder produces."""
+    import io
+    buffer = io.BytesIO()
+    t = np.arange(int(seconds * rate)) / rate
+    signal = (0.3 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 3 * t)) / 2).astype(np.float32)
+    with av.open(buffer, mode="w", format="webm") as container:
+        stream = container.add_stream("libopus", rate=rate)
+        stream.layout = "mono"
+        for start in range(0, len(signal), 960):
+            frame = av.AudioFrame.from_ndarray(signal[None, start:start + 960], format="flt", layout="mono")
+            frame.sample_rate = rate
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buffer.getvalue()
+
+
+def subprocess_path(data: bytes, workdir: str) -> bytes:
+    """The original /transcribe flow: two disk writes, a process spawn and a disk read."""
+    input_path = os.path.join(workdir, "upload.webm")
+    wav_path = os.path.join(workdir, "converted.wav")
+    with open(input_path, "wb") as f:
+        f.write(data)
+    subprocess.run(["ffmpeg", "-y", "-i", input_path, "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", wav_path],
+                   check=True, capture_output=True)
+    with open(wav_path, "rb") as f:
+        return f.read()
+
+
+def cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(name, fn, runs):
+    fn()  # warm-up
+    latencies = []
+    cpu_start = cpu_seconds()
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    cpu_ms = (cpu_seconds() - cpu_start) * 1000 / runs
+    latencies.sort()
+    print(f"{name:<22} p50 {latencies[len(latencies) // 2]:7.2f} ms   p95 {latencies[int(len(latencies) * 0.95) - 1]:7.2f} ms   cpu {cpu_ms:7.2f} ms/req")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio decoding for /transcribe.")
+    parser.add_argument("--input", help="an uploaded recording to decode (default: synthesized WebM/Opus)")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "rb") as f:
+            data = f.read()
+    elif av is not None:
+        data = synthesize_webm()
+    else:
+        sys.exit("PyAV is not installed; pass --input with a recording to benchmark.")
+    print(f"Input: {len(data)} bytes, {args.runs} runs\n")
+
+    measure("in-process (native)", lambda: decode_native(data), args.runs)
+    if shutil.which("ffmpeg"):
+        measure("ffmpeg over pipes", lambda: decode_ffmpeg(data), args.runs)
+        with tempfile.TemporaryDirectory() as workdir:
+            measure("ffmpeg subprocess+disk", lambda: subprocess_path(data, workdir), args.runs)
+    else:
+        print("ffmpeg not found on PATH; skipping the subprocess paths.")
+
+
+if __name__ == "__main__":
+    main()
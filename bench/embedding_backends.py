@@ -0,0 +1,181 @@
+# Speed, memory and retrieval parity of the embedding backends (EMBEDDING_BACKEND in
+# main/embedding.py): torch (sentence-transformers) versus the int8-quantized ONNX export on
+# onnxruntime (main/onnx_embeddings.py).
+#
+# Usage:
+#   python bench/embedding_backends.py [--backends torch onnx] [--rounds 5] [--k 1 3 5]
+#   ONNX_EMBEDDING_FILE=onnx/model.onnx python bench/embedding_backends.py --backends onnx   # fp32 export
+# The onnx backend needs the packages in requirements-onnx.txt.
+# Each backend runs in a fresh interpreter, so its memory is not mixed with the other's. Reports:
+#   load s         importing the runtime and loading the model
+#   query p50/p95  embed_query latency for single, uncached questions (what a request pays)
+#   docs/s         embed_documents throughput over the lore chunks (what embed.py pays)
+#   RSS MB         resident memory of the process after the workload, and its growth over a bare interpreter
+#
+# Parity is checked against the committed index (main/lore_index), whose vectors come from the
+# torch model: every lore chunk is embedded again and compared by cosine similarity, and the
+# hand-labeled questions of bench/retrieval_eval.json are searched twice, against the committed
+# index ("stored") and against one rebuilt from the backend's own vectors ("rebuilt", i.e. after
+# 'EMBEDDING_BACKEND=onnx python main/embed.py --reembed'). Exits with status 1 if a backend's chunk
+# vectors drift below --min-cosine or its recall@k on the stored index falls more than
+# --max-recall-drop below torch's (without torch installed, only the cosine check applies).
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from main.index import MmapIndex, normalize_rows
+from eval_retrieval import INDEX_DIR, EVAL_SET, is_match
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def probe(backend, rounds):
+    """Runs in the child process: loads one backend, times it and returns its vectors as JSON."""
+    baseline = rss_mb()
+    from main.embedding import load_embedding_model
+    index = MmapIndex(INDEX_DIR, None, reload_interval=0)
+    with open(EVAL_SET, encoding="utf-8") as f:
+        questions = [example["question"] for example in json.load(f)]
+    texts = [chunk.page_content for chunk in index.chunks]
+
+    start = time.perf_counter()
+    model = load_embedding_model(MODEL_NAME, backend)
+    model.embed_query("warm-up")  # the first forward pass allocates and, for onnx, builds the session
+    load_s = time.perf_counter() - start
+
+    latencies = []
+    for round_ in range(rounds):
+        for question in questions:
+            # Same shape as the search query agent.py builds; the suffix keeps every call uncached and distinct.
+            query = f"\n\nuser: {question}" + (f" ({round_})" if round_ else "")
+            start = time.perf_counter()
+            model.embed_query(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        chunk_vectors = model.embed_documents(texts)
+    docs_per_s = len(texts) * rounds / (time.perf_counter() - start)
+
+    query_vectors = [model.embed_query(f"\n\nuser: {question}") for question in questions]
+    latencies.sort()
+    return {"load_s": load_s, "p50_ms": statistics.median(latencies),
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1], "docs_per_s": docs_per_s,
+            "rss_mb": rss_mb(), "rss_growth_mb": rss_mb() - baseline,
+            "chunk_vectors": chunk_vectors, "query_vectors": query_vectors}
+
+
+def run_backend(backend, rounds):
+    env = dict(os.environ, EMBEDDING_BACKEND=backend)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--probe", backend, "--rounds", str(rounds)],
+                            cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"{backend}: unavailable ({result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'})")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def recall(matrix, query_vectors, chunks, examples, ks):
+    """recall@k and MRR of a brute-force cosine search, scored like bench/eval_retrieval.py."""
+    rankings = np.argsort(-(np.asarray(query_vectors, dtype=np.float32) @ matrix.T), axis=1)
+    found = {k: 0 for k in ks}
+    total = 0
+    reciprocal_ranks = []
+    for example, ranking in zip(examples, rankings):
+        docs = [chunks[i] for i in ranking[:max(ks)]]
+        first_hit = None
+        for label in example["relevant"]:
+            total += 1
+            rank = next((i for i, doc in enumerate(docs) if is_match(doc, label)), None)
+            for k in ks:
+                if rank is not None and rank < k:
+                    found[k] += 1
+            if rank is not None and (first_hit is None or rank < first_hit):
+                first_hit = rank
+        reciprocal_ranks.append(0.0 if first_hit is None else 1 / (first_hit + 1))
+    return {k: found[k] / total for k in ks}, statistics.mean(reciprocal_ranks), rankings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends for speed, memory and retrieval parity.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"], choices=["torch", "onnx"])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 3, 5])
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="lowest acceptable chunk cosine to the stored vectors")
+    parser.add_argument("--max-recall-drop", type=float, default=0.02, help="allowed recall@k loss versus the reference")
+    parser.add_argument("--probe", choices=["torch", "onnx"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(args.probe, args.rounds)))
+        return
+
+    index = MmapIndex(INDEX_DIR, None, reload_interval=0)
+    stored = np.asarray(index.vectors, dtype=np.float32)
+    with open(EVAL_SET, encoding="utf-8") as f:
+        examples = json.load(f)
+    print(f"{MODEL_NAME}: {len(examples)} queries x {args.rounds} rounds, {len(index.chunks)} chunks\n")
+
+    results = {backend: run_backend(backend, args.rounds) for backend in args.backends}
+    results = {backend: result for backend, result in results.items() if result}
+    if not results:
+        sys.exit(1)
+
+    print(f"{'backend':<8} {'load s':>7} {'query p50 ms':>13} {'p95 ms':>8} {'docs/s':>8} {'RSS MB':>8} {'(+ model)':>10}")
+    for backend, r in results.items():
+        print(f"{backend:<8} {r['load_s']:>7.2f} {r['p50_ms']:>13.2f} {r['p95_ms']:>8.2f} {r['docs_per_s']:>8.1f} "
+              f"{r['rss_mb']:>8.0f} {r['rss_growth_mb']:>10.0f}")
+
+    print(f"\n{'backend':<8} {'index':<8} {'cos mean':>9} {'cos min':>8}  " + "  ".join(f"R@{k:<3}" for k in args.k)
+          + "   MRR   top-k agreement")
+    scores = {}
+    for backend, r in results.items():
+        rebuilt = normalize_rows(np.asarray(r["chunk_vectors"], dtype=np.float32))
+        cosines = np.sum(rebuilt * stored, axis=1)
+        for name, matrix in (("stored", stored), ("rebuilt", rebuilt)):
+            recalls, mrr, rankings = recall(matrix, r["query_vectors"], index.chunks, examples, args.k)
+            scores[backend, name] = (recalls, rankings)
+            cos = f"{cosines.mean():>9.4f} {cosines.min():>8.4f}" if name == "stored" else f"{'':>9} {'':>8}"
+            agreement = ""
+            if backend != "torch" and ("torch", name) in scores:
+                depth = max(args.k)
+                reference = scores["torch", name][1][:, :depth]
+                agreement = f"{np.mean([len(set(a) & set(b)) / depth for a, b in zip(rankings[:, :depth], reference)]):.2f}"
+            print(f"{backend:<8} {name:<8} {cos}  " + "  ".join(f"{recalls[k]:.2f} " for k in args.k)
+                  + f"  {mrr:.2f}   {agreement}")
+
+    failed = False
+    for backend, r in results.items():
+        cosines = np.sum(normalize_rows(np.asarray(r["chunk_vectors"], dtype=np.float32)) * stored, axis=1)
+        if cosines.min() < args.min_cosine:
+            print(f"\n{backend}: chunk vectors drift from the stored index (min cosine {cosines.min():.4f} < {args.min_cosine})")
+            failed = True
+        if backend != "torch" and ("torch", "stored") in scores:
+            reference = scores["torch", "stored"][0]
+            drops = {k: reference[k] - scores[backend, "stored"][0][k] for k in args.k}
+            if max(drops.values()) > args.max_recall_drop:
+                print(f"\n{backend}: recall below torch on the stored index ({drops})")
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
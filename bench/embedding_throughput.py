@@ -0,0 +1,109 @@
+# Throughput of the retrieval step (embed the query + top-k search) under concurrent clients,
+# with and without the EmbeddingService layer (main/embedding.py).
+#
+# Usage:
+#   python bench/embedding_throughput.py [--clients 50] [--requests 20] [--repeat-ratio 0.5]
+#   python bench/embedding_throughput.py --stub   # simulated model cost, no torch needed
+#   EMBEDDING_BACKEND=onnx python bench/embedding_throughput.py   # int8 ONNX model (main/onnx_embeddings.py)
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import statistics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from main.index import MmapIndex
+from main.embedding import EmbeddingService, EMBEDDING_BACKEND
+
+INDEX_DIR = os.path.join(PROJECT_ROOT, "main", "lore_index")
+QUESTIONS = [
+    "Why is your tusk broken?", "What is a modak?", "Why do you ride a mouse?",
+    "How did you get the elephant head?", "Who won the race around the world?",
+    "What do your big ears mean?", "How do I overcome obstacles at work?",
+    "Why are you worshipped first?", "What is Vighnatara?", "How is Ganesh Chaturthi celebrated?",
+]
+
+
+class StubEmbeddings:
+    """Simulated CPU model: a fixed cost per forward pass plus a small cost per text (sleep releases the GIL)."""
+
+    def __init__(self, dim, call_ms=8.0, per_text_ms=0.6):
+        self.dim = dim
+        self.call_ms = call_ms
+        self.per_text_ms = per_text_ms
+        self._lock = threading.Lock()  # one forward pass at a time, like a saturated CPU
+
+    def _vector(self, text):
+        rng = random.Random(text)
+        return [rng.uniform(-1, 1) for _ in range(self.dim)]
+
+    def embed_documents(self, texts):
+        with self._lock:
+            time.sleep((self.call_ms + self.per_text_ms * len(texts)) / 1000)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def load_embeddings(stub, dim):
+    if stub:
+        return StubEmbeddings(dim)
+    from main.embedding import load_embedding_model
+    return load_embedding_model("all-MiniLM-L6-v2")
+
+
+def run(name, embeddings, clients, requests, repeat_ratio):
+    index = MmapIndex(INDEX_DIR, embeddings)
+    latencies = []
+    lock = threading.Lock()
+
+    def client(client_id):
+        rng = random.Random(client_id)
+        for i in range(requests):
+            question = rng.choice(QUESTIONS)
+            # Follow-up turns make most retrieval queries unique; the rest repeat popular questions.
+            if rng.random() > repeat_ratio:
+                question = f"{question} (session {client_id}, turn {i})"
+            start = time.perf_counter()
+            index.similarity_search(f"\n\nuser: {question}", k=3)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    extra = f"  {embeddings.stats()}" if isinstance(embeddings, EmbeddingService) else ""
+    print(f"{name:<24} {len(latencies) / elapsed:8.1f} q/s   p50 {statistics.median(latencies):7.1f} ms   "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:7.1f} ms{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval throughput under concurrency.")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="queries per client")
+    parser.add_argument("--repeat-ratio", type=float, default=0.5, help="share of queries that repeat a popular question")
+    parser.add_argument("--stub", action="store_true", help="use a simulated embedding model")
+    args = parser.parse_args()
+
+    index_dim = MmapIndex(INDEX_DIR, None).meta["dim"]
+    base = load_embeddings(args.stub, index_dim)
+    print(f"{args.clients} clients x {args.requests} queries, repeat ratio {args.repeat_ratio}, "
+          f"{'stub' if args.stub else 'all-MiniLM-L6-v2 (' + EMBEDDING_BACKEND + ')'} embeddings\n")
+    run("direct embed_query", base, args.clients, args.requests, args.repeat_ratio)
+    run("EmbeddingService", EmbeddingService(base), args.clients, args.requests, args.repeat_ratio)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Offline evaluation of retrieval quality and latency (main/retrieval.py) on a hand-labeled
+# query set drawn from main/lore.
+#
+# Usage:
+#   python bench/eval_retrieval.py [--modes vector bm25 hybrid] [--k 1 3 5]
+#   python bench/eval_retrieval.py --rerank-model cross-encoder/ms-marco-MiniLM-L-6-v2
+#
+# A label is a (source file, phrase) pair; it counts as retrieved when one of the top-k chunks
+# comes from that file and contains the phrase, so labels survive re-chunking.
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from main.index import MmapIndex
+from main.retrieval import HybridRetriever
+
+INDEX_DIR = os.path.join(PROJECT_ROOT, "main", "lore_index")
+EVAL_SET = os.path.join(PROJECT_ROOT, "bench", "retrieval_eval.json")
+
+
+def is_match(chunk, label):
+    return (os.path.basename(chunk.metadata.get("source", "")) == label["source"]
+            and label["contains"].lower() in chunk.page_content.lower())
+
+
+def evaluate(name, retriever, examples, ks):
+    depth = max(ks)
+    found = {k: 0 for k in ks}
+    total = 0
+    reciprocal_ranks = []
+    latencies = []
+    for example in examples:
+        # Same shape as the search query agent.py builds for a first turn.
+        query = f"\n\nuser: {example['question']}"
+        start = time.perf_counter()
+        docs = retriever.similarity_search(query, k=depth)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        first_hit = None
+        for label in example["relevant"]:
+            total += 1
+            rank = next((i for i, doc in enumerate(docs) if is_match(doc, label)), None)
+            for k in ks:
+                if rank is not None and rank < k:
+                    found[k] += 1
+            if rank is not None and (first_hit is None or rank < first_hit):
+                first_hit = rank
+        reciprocal_ranks.append(0.0 if first_hit is None else 1 / (first_hit + 1))
+
+    latencies.sort()
+    recalls = "  ".join(f"R@{k} {found[k] / total:.2f}" for k in ks)
+    print(f"{name:<16} {recalls}  MRR {statistics.mean(reciprocal_ranks):.2f}   "
+          f"p50 {statistics.median(latencies):6.2f} ms   p95 {latencies[int(len(latencies) * 0.95) - 1]:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval recall@k and latency.")
+    parser.add_argument("--modes", nargs="+", default=["vector", "bm25", "hybrid"])
+    parser.add_argument("--k", nargs="+", type=int, default=[1, 3, 5])
+    parser.add_argument("--rerank-model", default="", help="also evaluate hybrid + this cross-encoder")
+    parser.add_argument("--eval-set", default=EVAL_SET)
+    args = parser.parse_args()
+
+    with open(args.eval_set, encoding="utf-8") as f:
+        examples = json.load(f)
+
+    embeddings = None
+    if any(mode != "bm25" for mode in args.modes) or args.rerank_model:
+        # Unwrapped model, so query embeddings are not memoized across modes and latencies stay comparable.
+        from main.embedding import load_embedding_model
+        embeddings = load_embedding_model("all-MiniLM-L6-v2")
+    index = MmapIndex(INDEX_DIR, embeddings)
+    print(f"{len(examples)} queries, {sum(len(e['relevant']) for e in examples)} labels, {index.meta['count']} chunks\n")
+
+    for mode in args.modes:
+        retriever = HybridRetriever(index, mode=mode, rerank_model="")
+        retriever.similarity_search("warm-up", k=1)
+        evaluate(mode, retriever, examples, args.k)
+    if args.rerank_model:
+        retriever = HybridRetriever(index, mode="hybrid", rerank_model=args.rerank_model)
+        retriever.similarity_search("warm-up", k=1)
+        evaluate("hybrid+rerank", retriever, examples, args.k)
+
+
+if __name__ == "__main__":
+    main()
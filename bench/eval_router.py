@@ -0,0 +1,68 @@
+# Offline evaluation of the local intent router (main/router.py) against the LLM router.
+#
+# Usage:
+#   python bench/eval_router.py                # reference = live Gemini classifier (needs GENAI_API_KEY)
+#   python bench/eval_router.py --gold-labels  # reference = hand labels in bench/router_eval.json, no API calls
+import os
+import sys
+import json
+import time
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from main import agent
+
+EVAL_SET = os.path.join(PROJECT_ROOT, "bench", "router_eval.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local intent router.")
+    parser.add_argument("--gold-labels", action="store_true", help="compare against the hand labels instead of the LLM")
+    parser.add_argument("--eval-set", default=EVAL_SET)
+    args = parser.parse_args()
+
+    with open(args.eval_set, encoding="utf-8") as f:
+        examples = json.load(f)
+
+    use_llm = not args.gold_labels and agent.client is not None
+    if not args.gold_labels and not use_llm:
+        print("LLM client unavailable; falling back to the hand labels as reference.")
+
+    rows = []
+    for example in examples:
+        question = example["question"]
+        reference = agent._llm_classify(question) if use_llm else example["label"]
+
+        start = time.perf_counter()
+        local = agent.local_router.route(question)
+        forced = agent.local_router.route(question, always_decide=True)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / 2
+        rows.append((question, example["label"], reference, local, forced, elapsed_ms))
+
+    total = len(rows)
+    decided = [row for row in rows if row[3] is not None]
+    local_correct = sum(1 for row in decided if row[3] == row[2])
+    # Hybrid mode: confident local verdicts, the reference answer for the ambiguous rest.
+    hybrid_correct = local_correct + (total - len(decided))
+    forced_correct = sum(1 for row in rows if row[4] == row[2])
+
+    print("\n--- Disagreements ---")
+    for question, gold, reference, local, forced, _ in rows:
+        if (local is not None and local != reference) or forced != reference:
+            print(f"ref={reference} local={local or '-'} forced={forced} gold={gold}: {question}")
+
+    print("\n--- Local router evaluation ---")
+    print(f"Reference:                       {'LLM classifier' if use_llm else 'hand labels'}")
+    print(f"Questions:                       {total}")
+    print(f"Decided locally (calls saved):   {len(decided)}/{total} = {len(decided) / total:.1%}")
+    print(f"Accuracy of local decisions:     {local_correct}/{len(decided) or 1} = {local_correct / (len(decided) or 1):.1%}")
+    print(f"Hybrid accuracy vs reference:    {hybrid_correct}/{total} = {hybrid_correct / total:.1%}")
+    print(f"Local-only accuracy (no LLM):    {forced_correct}/{total} = {forced_correct / total:.1%}")
+    print(f"Mean local routing latency:      {sum(row[5] for row in rows) / total:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# Local stand-in for the Gemini REST API, for exercising main/llm.py (pooling, key
+# rotation, retries, circuit breaker) and the whole app without network access or quota.
+#
+# Usage:
+#   python bench/fake_gemini.py [--port 8765] [--latency-ms 200] [--fail-rate 0.1] [--quota-keys k2]
+#   GEMINI_BASE_URL=http://127.0.0.1:8765 GENAI_API_KEYS=k1,k2 python app.py
+#
+# Supports generateContent, streamGenerateContent (alt=sse), the resumable File API upload
+# and file deletion. Replies are chosen from the request: JSON mode gets a GaneshResponse,
+# audio input gets a transcript, TTS models get silent 24 kHz PCM and anything else "YES".
+import json
+import time
+import uuid
+import base64
+import random
+import socket
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+GANESHA_REPLY = {
+    "lang": "en", "blessing_open": "Om Gam Ganapataye Namah. ",
+    "answer": "My child, I broke my tusk to keep writing the Mahabharata without pause. "
+              "Knowledge is worth a sacrifice. Let nothing stop you from finishing what you begin.",
+    "blessing_close": " May your path be free of obstacles.", "refusal": False, "refusal_reason": "",
+}
+
+
+class FakeGemini:
+    """Behaviour knobs shared by all handler threads, plus counters for assertions."""
+
+    def __init__(self, latency_ms=0.0, token_delay_ms=0.0, fail_rate=0.0, quota_keys=(), valid_keys=None, seed=None):
+        self.latency_ms = latency_ms
+        self.token_delay_ms = token_delay_ms
+        self.fail_rate = fail_rate
+        self.quota_keys = set(quota_keys)
+        self.valid_keys = set(valid_keys) if valid_keys else None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.keys_seen = {}
+        self.files = {}
+
+    def count(self, kind, key):
+        with self.lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            self.keys_seen[key] = self.keys_seen.get(key, 0) + 1
+
+    def reply_for(self, model, body):
+        parts = [part for content in body.get("contents", []) for part in content.get("parts", [])]
+        config = body.get("generationConfig") or body.get("generation_config") or {}
+        if "tts" in model:
+            text = " ".join(part.get("text", "") for part in parts)
+            pcm = bytes(2 * 24000 * max(1, len(text) // 15) // 10)  # ~0.1 s of silence per 15 chars
+            return {"inlineData": {"mimeType": "audio/L16;codec=pcm;rate=24000", "data": base64.b64encode(pcm).decode()}}
+        if any("inline_data" in part or "inlineData" in part or "file_data" in part for part in parts):
+            return {"text": "Why is your tusk broken?"}
+        if (config.get("response_mime_type") or config.get("responseMimeType")) == "application/json" \
+                or "OUTPUT FORMAT" in " ".join(part.get("text", "") for part in parts):
+            return {"text": json.dumps(GANESHA_REPLY, ensure_ascii=False)}
+        return {"text": "YES"}
+
+
+def make_handler(fake: FakeGemini):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out in separate writes; without this, Nagle + delayed ACK add ~40 ms.
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload=None, headers=None):
+            data = json.dumps(payload or {}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return self.rfile.read(length) if length else b""
+
+        def _gate(self, kind):
+            """Latency, key checks and injected failures; returns False if the request was answered."""
+            key = self.headers.get("x-goog-api-key", "")
+            fake.count(kind, key)
+            if fake.latency_ms:
+                time.sleep(fake.latency_ms / 1000)
+            if fake.valid_keys is not None and key not in fake.valid_keys:
+                self._send(403, {"error": {"code": 403, "message": "API key not valid."}})
+                return False
+            if key in fake.quota_keys:
+                self._send(429, {"error": {"code": 429, "message": "Quota exceeded."}}, {"Retry-After": "1"})
+                return False
+            if fake.fail_rate and fake.rng.random() < fake.fail_rate:
+                self._send(503, {"error": {"code": 503, "message": "The model is overloaded."}})
+                return False
+            return True
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            raw = self._body()
+            if url.path.startswith("/upload/"):
+                return self._upload(url, raw)
+            if url.path.startswith("/uploads/"):
+                return self._finalize(url, raw)
+            model, _, method = url.path.rsplit("/", 1)[-1].partition(":")
+            if not self._gate(method):
+                return
+            body = json.loads(raw or b"{}")
+            part = fake.reply_for(model, body)
+            if method == "generateContent":
+                return self._send(200, {"candidates": [{"content": {"role": "model", "parts": [part]}}]})
+            if method == "streamGenerateContent" and parse_qs(url.query).get("alt") == ["sse"]:
+                return self._stream(part)
+            self._send(404, {"error": {"code": 404, "message": f"Unknown method {method}"}})
+
+        def _stream(self, part):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            text = part.get("text")
+            pieces = [text[i:i + 12] for i in range(0, len(text), 12)] if text else [None]
+            for piece in pieces:
+                if fake.token_delay_ms:
+                    time.sleep(fake.token_delay_ms / 1000)
+                chunk_part = {"text": piece} if piece is not None else part
+                event = f"data: {json.dumps({'candidates': [{'content': {'parts': [chunk_part]}}]})}\r\n\r\n".encode()
+                self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _upload(self, url, raw):
+            if not self._gate("upload"):
+                return
+            upload_id = uuid.uuid4().hex
+            mime_type = self.headers.get("X-Goog-Upload-Header-Content-Type", "application/octet-stream")
+            with fake.lock:
+                fake.files[upload_id] = {"mimeType": mime_type, "pending": True}
+            host = self.headers.get("Host")
+            self._send(200, {}, {"X-Goog-Upload-URL": f"http://{host}/uploads/{upload_id}"})
+
+        def _finalize(self, url, raw):
+            upload_id = url.path.rsplit("/", 1)[-1]
+            with fake.lock:
+                info = fake.files.get(upload_id)
+                if info is None:
+                    return self._send(404, {"error": {"code": 404, "message": "Unknown upload"}})
+                name = f"files/{upload_id}"
+                info.update(pending=False, size=len(raw), name=name)
+            host = self.headers.get("Host")
+            self._send(200, {"file": {"name": name, "uri": f"http://{host}/v1beta/{name}", "mimeType": info["mimeType"]}})
+
+        def do_DELETE(self):
+            if not self._gate("delete"):
+                return
+            upload_id = urlparse(self.path).path.rsplit("/", 1)[-1]
+            with fake.lock:
+                found = fake.files.pop(upload_id, None)
+            self._send(200 if found else 404, {})
+
+    return Handler
+
+
+def start_server(port: int = 0, **options):
+    """Starts the fake in a daemon thread; returns (server, fake, base_url). Use server.shutdown() to stop."""
+    fake = FakeGemini(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server, fake, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Gemini REST endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before every response")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="delay between streamed chunks")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of calls answered with 503")
+    parser.add_argument("--quota-keys", nargs="*", default=[], help="keys that always get 429")
+    args = parser.parse_args()
+
+    server, _, base_url = start_server(args.port, latency_ms=args.latency_ms, token_delay_ms=args.token_delay_ms,
+                                       fail_rate=args.fail_rate, quota_keys=args.quota_keys)
+    print(f"Fake Gemini listening on {base_url} (GEMINI_BASE_URL={base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# Closed-loop load test of the Flask app, run in-process with deterministic stand-ins for
+# every Gemini call, so throughput and latency of the serving path can be measured locally
+# without quota. Embeddings, retrieval, the caches, prompt building, parsing, audio decode
+# and WAV encoding all run for real; only the network round trips are replaced by sleeps.
+#
+# Usage:
+#   python bench/load_test.py [--endpoints text stream transcribe] [--concurrency 1 4 16]
+#                             [--requests 200] [--llm-ms 400] [--token-ms 20] [--classify-ms 150]
+#                             [--stt-ms 300] [--tts-ms 250] [--speak] [--no-response-cache]
+#
+# Stubs: the answer/classifier model handle (main.agent.client), the STT backend
+# (main.stt.set_backend) and the TTS model handle (main.tts.tts_model). speak() itself is
+# no longer on the request path, so TTS is stubbed one level lower and the audio cache
+# and WAV encoding stay in the measurement.
+#
+# "Memory per worker" is this process's RSS: the whole app runs in it, exactly as in one
+# gunicorn worker.
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import argparse
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+# Must be set before the app is imported: nothing left on disk between runs, quiet logs.
+os.environ.setdefault("SESSION_STORE", "memory")
+os.environ.setdefault("TTS_CACHE_BACKEND", "memory")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# Every simulated client shares one IP and a few sessions; the rate limits would shed most of the run.
+os.environ.setdefault("RATE_LIMIT_SESSION_PER_MINUTE", "0")
+os.environ.setdefault("RATE_LIMIT_IP_PER_MINUTE", "0")
+
+EVAL_SET = os.path.join(PROJECT_ROOT, "bench", "retrieval_eval.json")
+GANESHA_REPLY = {
+    "lang": "en", "blessing_open": "Om Gam Ganapataye Namah. ",
+    "answer": "My child, I broke my tusk to keep writing the Mahabharata without pause. "
+              "Knowledge is worth a sacrifice. Let nothing stop you from finishing what you begin.",
+    "blessing_close": " May your path be free of obstacles.", "refusal": False, "refusal_reason": "",
+}
+
+
+# --- Deterministic stand-ins for the Gemini calls ---
+class StubResponse:
+    def __init__(self, text="", audio=b""):
+        self.text = text
+        self.audio = audio
+
+
+class StubModel:
+    """Replaces a GenerativeModel handle (main/llm.py): fixed latency, canned replies."""
+
+    def __init__(self, answer_ms, classify_ms, token_ms):
+        self.answer_ms = answer_ms
+        self.classify_ms = classify_ms
+        self.token_ms = token_ms
+
+    def _reply(self, contents, generation_config):
+        prompt = contents if isinstance(contents, str) else " ".join(str(part) for part in contents)
+        if generation_config or "OUTPUT FORMAT" in prompt:
+            return json.dumps(GANESHA_REPLY), self.answer_ms
+        return "YES", self.classify_ms
+
+    def _stream(self, text):
+        for i in range(0, len(text), 12):
+            time.sleep(self.token_ms / 1000)
+            yield StubResponse(text[i:i + 12])
+
+    def generate_content(self, contents, generation_config=None, stream=False, **kwargs):
+        text, latency_ms = self._reply(contents, generation_config)
+        if stream:
+            time.sleep(max(0.0, latency_ms - self.token_ms * (len(text) // 12 + 1)) / 1000)
+            return self._stream(text)
+        time.sleep(latency_ms / 1000)
+        return StubResponse(text)
+
+    async def generate_content_async(self, contents, generation_config=None, **kwargs):
+        text, latency_ms = self._reply(contents, generation_config)
+        await asyncio.sleep(latency_ms / 1000)
+        return StubResponse(text)
+
+
+class StubTTSModel:
+    """Returns silent 24 kHz PCM, ~0.1 s per 15 characters, like the real model's output size."""
+
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        return StubResponse(audio=bytes(2 * 24000 * max(1, len(contents) // 15) // 10))
+
+
+def make_stt_backend(latency_ms, questions):
+    from main.stt import STTBackend
+
+    class StubSTT(STTBackend):
+        """Maps each clip to an eval question by its length, so the same upload always gets the same text."""
+
+        def transcribe(self, audio, mime_type="audio/wav"):
+            time.sleep(latency_ms / 1000)
+            return questions[len(audio) % len(questions)]
+
+        async def atranscribe(self, audio, mime_type="audio/wav"):
+            await asyncio.sleep(latency_ms / 1000)
+            return questions[len(audio) % len(questions)]
+
+    return StubSTT()
+
+
+def load_app(args, questions):
+    """Imports the app with every Gemini call stubbed; patched before import where startup already calls out."""
+    import main.tts
+    main.tts.tts_model = StubTTSModel(args.tts_ms)
+    import main.agent
+    main.agent.client = StubModel(args.llm_ms, args.classify_ms, args.token_ms)
+    import main.stt
+    main.stt.set_backend(make_stt_backend(args.stt_ms, questions))
+    import app
+    return app
+
+
+# --- Measurement ---
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def stage_totals():
+    """(sum, count) per pipeline stage from the /metrics histogram (main/telemetry.py)."""
+    from main.telemetry import STAGE_SECONDS
+    totals = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, [0.0, 0])[0] = sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, [0.0, 0])[1] = sample.value
+    return totals
+
+
+class Workload:
+    """Builds one request per call for an endpoint; sessions are reused so history grows as in real use."""
+
+    def __init__(self, endpoint, questions, speak, sessions=32):
+        self.endpoint = endpoint
+        self.questions = questions
+        self.speak = speak
+        self.session_ids = [f"bench-{uuid.uuid4().hex[:8]}" for _ in range(sessions)]
+        self.counter = 0
+        self.lock = threading.Lock()
+        if endpoint == "transcribe":
+            from main.audio import pcm_to_wav
+            # 1-3 s clips of silence; their lengths pick the stub transcript.
+            self.clips = [pcm_to_wav(bytes(2 * 16000 * (10 + i) // 10)) for i in range(0, 20, 3)]
+
+    def next(self):
+        with self.lock:
+            n = self.counter
+            self.counter += 1
+        session_id = self.session_ids[n % len(self.session_ids)]
+        if self.endpoint == "transcribe":
+            clip = self.clips[n % len(self.clips)]
+            return "/transcribe", {"data": {"session_id": session_id, "audio": (io.BytesIO(clip), "clip.wav")}}
+        body = {"session_id": session_id, "message": self.questions[n % len(self.questions)],
+                "speak_response": self.speak, "stream": self.endpoint == "stream"}
+        return "/text-message", {"json": body}
+
+
+def run_level(app_module, workload, concurrency, total):
+    from main.lifecycle import disk_usage
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(count):
+        nonlocal errors
+        client = app_module.app.test_client()
+        for _ in range(count):
+            path, kwargs = workload.next()
+            start = time.perf_counter()
+            response = client.post(path, **kwargs)
+            body = response.get_data()  # drains SSE streams to the last event
+            elapsed = time.perf_counter() - start
+            failed = response.status_code != 200 or b'"error"' in body
+            with lock:
+                latencies.append(elapsed)
+                errors += failed
+
+    shares = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    before = stage_totals()
+    disk_before = disk_usage(app_module.SESSIONS_DIR)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, shares))
+    wall = time.perf_counter() - started
+    after = stage_totals()
+    disk_after = disk_usage(app_module.SESSIONS_DIR)
+
+    latencies.sort()
+    ms = lambda seconds: seconds * 1000
+    print(f"  c={concurrency:<3d} n={len(latencies):<5d} rps {len(latencies) / wall:7.1f}   "
+          f"p50 {ms(percentile(latencies, 0.50)):7.1f}  p95 {ms(percentile(latencies, 0.95)):7.1f}  "
+          f"p99 {ms(percentile(latencies, 0.99)):7.1f} ms   errors {errors}   rss {rss_mb():6.1f} MB")
+    stages = []
+    for stage, (seconds, count) in after.items():
+        prior_seconds, prior_count = before.get(stage, (0.0, 0))
+        if count > prior_count:
+            stages.append(f"{stage} {ms((seconds - prior_seconds) / (count - prior_count)):.1f}")
+    print(f"        mean ms per stage call: {', '.join(stages)}")
+    # Per-reply audio and uploads land in SESSIONS_DIR; the sweeper and cleanup should keep this flat.
+    print(f"        {os.path.basename(app_module.SESSIONS_DIR)}/: {disk_after[0] / 1024:.0f} KB in {disk_after[1]} inodes "
+          f"({(disk_after[0] - disk_before[0]) / 1024:+.0f} KB, {disk_after[1] - disk_before[1]:+d} inodes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test with stubbed Gemini calls.")
+    parser.add_argument("--endpoints", nargs="+", default=["text", "stream", "transcribe"],
+                        choices=["text", "stream", "transcribe"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--llm-ms", type=float, default=400.0, help="answer generation latency")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="delay between streamed chunks")
+    parser.add_argument("--classify-ms", type=float, default=150.0, help="LLM classifier latency")
+    parser.add_argument("--stt-ms", type=float, default=300.0, help="transcription latency")
+    parser.add_argument("--tts-ms", type=float, default=250.0, help="speech synthesis latency per clip")
+    parser.add_argument("--speak", action="store_true", help="request spoken replies on /text-message")
+    parser.add_argument("--no-response-cache", action="store_true", help="disable the semantic response cache")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests before each endpoint")
+    args = parser.parse_args()
+
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    with open(EVAL_SET, encoding="utf-8") as f:
+        questions = [example["question"] for example in json.load(f)]
+
+    baseline = rss_mb()
+    started = time.perf_counter()
+    app_module = load_app(args, questions)
+    print(f"App loaded in {time.perf_counter() - started:.1f} s, RSS {baseline:.0f} -> {rss_mb():.0f} MB")
+    print(f"Stub latency: answer {args.llm_ms:g} ms, classifier {args.classify_ms:g} ms, "
+          f"STT {args.stt_ms:g} ms, TTS {args.tts_ms:g} ms, {args.token_ms:g} ms per streamed chunk\n")
+
+    workloads = []
+    for endpoint in args.endpoints:
+        workload = Workload(endpoint, questions, args.speak)
+        workloads.append(workload)
+        warm = app_module.app.test_client()
+        for _ in range(args.warmup):
+            path, kwargs = workload.next()
+            warm.post(path, **kwargs).get_data()
+        print(f"{endpoint}:")
+        for concurrency in args.concurrency:
+            run_level(app_module, workload, concurrency, args.requests)
+        print()
+    print(f"Peak RSS per worker: {peak_rss_mb():.0f} MB")
+
+    for workload in workloads:
+        for session_id in workload.session_ids:
+            shutil.rmtree(os.path.join(app_module.SESSIONS_DIR, session_id), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Prompt size and (stubbed) generation latency of the token-budgeted prompt builder
+# (main/prompt_builder.py) against the previous rendering, which pasted the full
+# GaneshResponse dict of the last six messages into both the search query and the prompt.
+#
+# Usage:
+#   python bench/prompt_size.py [--conversations 10] [--turns 8] [--base-ms 40] [--ms-per-1k-tokens 60]
+# Retrieval uses BM25 only and the model is a stub whose latency grows with prompt size,
+# so no embeddings model or API key is needed.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from main.index import MmapIndex
+from main.prompt import prompt as main_prompt
+from main.retrieval import HybridRetriever
+from main.prompt_builder import PromptBuilder, estimate_tokens
+
+INDEX_DIR = os.path.join(PROJECT_ROOT, "main", "lore_index")
+EVAL_SET = os.path.join(PROJECT_ROOT, "bench", "retrieval_eval.json")
+
+
+class StubModel:
+    """Stand-in for generate_content: a fixed cost plus a prefill cost proportional to prompt tokens."""
+
+    def __init__(self, base_ms, ms_per_1k_tokens):
+        self.base_ms = base_ms
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+
+    def generate_content(self, prompt):
+        time.sleep((self.base_ms + self.ms_per_1k_tokens * estimate_tokens(prompt) / 1000) / 1000)
+
+
+def legacy_prompt(retriever, user_input, history):
+    """The rendering agent.py used before the prompt builder."""
+    recent_history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history[-4:]])
+    docs = retriever.similarity_search(f"{recent_history_text}\n\nuser: {user_input}", k=3)
+    formatted_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history[-6:]])
+    return main_prompt.format(context="\n\n".join(doc.page_content for doc in docs),
+                              history=formatted_history, question=user_input)
+
+
+def builder_prompt(builder, retriever, user_input, history):
+    docs = retriever.similarity_search(builder.search_query(user_input, history), k=3)
+    return builder.build(user_input, history, docs).prompt
+
+
+def fake_answer(rng, chunks):
+    """A stored ganesha turn of realistic size: 100-250 words of lore wrapped in the response dict."""
+    words = " ".join(chunk.page_content for chunk in rng.sample(chunks, 2)).split()
+    return {"lang": "en", "blessing_open": "Om Gan Ganapataye Namah, my dear child.",
+            "answer": " ".join(words[:rng.randint(100, 250)]),
+            "blessing_close": "May your path be free of obstacles.", "refusal": False, "refusal_reason": ""}
+
+
+def run(name, render, model, conversations):
+    sizes, build_ms, generate_ms = [], [], []
+    for turns in conversations:
+        history = []
+        for question, answer in turns:
+            start = time.perf_counter()
+            prompt = render(question, history)
+            built = time.perf_counter()
+            model.generate_content(prompt)
+            done = time.perf_counter()
+            sizes.append(estimate_tokens(prompt))
+            build_ms.append((built - start) * 1000)
+            generate_ms.append((done - built) * 1000)
+            history = history + [{"role": "user", "content": question}, {"role": "ganesha", "content": answer}]
+    print(f"{name:<16} prompt tokens mean {statistics.mean(sizes):7.0f}  max {max(sizes):6d}   "
+          f"build p50 {statistics.median(build_ms):5.2f} ms   stub generation mean {statistics.mean(generate_ms):6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt sizes before/after the prompt builder.")
+    parser.add_argument("--conversations", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=8, help="questions per conversation")
+    parser.add_argument("--base-ms", type=float, default=40.0, help="stub model fixed latency")
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=60.0, help="stub model prefill latency")
+    args = parser.parse_args()
+
+    with open(EVAL_SET, encoding="utf-8") as f:
+        questions = [example["question"] for example in json.load(f)]
+    retriever = HybridRetriever(MmapIndex(INDEX_DIR, None), mode="bm25")
+    chunks = retriever.vector_store.chunks
+    rng = random.Random(7)
+    conversations = [[(rng.choice(questions), fake_answer(rng, chunks)) for _ in range(args.turns)]
+                     for _ in range(args.conversations)]
+
+    model = StubModel(args.base_ms, args.ms_per_1k_tokens)
+    builder = PromptBuilder()
+    print(f"{args.conversations} conversations x {args.turns} turns, budget {builder.budget} tokens\n")
+    run("legacy", lambda q, h: legacy_prompt(retriever, q, h), model, conversations)
+    run("prompt builder", lambda q, h: builder_prompt(builder, retriever, q, h), model, conversations)
+
+
+if __name__ == "__main__":
+    main()
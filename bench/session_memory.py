@@ -0,0 +1,69 @@
+# Measures the footprint of idle sessions in each session store backend (main/sessions.py).
+#
+# Usage:
+#   python bench/session_memory.py [--sessions 5000] [--turns 10] [--redis-url redis://localhost:6379/15]
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from main.sessions import MemorySessionStore, SQLiteSessionStore, RedisSessionStore
+
+USER_TEXT = "Why is your tusk broken, and what does it teach us?"
+GANESHA_CONTENT = {
+    "lang": "en",
+    "blessing_open": "Om Gam Ganapataye Namaha, my dear child.",
+    "answer": "I broke my tusk to keep writing the Mahabharata for Sage Vyasa without pause. " * 4,
+    "blessing_close": "May your efforts never be interrupted.",
+    "refusal": False,
+    "refusal_reason": "",
+}
+
+
+def fill(store, sessions, turns):
+    start = time.perf_counter()
+    for i in range(sessions):
+        for _ in range(turns):
+            store.append_turn(f"bench-{i}", USER_TEXT, GANESHA_CONTENT)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per idle session.")
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--turns", type=int, default=10, help="turns per session (only the cap is retained)")
+    parser.add_argument("--redis-url", default=None, help="also measure a Redis-compatible server")
+    args = parser.parse_args()
+    writes = args.sessions * args.turns
+
+    tracemalloc.start()
+    store = MemorySessionStore(max_sessions=args.sessions)
+    baseline = tracemalloc.get_traced_memory()[0]
+    elapsed = fill(store, args.sessions, args.turns)
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    print(f"memory: {used / args.sessions:.0f} B/session traced, {writes / elapsed:.0f} appends/s, {store.stats()}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteSessionStore(path=os.path.join(tmp, "sessions.sqlite3"))
+        elapsed = fill(store, args.sessions, args.turns)
+        stats = store.stats()
+        print(f"sqlite: {stats['file_bytes'] / args.sessions:.0f} B/session on disk, {writes / elapsed:.0f} appends/s, {stats}")
+
+    if args.redis_url:
+        store = RedisSessionStore(url=args.redis_url, prefix="bench:session:")
+        elapsed = fill(store, args.sessions, args.turns)
+        stats = store.stats()
+        print(f"redis:  {stats['payload_bytes'] / args.sessions:.0f} B/session payload, {writes / elapsed:.0f} appends/s, {stats}")
+        for key in store.client.scan_iter(match="bench:session:*"):
+            store.client.delete(key)
+
+
+if __name__ == "__main__":
+    main()
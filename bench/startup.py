@@ -0,0 +1,68 @@
+# Worker cold-start benchmark: time to import main.agent (embeddings + retrieval store) and
+# serve the first retrieval, plus resident memory, for each retrieval backend.
+#
+# Usage:
+#   python bench/startup.py [--runs 3] [--backends chroma mmap]
+# Each run is a fresh interpreter, exactly like a newly forked gunicorn worker without preload.
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import os, sys, json, time, resource
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from main import agent
+agent.warm_up(run_inference=False)  # the model and store load lazily; this is what the gunicorn master preloads
+imported = time.perf_counter()
+agent.vector_db.similarity_search("Why is your tusk broken?", k=3)
+queried = time.perf_counter()
+
+def memory_kb(field, path="/proc/self/smaps_rollup"):
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+print(json.dumps({{
+    "import_s": imported - start,
+    "first_query_ms": (queried - imported) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "rss_mb": (memory_kb("Rss") or 0) / 1024,
+    "pss_mb": (memory_kb("Pss") or 0) / 1024,
+    "private_mb": ((memory_kb("Private_Clean") or 0) + (memory_kb("Private_Dirty") or 0)) / 1024,
+}}))
+"""
+
+
+def run_once(backend):
+    env = dict(os.environ, RETRIEVAL_BACKEND=backend)
+    result = subprocess.run([sys.executable, "-c", PROBE.format(root=PROJECT_ROOT)], env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker cold start per retrieval backend.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=["chroma", "mmap"])
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'import s':>9} {'1st query ms':>13} {'max RSS MB':>11} {'RSS MB':>8} {'PSS MB':>8} {'private MB':>11}")
+    for backend in args.backends:
+        runs = [run_once(backend) for _ in range(args.runs)]
+        median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        print(f"{backend:<8} {median['import_s']:>9.2f} {median['first_query_ms']:>13.1f} {median['max_rss_mb']:>11.0f} "
+              f"{median['rss_mb']:>8.0f} {median['pss_mb']:>8.0f} {median['private_mb']:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# Time to first request and total memory of a gunicorn deployment, with and without
+# preloading the models in the master (gunicorn.conf.py, GUNICORN_PRELOAD).
+#
+# Usage:
+#   python bench/warm_workers.py [--workers 4] [--runs 2] [--modes preload lazy]
+# Gemini is replaced by bench/fake_gemini.py, so only local startup work is measured: imports,
+# the embedding model and the retrieval index. For every mode it reports:
+#   first request  seconds from launching gunicorn to the first answered /text-message
+#   all ready      seconds until every worker has logged the end of its warm-up
+#   respawn ready  seconds from killing one worker until its replacement is ready
+#   RSS / PSS      summed over the master and the workers; PSS divides shared pages
+#                  between the processes that map them, so it is the honest total
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import statistics
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_gemini import start_server
+
+READY_MESSAGE = " ready after "
+
+
+def memory_mb(pid):
+    """(RSS, PSS) of one process in MB."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, _, rest = line.partition(":")
+                if field in ("Rss", "Pss"):
+                    values[field] = int(rest.split()[0]) / 1024
+    except OSError:
+        pass
+    return values.get("Rss", 0.0), values.get("Pss", 0.0)
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+class Deployment:
+    """One gunicorn master; follows the app's JSON log for per-worker readiness."""
+
+    def __init__(self, args, preload, gemini_url):
+        self.port = args.port
+        env = dict(os.environ, GUNICORN_PRELOAD="1" if preload else "0", GUNICORN_WORKERS=str(args.workers),
+                   GUNICORN_BIND=f"127.0.0.1:{args.port}", GEMINI_BASE_URL=gemini_url,
+                   GENAI_API_KEYS="bench-key", LOG_FORMAT="json", LOG_LEVEL="INFO", SESSION_STORE="memory",
+                   TTS_CACHE_BACKEND="memory")
+        # prometheus_client switches to multiprocess files whenever the variable is set, even if empty.
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        self.ready = {}  # pid -> time its warm-up finished
+        self.cond = threading.Condition()
+        self.started = time.perf_counter()
+        self.process = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                                        cwd=PROJECT_ROOT, env=env, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, text=True)
+        threading.Thread(target=self._follow_log, daemon=True).start()
+
+    def _follow_log(self):
+        for line in self.process.stdout:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if READY_MESSAGE in entry.get("msg", ""):
+                with self.cond:
+                    self.ready[int(entry["msg"].split()[1])] = time.perf_counter()
+                    self.cond.notify_all()
+
+    def wait_ready(self, count, timeout=600):
+        with self.cond:
+            if not self.cond.wait_for(lambda: len(self.ready) >= count, timeout):
+                raise TimeoutError(f"only {len(self.ready)} of {count} workers became ready")
+            return max(sorted(self.ready.values())[:count])
+
+    def first_request(self, timeout=600):
+        body = json.dumps({"session_id": "bench-warm", "message": "Why is your tusk broken?"}).encode()
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            request = urllib.request.Request(f"http://127.0.0.1:{self.port}/text-message", data=body,
+                                             headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    if response.status == 200:
+                        return time.perf_counter()
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.05)
+        raise TimeoutError("no answer from the server")
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        self.process.wait(timeout=60)
+
+
+def run_once(args, preload, gemini_url):
+    deployment = Deployment(args, preload, gemini_url)
+    try:
+        first = deployment.first_request() - deployment.started
+        all_ready = deployment.wait_ready(args.workers) - deployment.started
+        pids = [deployment.process.pid] + children(deployment.process.pid)
+        rss, pss = (sum(values) for values in zip(*(memory_mb(pid) for pid in pids)))
+
+        victim = children(deployment.process.pid)[0]
+        killed = time.perf_counter()
+        os.kill(victim, signal.SIGKILL)
+        respawn = deployment.wait_ready(args.workers + 1) - killed
+    finally:
+        deployment.stop()
+    return {"first": first, "all_ready": all_ready, "respawn": respawn, "rss": rss, "pss": pss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker startup and memory with and without preloading.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--modes", nargs="+", default=["preload", "lazy"], choices=["preload", "lazy"])
+    parser.add_argument("--port", type=int, default=8077)
+    args = parser.parse_args()
+
+    server, _, gemini_url = start_server()
+    # Killed and stopped workers drop their keep-alive connections to the fake mid-read.
+    server.handle_error = lambda request, client_address: None
+    print(f"gunicorn, {args.workers} workers, median of {args.runs} runs\n")
+    print(f"{'mode':<8} {'first request s':>16} {'all ready s':>12} {'respawn ready s':>16} {'RSS MB':>8} {'PSS MB':>8}")
+    for mode in args.modes:
+        runs = [run_once(args, mode == "preload", gemini_url) for _ in range(args.runs)]
+        median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        print(f"{mode:<8} {median['first']:>16.2f} {median['all_ready']:>12.2f} {median['respawn']:>16.2f} "
+              f"{median['rss']:>8.0f} {median['pss']:>8.0f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+#
+# With preload_app the master imports the app and loads the embedding model and the
+# retrieval index once (app.preload) before forking, so the workers share those pages
+# copy-on-write instead of each loading its own copy. Each worker then finishes its warm-up
+# in the background and reports ready on /readyz.
+import os
+import glob
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+# The views are async and spend almost all of their time awaiting Gemini, so each
+# worker gets many cheap threads to keep lots of conversations in flight.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "64"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+# Long streamed replies and slow TTS calls must not be mistaken for a hung worker.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# /metrics aggregates every worker through files in this directory (main/telemetry.py).
+# Values from a previous run would be added in, so it is emptied before the app is loaded.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+        os.remove(path)
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before the first fork.
+    if preload_app:
+        import app
+        app.preload()
+
+
+def post_fork(server, worker):
+    import app
+    app.start_worker()
+
+
+def child_exit(server, worker):
+    # Drops a dead worker's live gauges (in-flight requests, queue depth) from /metrics.
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,191 @@
+# This file should be located at: main/admission.py
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from .telemetry import get_logger, ADMISSION_WAIT_SECONDS, ADMISSION_IN_FLIGHT, ADMISSION_SHED
+
+log = get_logger("admission")
+
+# --- Configuration ---
+# Token buckets: sustained requests per minute and burst size; a rate of 0 disables the limit.
+RATE_LIMIT_SESSION_PER_MINUTE = float(os.getenv("RATE_LIMIT_SESSION_PER_MINUTE", "20"))
+RATE_LIMIT_SESSION_BURST = int(os.getenv("RATE_LIMIT_SESSION_BURST", "5"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "120"))
+RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "30"))
+# Buckets kept per limiter; the least recently seen keys are dropped beyond this.
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy).
+ADMISSION_TRUST_PROXY = os.getenv("ADMISSION_TRUST_PROXY", "0") == "1"
+# Concurrent requests per worker allowed inside each expensive stage; 0 means unlimited.
+ADMISSION_STT_CONCURRENCY = int(os.getenv("ADMISSION_STT_CONCURRENCY", "8"))
+ADMISSION_LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CONCURRENCY", "16"))
+ADMISSION_TTS_CONCURRENCY = int(os.getenv("ADMISSION_TTS_CONCURRENCY", "8"))
+# How long a request may wait for a slot before it is degraded or shed.
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "2"))
+# Retry-After sent with 503s when a stage stays saturated.
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+# With the LLM saturated, a cached answer to a question at least this similar is served instead.
+ADMISSION_DEGRADED_CACHE_THRESHOLD = float(os.getenv("ADMISSION_DEGRADED_CACHE_THRESHOLD", "0.85"))
+
+
+class Saturated(Exception):
+    """A stage had no free slot within the wait budget; the request should get a 503."""
+
+    def __init__(self, stage: str, retry_after: int = ADMISSION_RETRY_AFTER_SECONDS):
+        super().__init__(f"The {stage} stage is at capacity.")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token buckets per key (session id, client IP), refilled continuously at rate_per_minute."""
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill), in LRU order
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """Takes one token. Returns 0 if allowed, otherwise the seconds until a token is available."""
+        if self.rate <= 0 or not key:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0.0 if allowed else (1.0 - tokens) / self.rate
+
+
+class StageLimiter:
+    """Bounded number of requests inside one stage (STT, LLM, TTS), with a bounded wait for a slot."""
+
+    def __init__(self, stage: str, limit: int, max_wait: float = ADMISSION_MAX_WAIT_SECONDS):
+        self.stage = stage
+        self.limit = limit
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def saturated(self) -> bool:
+        return 0 < self.limit <= self.in_flight
+
+    def acquire(self, timeout: float) -> bool:
+        if self.limit <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+        ADMISSION_IN_FLIGHT.labels(self.stage).inc()
+        return True
+
+    def release(self):
+        if self.limit <= 0:
+            return
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+        ADMISSION_IN_FLIGHT.labels(self.stage).dec()
+
+    def releaser(self):
+        """Callable that gives back one held slot on its first call only; streams may end from either side."""
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                self.release()
+        return release
+
+    def wait_for_slot(self) -> bool:
+        """Blocking variant of aacquire() for worker threads, e.g. streamed TTS sentences."""
+        start = time.perf_counter()
+        acquired = self.acquire(self.max_wait)
+        ADMISSION_WAIT_SECONDS.labels(self.stage).observe(time.perf_counter() - start)
+        return acquired
+
+    async def _acquire_in_thread(self) -> bool:
+        # The waiting thread cannot be interrupted. If the task is cancelled, whichever side sees
+        # the other's state last gives back a slot taken after nobody was waiting for it anymore.
+        handoff = threading.Lock()
+        state = {"abandoned": False, "acquired": False}
+
+        def wait():
+            acquired = self.acquire(self.max_wait)
+            with handoff:
+                if acquired and state["abandoned"]:
+                    self.release()
+                    return False
+                state["acquired"] = acquired
+            return acquired
+
+        try:
+            return await asyncio.to_thread(wait)
+        except asyncio.CancelledError:
+            with handoff:
+                state["abandoned"] = True
+                if state["acquired"]:
+                    self.release()
+            raise
+
+    async def aacquire(self) -> bool:
+        """Waits up to max_wait without blocking the event loop; False means the request should be degraded or shed."""
+        start = time.perf_counter()
+        acquired = self.acquire(0) or await self._acquire_in_thread()
+        ADMISSION_WAIT_SECONDS.labels(self.stage).observe(time.perf_counter() - start)
+        return acquired
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds a slot for the block; raises Saturated (and counts the shed request) if none frees up in time."""
+        if not await self.aacquire():
+            ADMISSION_SHED.labels(self.stage).inc()
+            raise Saturated(self.stage)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AdmissionController:
+    """Rate limits at the door, then a bounded in-flight budget for each expensive stage."""
+
+    def __init__(self):
+        self.session_limiter = RateLimiter("session", RATE_LIMIT_SESSION_PER_MINUTE, RATE_LIMIT_SESSION_BURST)
+        self.ip_limiter = RateLimiter("ip", RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST)
+        self.stt = StageLimiter("stt", ADMISSION_STT_CONCURRENCY)
+        self.llm = StageLimiter("llm", ADMISSION_LLM_CONCURRENCY)
+        self.tts = StageLimiter("tts", ADMISSION_TTS_CONCURRENCY)
+
+    @staticmethod
+    def client_ip(request) -> str:
+        if ADMISSION_TRUST_PROXY and request.access_route:
+            return request.access_route[0]
+        return request.remote_addr or ""
+
+    def check_rate(self, session_id: str, ip: str):
+        """Returns (retry_after_seconds, reason) for a request over its limits, or (0, None)."""
+        for limiter, key in ((self.ip_limiter, ip), (self.session_limiter, session_id)):
+            retry_after = limiter.acquire(key)
+            if retry_after:
+                ADMISSION_SHED.labels(f"rate_{limiter.name}").inc()
+                log.info("Rate limited %s %s for %.1f s", limiter.name, key, retry_after)
+                return retry_after, limiter.name
+        return 0.0, None
@@ -1,10 +1,11 @@
 # This file should be located at: main/agent.py
 import os
-import re
 import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterator, Tuple
 
 # --- FIX: Add the project's root directory (Backend) to the Python path ---
 # This ensures that absolute imports from 'main' work reliably.
@@ -12,49 +13,116 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
-# It's good practice to handle potential import errors for genai
-try:
-    import google.generativeai as genai
-except ImportError:
-    print("Error: The 'google-generativeai' package is not installed. Please install it using 'pip install google-generativeai'")
-    genai = None
-
-# Use new import paths for LangChain components
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-
 # --- FIX: Use absolute imports from the 'main' package ---
 # Now that the project root is on the path, these imports will work.
-from .prompt import prompt as main_prompt
+from .prompt_builder import PromptBuilder
+from .structured import generation_config, parse_model_output, generation_stats
+from .llm import get_client
 from .prompt_classifier import prompt as classifier_prompt
+from .cache import SemanticResponseCache
+from .router import LocalIntentRouter, ROUTER_MODE
+from .index import MmapIndex, index_exists
+from .embedding import EmbeddingService, LazyEmbeddings, load_embedding_model, EMBEDDING_BACKEND
+from .retrieval import HybridRetriever, LazyVectorStore, RETRIEVAL_MODE
+from .coalesce import SingleFlight
+from .telemetry import get_logger, stage, traced, current_trace, observe_llm_call, record_prompt_tokens, ROUTER_DECISIONS
 
 # --- Configuration ---
 load_dotenv()
 
+log = get_logger("agent")
+
 # --- RAG Setup: Load the Vector Database ---
 # The path to the DB should be constructed from the main folder
 DB_DIR = os.path.join(PROJECT_ROOT, "main", "chroma_db")
+# Prebuilt, memory-mapped index produced by embed.py (see main/index.py)
+INDEX_DIR = os.path.join(PROJECT_ROOT, "main", "lore_index")
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "auto" uses the prebuilt index when present and Chroma otherwise; "mmap" or "chroma" force one.
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "auto")
+
+# --- The embedding model and the vector store load on first use, or in warm_up() ---
+# Importing this module stays cheap (no torch, no Chroma). Under gunicorn the master runs
+# warm_up() before forking, so the workers share the loaded pages (see gunicorn.conf.py).
+def _load_embedding_model():
+    log.info("RAG Agent: Loading embedding model %s (%s backend)...", EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+    return load_embedding_model(EMBEDDING_MODEL_NAME)
+
+def _open_vector_store():
+    if RETRIEVAL_BACKEND == "mmap" or (RETRIEVAL_BACKEND == "auto" and index_exists(INDEX_DIR)):
+        log.info("RAG Agent: Memory-mapping retrieval index from %s...", INDEX_DIR)
+        store = MmapIndex(INDEX_DIR, embeddings)
+    else:
+        # Chroma is only imported when it is actually used; it is the heaviest part of startup.
+        from langchain_community.vectorstores import Chroma
+        log.info("RAG Agent: Loading vector database from %s...", DB_DIR)
+        store = Chroma(persist_directory=DB_DIR, embedding_function=embeddings)
+    log.info("RAG Agent: Database loaded successfully.")
+    return store
 
-print("RAG Agent: Initializing embeddings...")
-embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+# Memoized and micro-batched across concurrent requests (see main/embedding.py)
+embeddings = EmbeddingService(LazyEmbeddings(_load_embedding_model))
+vector_db = LazyVectorStore(_open_vector_store)
 
-print(f"RAG Agent: Loading vector database from {DB_DIR}...")
-vector_db = Chroma(persist_directory=DB_DIR, embedding_function=embeddings)
-print("RAG Agent: Database loaded successfully.")
+# BM25 + vector search with rank fusion over the same chunks (see main/retrieval.py)
+retriever = HybridRetriever(vector_db)
+log.info("RAG Agent: Retrieval mode is '%s'.", RETRIEVAL_MODE)
 
-# --- Initialize the language model client ---
+# Compact, token-budgeted rendering of context and history (see main/prompt_builder.py)
+prompt_builder = PromptBuilder()
+
+# --- Semantic response cache: repeated questions skip both Gemini round trips ---
+response_cache = SemanticResponseCache(embeddings)
+
+# --- Local intent router: answers most YES/NO verdicts without a Gemini call ---
+local_router = LocalIntentRouter(embeddings)
+
+# Retrieval and the local router run here so they can overlap with the classifier round trip.
+# The threads mostly wait on the embedding batcher (main/embedding.py), so by default there is
+# one per request thread of the worker; a smaller pool would queue requests before the batcher
+# could group them. Threads are only started when needed.
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", os.getenv("GUNICORN_THREADS", "64")))
+RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+# --- Initialize the language model client (shared with stt.py and tts.py, see main/llm.py) ---
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gemini-1.5-flash-latest")
+# Schema-constrained JSON for the answer call (see main/structured.py)
+ANSWER_CONFIG = generation_config()
 client = None
-if genai:
-    try:
-        print("Loading GenAI model...")
-        genai.configure(api_key=os.getenv("GENAI_API_KEY"))
-        client = genai.GenerativeModel('gemini-1.5-flash-latest')
-        print("GenAI model client initialized successfully.")
-    except Exception as e:
-        print(f"Failed to initialize GenAI client: {e}")
+if get_client().available:
+    client = get_client().model(LLM_MODEL_NAME)
+    log.info("GenAI client ready for %s with %d API key(s).", LLM_MODEL_NAME, len(get_client().keys.keys))
 else:
-    print("GenAI client could not be initialized because the package is missing.")
+    log.warning("GenAI client could not be initialized: no API key configured (GENAI_API_KEYS / GENAI_API_KEY).")
+# Every Gemini call (answers, classifier, STT, TTS) feeds the /metrics latency histogram.
+get_client().stats.add_listener(observe_llm_call)
+
+# --- Single-flight: identical concurrent calls share one Gemini request (see main/coalesce.py) ---
+# Both are keyed by the full prompt, so only requests with the same question, context and
+# history share a call; in practice these are the history-free ones, e.g. a greeting everyone sends.
+classifier_flights = SingleFlight("classify")
+generation_flights = SingleFlight("generate")
+
+
+def warm_up(run_inference: bool = True):
+    """
+    Loads the embedding model and the vector store, and builds the lexical index unless
+    retrieval is vector-only.
+
+    With run_inference, it also runs the model once, since the first forward pass is slow, and
+    fits the local router. That starts the model's thread pool, so the gunicorn master skips it
+    and every worker does it after the fork.
+    """
+    embeddings.embeddings.load()
+    vector_db.load()
+    retriever.warm_up()
+    if run_inference:
+        embeddings.embed_documents(["Why is your tusk broken?"])
+        if ROUTER_MODE != "llm":
+            local_router.warm_up()
+
+def models_loaded() -> Dict[str, bool]:
+    return {"embedding_model": embeddings.embeddings.loaded, "vector_store": vector_db.loaded}
 
 
 # --- Define the response structure using Pydantic ---
@@ -70,84 +138,213 @@ class GaneshResponse(BaseModel):
         """Converts the Pydantic model to a JSON-serializable dictionary."""
         return self.model_dump()
 
+# --- Canned responses ---
+def _router_refusal() -> GaneshResponse:
+    return GaneshResponse(
+        lang='en', blessing_open='',
+        answer="My child, my wisdom is for matters of the spirit. Your question seems to be outside this realm. Please ask about life's obstacles, wisdom, or our sacred traditions.",
+        blessing_close='May you find the guidance you seek.', refusal=True, refusal_reason='Inappropriate topic classified by router'
+    )
+
+def _client_unavailable() -> GaneshResponse:
+    return GaneshResponse(
+        lang='en', blessing_open='',
+        answer='I apologize, my connection to the divine consciousness is currently unavailable. Please try again later.',
+        blessing_close='', refusal=True, refusal_reason='LLM client not loaded'
+    )
+
+def _generation_failed(e: Exception) -> GaneshResponse:
+    return GaneshResponse(
+        lang='en', blessing_open='',
+        answer="I heard your words, but my thoughts are unclear at this moment. Please rephrase your question, and I shall try again to offer guidance.",
+        blessing_close='', refusal=True, refusal_reason=f'LLM call or JSON parsing failed: {str(e)}'
+    )
+
+def canned_responses() -> List[GaneshResponse]:
+    """Fixed replies whose speech never changes, so it can be synthesized ahead of time."""
+    return [_router_refusal(), _client_unavailable(), _generation_failed(Exception())]
+
+# --- 1. LLM ROUTER: Classify the user's intent first ---
+def _classifier_verdict(response_text: str) -> str:
+    classification = response_text.strip().upper()
+    log.debug("Classification result: '%s'", classification)
+    
+    if classification not in ['YES', 'NO']:
+        log.warning("Unexpected classification result: '%s'. Defaulting to refusal.", classification)
+        classification = 'NO'
+    ROUTER_DECISIONS.labels("llm", classification).inc()
+    return classification
+
+def _local_verdict(user_input: str) -> Optional[str]:
+    if ROUTER_MODE == "llm":
+        return None
+    try:
+        return local_router.route(user_input, always_decide=(ROUTER_MODE == "local"))
+    except Exception as e:
+        log.warning("Local router failed: %s. Falling back to the LLM classifier.", e)
+        return None
+
+def _classify(user_input: str) -> str:
+    log.debug("Agent received text: '%s'", user_input)
+    with stage("classify"):
+        return _local_verdict(user_input) or _llm_classify(user_input)
+
+def _llm_classify(user_input: str) -> str:
+    classifier_full_prompt = classifier_prompt.format(question=user_input)
+    
+    try:
+        response = classifier_flights.do(classifier_full_prompt, client.generate_content, classifier_full_prompt)
+        return _classifier_verdict(response.text)
+    except Exception as e:
+        log.warning("Error during classification: %s. Defaulting to refusal.", e)
+        return 'NO'
+
+async def _aclassify(user_input: str) -> str:
+    log.debug("Agent received text: '%s'", user_input)
+    with stage("classify"):
+        verdict = await asyncio.get_running_loop().run_in_executor(RETRIEVAL_EXECUTOR, traced(_local_verdict), user_input)
+        if verdict:
+            return verdict
+
+        classifier_full_prompt = classifier_prompt.format(question=user_input)
+
+        try:
+            response = await classifier_flights.ado(classifier_full_prompt, client.generate_content_async,
+                                                    classifier_full_prompt)
+            return _classifier_verdict(response.text)
+        except Exception as e:
+            log.warning("Error during classification: %s. Defaulting to refusal.", e)
+            return 'NO'
+
+# --- 2 & 3. CONVERSATIONAL RAG + AUGMENT PROMPT: Build the final prompt from docs and history ---
+# Retrieval does not depend on the router's verdict, so it runs alongside the classifier call.
+def _build_final_prompt(user_input: str, history: List[Dict]) -> str:
+    search_query = prompt_builder.search_query(user_input, history)
+    
+    log.debug("RAG Step 1: Retrieving context from database with conversational query...")
+    docs = retriever.similarity_search(search_query, k=3)
+    log.debug("RAG Step 1: Found %d relevant document chunks.", len(docs))
+
+    build = prompt_builder.build(user_input, history, docs)
+    record_prompt_tokens(build.tokens)
+    log.debug("RAG Step 1: Prompt is %s.", build.describe())
+    return build.prompt
+
+# --- 4. PARSE the JSON object out of the model's reply, repairing near-valid output ---
+def _parse_response(raw_response_text: str) -> GaneshResponse:
+    """Parses and records the outcome; an unusable reply becomes the fallback apology."""
+    try:
+        with stage("parse"):
+            parsed_data, outcome = parse_model_output(raw_response_text, GaneshResponse)
+    except ValueError as e:
+        generation_stats.record("wasted")
+        log.warning("Discarding unusable LLM response (%d chars). Error: %s", len(raw_response_text), e)
+        return _generation_failed(e)
+    generation_stats.record(outcome)
+    if outcome == "repaired":
+        log.info("Repaired a malformed LLM response instead of discarding it.")
+    return parsed_data
+
+def _call_failed(e: Exception) -> GaneshResponse:
+    generation_stats.record("failed")
+    log.error("Failed to generate LLM response. Error: %s", e)
+    return _generation_failed(e)
+
 # --- Main function to get the RAG-powered and conversation-aware response ---
 def get_ganesh_response(user_input: str, history: List[Dict] = None) -> GaneshResponse:
     if history is None:
         history = []
 
     if not client:
-        return GaneshResponse(
-            lang='en', blessing_open='',
-            answer='I apologize, my connection to the divine consciousness is currently unavailable. Please try again later.',
-            blessing_close='', refusal=True, refusal_reason='LLM client not loaded'
-        )
-    
-    # --- 1. LLM ROUTER: Classify the user's intent first ---
-    print(f"Agent received text: '{user_input}'")
-    classifier_full_prompt = classifier_prompt.format(question=user_input)
+        return _client_unavailable()
+
+    prompt_future = RETRIEVAL_EXECUTOR.submit(traced(_build_final_prompt), user_input, history)
+    if _classify(user_input) == 'NO':
+        return _router_refusal()
+
+    log.debug("Classification approved. Proceeding with RAG workflow...")
+    final_prompt = prompt_future.result()
     
+    log.debug("RAG Step 2: Generating final response from LLM...")
     try:
-        response = client.generate_content(classifier_full_prompt)
-        classification = response.text.strip().upper()
-        print(f"Classification result: '{classification}'")
-        
-        if classification not in ['YES', 'NO']:
-            print(f"Unexpected classification result: '{classification}'. Defaulting to refusal.")
-            classification = 'NO'
-            
+        with stage("generate"):
+            response = generation_flights.do(final_prompt, client.generate_content, final_prompt,
+                                             generation_config=ANSWER_CONFIG)
+        raw_response_text = response.text
     except Exception as e:
-        print(f"Error during classification: {e}. Defaulting to refusal.")
-        classification = 'NO'
-
-    if classification == 'NO':
-        return GaneshResponse(
-            lang='en', blessing_open='',
-            answer="My child, my wisdom is for matters of the spirit. Your question seems to be outside this realm. Please ask about life's obstacles, wisdom, or our sacred traditions.",
-            blessing_close='May you find the guidance you seek.', refusal=True, refusal_reason='Inappropriate topic classified by router'
-        )
-
-    # --- 2. CONVERSATIONAL RAG: Use history to improve retrieval ---
-    print("Classification approved. Proceeding with RAG workflow...")
-    
-    recent_history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history[-4:]])
-    search_query = f"{recent_history_text}\n\nuser: {user_input}"
+        return _call_failed(e)
     
-    print("RAG Step 1: Retrieving context from database with conversational query...")
-    docs = vector_db.similarity_search(search_query, k=3)
-    static_context = "\n\n".join([doc.page_content for doc in docs])
-    print(f"RAG Step 1: Found {len(docs)} relevant document chunks.")
+    return _parse_response(raw_response_text)
 
-    # --- 3. AUGMENT PROMPT: Combine static docs and chat history ---
-    formatted_history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history[-6:]])
-    
-    final_prompt = main_prompt.format(
-        context=static_context,
-        history=formatted_history,
-        question=user_input
+# --- Async variant: non-blocking Gemini calls, classifier and retrieval run concurrently ---
+async def aget_ganesh_response(user_input: str, history: List[Dict] = None) -> GaneshResponse:
+    if history is None:
+        history = []
+
+    if not client:
+        return _client_unavailable()
+
+    # The vector search is CPU-bound local work, so it goes to a thread while the classifier call is in flight.
+    classification, final_prompt = await asyncio.gather(
+        _aclassify(user_input),
+        asyncio.get_running_loop().run_in_executor(RETRIEVAL_EXECUTOR, traced(_build_final_prompt), user_input, history)
     )
-    
-    # --- 4. GENERATE RESPONSE from the main model ---
-    print("RAG Step 2: Generating final response from LLM...")
+    if classification == 'NO':
+        return _router_refusal()
+
+    log.debug("Classification approved. RAG Step 2: Generating final response from LLM...")
     try:
-        response = client.generate_content(final_prompt)
+        with stage("generate"):
+            response = await generation_flights.ado(final_prompt, client.generate_content_async, final_prompt,
+                                                    generation_config=ANSWER_CONFIG)
         raw_response_text = response.text
-        
-        json_start = raw_response_text.find('{')
-        json_end = raw_response_text.rfind('}') + 1
-        
-        if json_start != -1 and json_end != 0:
-            json_string = raw_response_text[json_start:json_end]
-            sanitized_json_string = re.sub(r'[\x00-\x1f]', '', json_string)
-            parsed_data = GaneshResponse.model_validate_json(sanitized_json_string)
-        else:
-            raise ValueError("No JSON object found in the LLM response.")
-            
     except Exception as e:
-        print(f"Failed to generate or parse LLM response. Error: {e}")
-        parsed_data = GaneshResponse(
-            lang='en', blessing_open='',
-            answer="I heard your words, but my thoughts are unclear at this moment. Please rephrase your question, and I shall try again to offer guidance.",
-            blessing_close='', refusal=True, refusal_reason=f'LLM call or JSON parsing failed: {str(e)}'
-        )
-    
-    return parsed_data
+        return _call_failed(e)
+
+    return _parse_response(raw_response_text)
+
+# --- Streaming variant: yields raw text deltas as the model produces them ---
+def stream_ganesh_response(user_input: str, history: List[Dict] = None) -> Iterator[Tuple[str, object]]:
+    """
+    Same pipeline as get_ganesh_response, but streams the final generation.
+
+    Yields:
+        ("token", str) for every text delta produced by the model, followed by
+        exactly one ("response", GaneshResponse) with the parsed final answer.
+    """
+    if history is None:
+        history = []
+
+    if not client:
+        yield "response", _client_unavailable()
+        return
+
+    prompt_future = RETRIEVAL_EXECUTOR.submit(traced(_build_final_prompt), user_input, history)
+    if _classify(user_input) == 'NO':
+        yield "response", _router_refusal()
+        return
+
+    log.debug("Classification approved. Proceeding with RAG workflow...")
+    final_prompt = prompt_future.result()
+
+    log.debug("RAG Step 2: Streaming final response from LLM...")
+    raw_response_text = ""
+    trace = current_trace()
+    try:
+        # Measured from the request to the last chunk, so it includes the time spent sending tokens on.
+        with stage("generate"):
+            for chunk in client.generate_content(final_prompt, stream=True, generation_config=ANSWER_CONFIG):
+                delta = chunk.text
+                if delta:
+                    if trace is not None and not raw_response_text:
+                        trace.first_token()
+                    raw_response_text += delta
+                    yield "token", delta
+    except Exception as e:
+        # Whatever already streamed may still hold a usable answer.
+        if not raw_response_text:
+            yield "response", _call_failed(e)
+            return
+        log.warning("LLM stream broke off after %d chars: %s", len(raw_response_text), e)
+
+    yield "response", _parse_response(raw_response_text)
@@ -0,0 +1,129 @@
+# This file should be located at: main/audio.py
+import io
+import asyncio
+import subprocess
+
+import numpy as np
+import soundfile as sf
+
+# It's good practice to handle potential import errors for optional decoders.
+# PyAV decodes the WebM/Opus uploads browsers record in-process; without it those fall back to ffmpeg.
+try:
+    import av
+except ImportError:
+    av = None
+
+from .telemetry import get_logger
+
+log = get_logger("audio")
+
+# --- The format the STT layer expects: 16 kHz mono signed 16-bit PCM ---
+TARGET_RATE = 16000
+
+FFMPEG_CMD = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+              "-f", "s16le", "-ar", str(TARGET_RATE), "-ac", "1", "pipe:1"]
+
+
+class AudioDecodeError(Exception):
+    """Raised when none of the decoders can read an upload."""
+
+
+def _resample(samples: np.ndarray, rate: int) -> np.ndarray:
+    """Resamples mono float samples to TARGET_RATE."""
+    if rate == TARGET_RATE or len(samples) == 0:
+        return samples
+    # Downsampling 44.1/48 kHz needs a real anti-aliasing filter (block averaging or linear
+    # interpolation fold everything above 8 kHz back into speech), which libswresample has.
+    # Without PyAV the decode fails here and decode_to_pcm falls back to ffmpeg, which uses it too.
+    if av is None:
+        raise AudioDecodeError(f"resampling {rate} Hz needs PyAV")
+    return _resample_pyav(samples, rate)
+
+
+def _resample_pyav(samples: np.ndarray, rate: int) -> np.ndarray:
+    """Filtered resampling of mono float samples through PyAV's libswresample."""
+    frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(samples, dtype=np.float32)[None, :], format="flt", layout="mono")
+    frame.sample_rate = rate
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=TARGET_RATE)
+    out = [resampled.to_ndarray()[0] for resampled in resampler.resample(frame)]
+    out += [resampled.to_ndarray()[0] for resampled in resampler.resample(None)]
+    return np.concatenate(out) if out else samples[:0]
+
+
+def _to_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+def _decode_soundfile(data: bytes) -> bytes:
+    """WAV, FLAC, OGG (Vorbis/Opus) and MP3 via libsndfile."""
+    samples, rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+    return _to_pcm16(_resample(samples.mean(axis=1), rate))
+
+
+def _decode_pyav(data: bytes) -> bytes:
+    """Any container/codec FFmpeg's libraries know (WebM/Opus, MP4/AAC, ...) via PyAV."""
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=TARGET_RATE)
+    chunks = []
+    with av.open(io.BytesIO(data), mode="r") as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().tobytes())
+    for resampled in resampler.resample(None):
+        chunks.append(resampled.to_ndarray().tobytes())
+    return b"".join(chunks)
+
+
+def decode_native(data: bytes) -> bytes:
+    """Decodes an upload in-process. Raises AudioDecodeError if no native decoder can read it."""
+    errors = []
+    decoders = [_decode_pyav] if av is not None else []
+    decoders.append(_decode_soundfile)
+    # libsndfile is cheaper for the formats it supports; WebM (the browser default) is not one of them.
+    if data[:4] in (b"RIFF", b"fLaC", b"OggS"):
+        decoders.reverse()
+    for decoder in decoders:
+        try:
+            return decoder(data)
+        except Exception as e:
+            errors.append(f"{decoder.__name__}: {e}")
+    raise AudioDecodeError("; ".join(errors))
+
+
+def decode_ffmpeg(data: bytes) -> bytes:
+    """Fallback: pipes the upload through an ffmpeg process, still without touching disk."""
+    result = subprocess.run(FFMPEG_CMD, input=data, check=True, capture_output=True)
+    return result.stdout
+
+
+async def adecode_ffmpeg(data: bytes) -> bytes:
+    proc = await asyncio.create_subprocess_exec(*FFMPEG_CMD, stdin=asyncio.subprocess.PIPE,
+                                                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await proc.communicate(data)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, FFMPEG_CMD, output=stdout, stderr=stderr.decode(errors="replace"))
+    return stdout
+
+
+def decode_to_pcm(data: bytes) -> bytes:
+    """Returns 16 kHz mono s16le PCM for an uploaded audio file, all in memory."""
+    try:
+        return decode_native(data)
+    except AudioDecodeError as e:
+        log.debug("Native audio decode failed (%s); falling back to ffmpeg.", e)
+        return decode_ffmpeg(data)
+
+
+async def adecode_to_pcm(data: bytes) -> bytes:
+    """Non-blocking variant of decode_to_pcm for the async request path."""
+    try:
+        return await asyncio.to_thread(decode_native, data)
+    except AudioDecodeError as e:
+        log.debug("Native audio decode failed (%s); falling back to ffmpeg.", e)
+        return await adecode_ffmpeg(data)
+
+
+def pcm_to_wav(pcm: bytes, rate: int = TARGET_RATE) -> bytes:
+    """Wraps raw s16le mono PCM in a WAV container, in memory."""
+    buffer = io.BytesIO()
+    sf.write(buffer, np.frombuffer(pcm, dtype=np.int16), samplerate=rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
@@ -0,0 +1,154 @@
+# This file should be located at: main/audio_cache.py
+import os
+import json
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# --- Configuration ---
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# "local" (a directory, which may be a volume shared by all workers), "memory" or "none".
+TTS_CACHE_BACKEND = os.getenv("TTS_CACHE_BACKEND", "local")
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(PROJECT_ROOT, "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# The local backend rescans its directory once its own running total passes max_bytes, and at
+# least every this many puts so writes by other workers sharing the directory are counted too.
+TTS_CACHE_SCAN_EVERY = int(os.getenv("TTS_CACHE_SCAN_EVERY", "100"))
+
+
+def audio_cache_key(text: str, lang: str, voice: str, prompt_template: str, model: str, audio_format: str = "wav") -> str:
+    """Content address of a synthesized clip: everything that changes the audio goes into the hash."""
+    fields = [text, lang, voice, prompt_template, model]
+    if audio_format != "wav":
+        fields.append(audio_format)  # WAV keys predate the format choice and stay valid
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AudioCacheBackend:
+    """Interface for audio cache storage. Values are complete, encoded audio files."""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def put(self, key: str, data: bytes):
+        raise NotImplementedError
+
+
+class NullBackend(AudioCacheBackend):
+    def get(self, key):
+        return None
+
+    def put(self, key, data):
+        pass
+
+
+class MemoryBackend(AudioCacheBackend):
+    """Process-local LRU bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key))
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class LocalDirectoryBackend(AudioCacheBackend):
+    """
+    One file per key in a directory, safe to share between processes.
+
+    Writes go through a temporary file and an atomic rename, hits refresh the file's
+    mtime, and the oldest files are deleted once the directory exceeds max_bytes.
+    Puts only add to a running total; the directory is scanned when that total goes
+    over max_bytes or every scan_every puts. Eviction goes down to 90% of max_bytes,
+    so a full cache is not rescanned on every put.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES,
+                 scan_every: int = TTS_CACHE_SCAN_EVERY):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.scan_every = scan_every
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._size = self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        tmp_path = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._size += len(data)
+            self._puts += 1
+            if self._size <= self.max_bytes and self._puts < self.scan_every:
+                return
+            self._puts = 0
+        size = self._evict()
+        with self._lock:
+            self._size = size
+
+    def _evict(self) -> int:
+        """Deletes the oldest files once the directory exceeds max_bytes; returns its size."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".audio"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed concurrently by another worker
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return total
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            if total <= self.max_bytes * 0.9:
+                break
+        return total
+
+
+def create_backend(kind: str = TTS_CACHE_BACKEND) -> AudioCacheBackend:
+    if kind == "local":
+        return LocalDirectoryBackend()
+    if kind == "memory":
+        return MemoryBackend()
+    return NullBackend()
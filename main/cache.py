@@ -0,0 +1,175 @@
+# This file should be located at: main/cache.py
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict
+
+import numpy as np
+
+from .embedding import canonical_text
+from .telemetry import get_logger, CACHE_LOOKUPS
+
+log = get_logger("cache")
+
+# --- Configuration ---
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+# Cosine similarity above which two questions are treated as the same question.
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "21600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+
+# Follow-up questions that only make sense with the previous turns ("why did he do that?").
+_CONTEXT_DEPENDENT = re.compile(
+    r"\b(it|its|this|that|these|those|he|him|his|she|her|they|them|their|"
+    r"again|more|also|else|then|above|previous|earlier|same)\b",
+    re.IGNORECASE
+)
+# Errors and outages must never be replayed to other users.
+_UNCACHEABLE_REASONS = ("LLM call or JSON parsing failed", "LLM client not loaded")
+
+
+class CacheEntry:
+    __slots__ = ("question", "response", "audio", "created_at")
+
+    def __init__(self, question, response):
+        self.question = question
+        self.response = response
+        self.audio = None  # synthesized WAV bytes, attached once speech was generated
+        self.created_at = time.monotonic()
+
+
+class CacheLookup:
+    """Result of SemanticResponseCache.lookup(); pass it back to store()/attach_audio()/cached_audio()."""
+    __slots__ = ("entry", "embedding", "bypass", "hit")
+
+    def __init__(self, entry=None, embedding=None, bypass=False):
+        self.entry = entry
+        self.embedding = embedding
+        self.bypass = bypass
+        self.hit = entry is not None
+
+
+class SemanticResponseCache:
+    """
+    Caches final GaneshResponses keyed by the embedding of the user's question.
+
+    A lookup embeds the question once, compares it against every cached question by
+    cosine similarity and returns the best entry above the threshold. Entries expire
+    after a TTL and the least recently used entry is evicted once the cache is full.
+
+    The cached embeddings live in the first rows of one preallocated matrix, so a lookup
+    is a single matrix-vector product; removing an entry moves the last row into its place.
+    """
+
+    def __init__(self, embeddings, threshold: float = RESPONSE_CACHE_THRESHOLD,
+                 ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict()  # key -> CacheEntry, in LRU order
+        self._matrix = None            # (max_entries + 1, dim) float32, allocated by the first store
+        self._rows = {}                # key -> row of its normalized embedding in _matrix
+        self._row_keys = []            # row -> key, for the rows in use
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def should_bypass(self, question: str, history: Optional[List[Dict]]) -> bool:
+        """History only matters for follow-ups; a standalone question is answered the same way."""
+        if not self.enabled:
+            return True
+        return bool(history) and bool(_CONTEXT_DEPENDENT.search(question))
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(canonical_text(question)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+            self._remove_vector(key)
+
+    def _add_vector(self, key, vector: np.ndarray):
+        if self._matrix is None:
+            # One spare row: store() inserts before it evicts.
+            self._matrix = np.zeros((self.max_entries + 1, len(vector)), dtype=np.float32)
+        row = len(self._row_keys)
+        self._matrix[row] = vector
+        self._rows[key] = row
+        self._row_keys.append(key)
+
+    def _remove_vector(self, key):
+        row = self._rows.pop(key)
+        last_key = self._row_keys.pop()
+        if last_key != key:
+            self._matrix[row] = self._matrix[len(self._row_keys)]
+            self._rows[last_key] = row
+            self._row_keys[row] = last_key
+
+    def lookup(self, question: str, history: Optional[List[Dict]] = None, threshold: Optional[float] = None) -> CacheLookup:
+        """threshold overrides the configured one, e.g. a looser match when the LLM is overloaded."""
+        if self.should_bypass(question, history):
+            CACHE_LOOKUPS.labels("response", "bypass").inc()
+            return CacheLookup(bypass=True)
+
+        embedding = self._embed(question)
+        with self._lock:
+            self._expire(time.monotonic())
+            best_key, best_score = None, self.threshold if threshold is None else threshold
+            if self._row_keys:
+                scores = self._matrix[:len(self._row_keys)] @ embedding
+                index = int(np.argmax(scores))
+                if scores[index] >= best_score:
+                    best_key, best_score = self._row_keys[index], float(scores[index])
+
+            if best_key is None:
+                self.misses += 1
+                CACHE_LOOKUPS.labels("response", "miss").inc()
+                return CacheLookup(embedding=embedding)
+
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            CACHE_LOOKUPS.labels("response", "hit").inc()
+            log.debug("Response cache hit (%.3f): '%s' ~ '%s'", best_score, question, entry.question)
+            return CacheLookup(entry=entry, embedding=embedding)
+
+    def store(self, lookup: CacheLookup, question: str, response) -> Optional[CacheEntry]:
+        """Caches a freshly generated response; returns the new entry (or None when not cacheable)."""
+        if lookup.bypass or lookup.hit or lookup.embedding is None:
+            return lookup.entry
+        if response.refusal and (response.refusal_reason or "").startswith(_UNCACHEABLE_REASONS):
+            return None
+
+        entry = CacheEntry(question, response)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = entry
+            self._add_vector(key, lookup.embedding)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._remove_vector(evicted)
+        lookup.entry = entry
+        return entry
+
+    def attach_audio(self, lookup: CacheLookup, data: Optional[bytes]):
+        """Keeps the synthesized speech for an entry so later hits skip TTS entirely."""
+        entry = lookup.entry
+        if entry is not None and entry.audio is None and data is not None:
+            entry.audio = data
+
+    def cached_audio(self, lookup: CacheLookup) -> Optional[bytes]:
+        """Returns the WAV stored with a hit, if speech was already synthesized for it."""
+        return lookup.entry.audio if lookup.entry is not None else None
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,103 @@
+# This file should be located at: main/coalesce.py
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from .telemetry import get_logger, COALESCED_CALLS
+
+log = get_logger("coalesce")
+
+# --- Configuration ---
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1") == "1"
+# Longest anyone waits on an identical call in flight before making their own.
+COALESCE_TIMEOUT_SECONDS = float(os.getenv("COALESCE_TIMEOUT_SECONDS", "30"))
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution.
+
+    The first caller (the leader) makes the call; callers arriving while it is in flight
+    wait for its result, or its exception, instead of repeating it. A flight older than
+    timeout counts as stuck: its waiters stop waiting and make their own call, and new
+    arrivals start a fresh flight. Nothing is kept once a call returns; caching is up to
+    the caller.
+
+    Flask runs every async view on an event loop of its own, so flights are shared through
+    thread-safe futures and any mix of threads and event loops can wait on one.
+    """
+
+    def __init__(self, name: str, timeout: float = COALESCE_TIMEOUT_SECONDS, enabled: bool = COALESCE_ENABLED):
+        self.name = name
+        self.timeout = timeout
+        self.enabled = enabled
+        self._flights = {}  # key -> (started, Future)
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        """Returns (flight, is_leader)."""
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None or now - flight[0] >= self.timeout
+            if leader:
+                flight = self._flights[key] = (now, Future())
+        COALESCED_CALLS.labels(self.name, "leader" if leader else "follower").inc()
+        return flight, leader
+
+    def _land(self, key, flight, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if error is not None:
+            flight[1].set_exception(error)
+        else:
+            flight[1].set_result(result)
+
+    def _remaining(self, flight) -> float:
+        return max(0.0, flight[0] + self.timeout - time.monotonic())
+
+    def _gave_up(self):
+        COALESCED_CALLS.labels(self.name, "timeout").inc()
+        log.warning("Shared %s call still running after %.0f s; calling upstream directly.", self.name, self.timeout)
+
+    def do(self, key, fn, *args, **kwargs):
+        """Returns fn(*args, **kwargs), shared with every concurrent call under the same key."""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                self._land(key, flight, error=e)
+                raise
+            self._land(key, flight, result)
+            return result
+        try:
+            return flight[1].result(timeout=self._remaining(flight))
+        except FutureTimeoutError:
+            self._gave_up()
+            return fn(*args, **kwargs)
+
+    async def ado(self, key, fn, *args, **kwargs):
+        """Async variant of do(); fn is a coroutine function."""
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException as e:
+                self._land(key, flight, error=e)
+                raise
+            self._land(key, flight, result)
+            return result
+        try:
+            # shield: a waiter timing out must not cancel the flight the others are waiting on.
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(flight[1])), self._remaining(flight))
+        except asyncio.TimeoutError:
+            self._gave_up()
+            return await fn(*args, **kwargs)
@@ -1,21 +1,36 @@
 import os
-from langchain.vectorstores import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.document_loaders import DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_community.document_loaders import DirectoryLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 LORE_DIR = os.path.join(PROJECT_ROOT, "lore")
 DB_DIR = os.path.join(PROJECT_ROOT, "chroma_db")
+INDEX_DIR = os.path.join(PROJECT_ROOT, "lore_index")
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+CHUNK_SIZE = 750
+CHUNK_OVERLAP = 100
+
+# --- Make the 'main' package importable when this file is run directly ---
+BACKEND_ROOT = os.path.dirname(PROJECT_ROOT)
+if BACKEND_ROOT not in sys.path:
+    sys.path.append(BACKEND_ROOT)
+from main.index import MmapIndex, index_exists, write_index
+from main.embedding import load_embedding_model, EMBEDDING_BACKEND
+from main.onnx_embeddings import ONNX_EMBEDDING_FILE
 
 def build_or_load_db():
     """
     Builds a new ChromaDB database from documents in the LORE_DIR or loads an existing one.
     """
     # Initialize the embedding model
-    print("Initializing embedding model...")
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    print(f"Initializing embedding model ({EMBEDDING_BACKEND} backend)...")
+    embeddings = load_embedding_model(EMBEDDING_MODEL_NAME)
 
     if os.path.exists(DB_DIR):
         print(f"Loading existing database from {DB_DIR}...")
@@ -30,7 +45,7 @@ def build_or_load_db():
         print(f"Loaded {len(documents)} documents.")
 
         # 2. Split the documents into smaller chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=750, chunk_overlap=100)
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
         texts = text_splitter.split_documents(documents)
         print(f"Split documents into {len(texts)} chunks.")
 
@@ -44,13 +59,188 @@ def build_or_load_db():
         print(f"Successfully created and persisted database at {DB_DIR}.")
     return vectordb
 
+def export_index(vectordb):
+    """
+    Writes the memory-mapped retrieval artifact that agent.py searches (see main/index.py).
+    The embeddings stored in the Chroma collection are reused, so nothing is re-embedded.
+    """
+    data = vectordb.get(include=["embeddings", "documents", "metadatas"])
+    metadatas = []
+    for metadata in data["metadatas"]:
+        metadata = dict(metadata or {})
+        # Sources were recorded with OS-specific separators; keep just the file name.
+        metadata["source"] = os.path.basename(metadata.get("source", "").replace("\\", "/"))
+        metadatas.append(metadata)
+    meta = write_index(INDEX_DIR, data["embeddings"], data["documents"], metadatas, EMBEDDING_MODEL_NAME)
+    print(f"Wrote retrieval index with {meta['count']} chunks ({meta['dim']} dims) to {INDEX_DIR}.")
+    return meta
+
+# --- Incremental ingestion ---
+# manifest.json sits next to the index and records, per lore file, the content hash and the
+# hashes of the chunks it produced. On the next run unchanged files are skipped without
+# splitting, chunks whose text is already indexed reuse their stored vector, and files that
+# disappeared simply drop out, so only new or edited text is sent to the model.
+MANIFEST_FILE = "manifest.json"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+def _sha256(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def _embedding_settings():
+    """What produced the stored vectors; int8 ONNX and torch vectors are never mixed in one index."""
+    settings = {"model": EMBEDDING_MODEL_NAME, "backend": EMBEDDING_BACKEND}
+    if EMBEDDING_BACKEND == "onnx":
+        settings["model_file"] = ONNX_EMBEDDING_FILE
+    return settings
+
+def _read_manifest():
+    try:
+        with open(os.path.join(INDEX_DIR, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+def _load_manifest(manifest, settings):
+    """Returns the previous manifest, or an empty one if it was built with other settings."""
+    if manifest.get("settings", settings) != settings:
+        print("Embedding model or chunking settings changed; rebuilding every file.")
+        return {"files": {}}
+    return manifest
+
+def _vectors_reusable(manifest, embedding_settings):
+    """False if the stored vectors came from another model, backend or model file."""
+    # Indexes exported from Chroma (no manifest) and manifests written before EMBEDDING_BACKEND
+    # existed were embedded with torch; the model name is also checked against the index itself.
+    recorded = dict({"model": EMBEDDING_MODEL_NAME, "backend": "torch"}, **manifest.get("settings", {}))
+    return all(recorded.get(key) == value for key, value in embedding_settings.items())
+
+def _load_existing_chunks():
+    """Maps chunk hash -> (text, vector) for everything in the current index, read from the mmap."""
+    if not index_exists(INDEX_DIR):
+        return {}
+    index = MmapIndex(INDEX_DIR, None, reload_interval=0)
+    if index.meta.get("model") != EMBEDDING_MODEL_NAME:
+        return {}
+    return {_sha256(chunk.page_content): (chunk.page_content, index.vectors[i])
+            for i, chunk in enumerate(index.chunks)}
+
+def iter_lore_files():
+    """Yields (relative path, raw bytes) one file at a time, in a stable order."""
+    for root, dirs, files in os.walk(LORE_DIR):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".txt"):
+                path = os.path.join(root, name)
+                with open(path, "rb") as f:
+                    yield os.path.relpath(path, LORE_DIR).replace(os.sep, "/"), f.read()
+
+def update_index(batch_size=EMBED_BATCH_SIZE, reembed=False):
+    """
+    Brings the retrieval index in line with LORE_DIR, re-embedding only new or changed chunks.
+    With reembed, every chunk is embedded again with the configured EMBEDDING_BACKEND, e.g. to
+    build the index with the same (int8 ONNX) model the queries will use.
+
+    Returns a dict of counts (files changed/removed, chunks reused/embedded).
+    """
+    embedding_settings = _embedding_settings()
+    settings = dict(embedding_settings, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    manifest = _read_manifest()
+    previous = {"files": {}} if reembed else _load_manifest(manifest, settings)
+    reuse = not reembed and _vectors_reusable(manifest, embedding_settings)
+    existing = _load_existing_chunks() if reuse else {}
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    embeddings = None
+
+    files = {}
+    rows = []          # (chunk hash, text, source) in index order
+    vectors = {}       # chunk hash -> vector, for every row
+    pending = {}       # chunk hash -> text, waiting for the next embedding batch
+    stats = {"files": 0, "files_changed": 0, "files_removed": 0, "chunks_reused": 0, "chunks_embedded": 0}
+
+    def flush():
+        nonlocal embeddings
+        if not pending:
+            return
+        if embeddings is None:
+            # The model is only loaded when there is actually something to embed.
+            print(f"Initializing embedding model ({EMBEDDING_BACKEND} backend)...")
+            embeddings = load_embedding_model(EMBEDDING_MODEL_NAME)
+        hashes = list(pending)
+        for chunk_hash, vector in zip(hashes, embeddings.embed_documents([pending[h] for h in hashes])):
+            vectors[chunk_hash] = vector
+        stats["chunks_embedded"] += len(hashes)
+        pending.clear()
+
+    for source, data in iter_lore_files():
+        stats["files"] += 1
+        file_hash = _sha256(data)
+        known = previous["files"].get(source)
+        if known and known["sha256"] == file_hash and all(h in existing for h in known["chunks"]):
+            chunks = [(h, existing[h][0]) for h in known["chunks"]]
+        else:
+            stats["files_changed"] += 1
+            print(f"Splitting {source}...")
+            chunks = [(_sha256(text), text) for text in splitter.split_text(data.decode("utf-8"))]
+        files[source] = {"sha256": file_hash, "chunks": [h for h, _ in chunks]}
+
+        for chunk_hash, text in chunks:
+            rows.append((chunk_hash, text, source))
+            if chunk_hash in vectors or chunk_hash in pending:
+                continue
+            if chunk_hash in existing:
+                vectors[chunk_hash] = existing[chunk_hash][1]
+                stats["chunks_reused"] += 1
+            else:
+                pending[chunk_hash] = text
+                if len(pending) >= batch_size:
+                    flush()
+    flush()
+    stats["files_removed"] = len(set(previous["files"]) - set(files))
+
+    if previous["files"] and not stats["files_changed"] and not stats["files_removed"]:
+        print("Retrieval index is up to date.")
+        return stats
+
+    dim = len(vectors[rows[0][0]]) if rows else 0
+    matrix = np.empty((len(rows), dim), dtype=np.float32)
+    for i, (chunk_hash, _, _) in enumerate(rows):
+        matrix[i] = vectors[chunk_hash]
+    metadatas = [{"source": source} for _, _, source in rows]
+    meta = write_index(INDEX_DIR, matrix, [text for _, text, _ in rows], metadatas, EMBEDDING_MODEL_NAME)
+
+    manifest = {"settings": settings, "built_at": meta["built_at"], "files": files}
+    tmp_path = os.path.join(INDEX_DIR, f".{MANIFEST_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(INDEX_DIR, MANIFEST_FILE))
+
+    print(f"Wrote retrieval index with {meta['count']} chunks to {INDEX_DIR}: "
+          f"{stats['files_changed']} file(s) changed, {stats['files_removed']} removed, "
+          f"{stats['chunks_embedded']} chunk(s) embedded, {stats['chunks_reused']} reused.")
+    return stats
+
 if __name__ == "__main__":
-    # Run the build/load process
-    db = build_or_load_db()
+    parser = argparse.ArgumentParser(description="Build or update the lore retrieval index.")
+    parser.add_argument("--from-chroma", action="store_true",
+                        help="export the existing Chroma DB (built if missing) instead of ingesting lore/ incrementally")
+    parser.add_argument("--reembed", action="store_true",
+                        help="embed every chunk again with EMBEDDING_BACKEND instead of reusing stored vectors")
+    parser.add_argument("--query", default="What is the story of how Ganesha broke his tusk?",
+                        help="test query to run against the result")
+    args = parser.parse_args()
+
+    if args.from_chroma:
+        db = build_or_load_db()
+        export_index(db)
+    else:
+        update_index(reembed=args.reembed)
+        db = MmapIndex(INDEX_DIR, load_embedding_model(EMBEDDING_MODEL_NAME))
 
-    # --- Test the database with a sample query ---
+    # --- Test the index with a sample query ---
     print("\n--- Running a test query ---")
-    query = "What is the story of how Ganesha broke his tusk?"
+    query = args.query
     
     # Retrieve the most relevant document chunks
     # k=3 means it will retrieve the top 3 most similar chunks
@@ -0,0 +1,199 @@
+# This file should be located at: main/embedding.py
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List
+
+from .telemetry import get_logger, stage
+
+log = get_logger("embedding")
+
+# --- Configuration ---
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+# Queries arriving within this window of the first one are embedded together; 0 disables batching.
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "3"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+# "torch" (sentence-transformers) or "onnx" (int8-quantized export on onnxruntime, see main/onnx_embeddings.py;
+# its packages are listed in requirements-onnx.txt).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+
+def canonical_text(text: str) -> str:
+    """
+    Lowercased, whitespace-collapsed form of a question. all-MiniLM-L6-v2 is uncased, so this
+    changes nothing about the vector, and callers that embed the same question (the response
+    cache, the local router) share one embedding through the EmbeddingService LRU.
+    """
+    return " ".join(text.lower().split())
+
+
+def load_embedding_model(model_name: str, backend: str = EMBEDDING_BACKEND):
+    """Builds the embeddings model for EMBEDDING_BACKEND; both expose embed_query / embed_documents."""
+    if backend == "onnx":
+        from .onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(model_name)
+    if backend == "torch":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'; expected 'torch' or 'onnx'.")
+
+
+class LazyEmbeddings:
+    """
+    Builds the embeddings model (see load_embedding_model) on first use instead of at
+    import, so processes that only need the Gemini paths never load it. load() does it
+    ahead of time, e.g. in the gunicorn master before it forks.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = self.factory()
+                    log.info("Embedding model loaded in %.1f s.", time.perf_counter() - started)
+        return self._model
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.load().embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.load().embed_documents(texts)
+
+
+class EmbeddingService:
+    """
+    Drop-in wrapper around a LangChain embeddings object (embed_query / embed_documents).
+
+    Query embeddings are memoized in a size-capped LRU. Cache misses from concurrent
+    requests are collected by a background thread for at most batch_wait_ms and embedded
+    with a single embed_documents call, which is far cheaper on CPU than one forward pass
+    per query.
+    """
+
+    def __init__(self, embeddings, cache_size: int = EMBEDDING_CACHE_SIZE,
+                 batch_wait_ms: float = EMBEDDING_BATCH_WAIT_MS, max_batch: int = EMBEDDING_MAX_BATCH):
+        self.embeddings = embeddings
+        self.cache_size = cache_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_batch = max_batch
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {}  # text -> Future, so identical in-flight misses share one slot
+        self._queue = queue.Queue()
+        self._worker = None
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        # The batcher thread does not survive fork(); a child starts its own.
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._queue = queue.Queue()
+        self._worker = None
+
+    # --- LRU ---
+    def _get_cached(self, text):
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+            return vector
+
+    def _put_cached(self, text, vector):
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- Micro-batching ---
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._embed_batch(batch)
+
+    def _embed_batch(self, batch):
+        texts = [text for text, _ in batch]
+        self.batches += 1
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            for text, future in batch:
+                self._finish(text, future, error=e)
+            return
+        for (text, future), vector in zip(batch, vectors):
+            self._put_cached(text, vector)
+            self._finish(text, future, vector=vector)
+
+    def _finish(self, text, future, vector=None, error=None):
+        with self._lock:
+            self._pending.pop(text, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(vector)
+
+    # --- Public interface (same as the wrapped embeddings) ---
+    def embed_query(self, text: str) -> List[float]:
+        with stage("embed"):
+            return self._embed_query(text)
+
+    def _embed_query(self, text: str) -> List[float]:
+        vector = self._get_cached(text)
+        if vector is not None:
+            return vector
+
+        if self.batch_wait <= 0:
+            with self._lock:
+                self.misses += 1
+            vector = self.embeddings.embed_query(text)
+            self._put_cached(text, vector)
+            return vector
+
+        with self._lock:
+            self.misses += 1
+            future = self._pending.get(text)
+            if future is None:
+                future = Future()
+                self._pending[text] = future
+                self._queue.put((text, future))
+        self._ensure_worker()
+        return future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "batches": self.batches, "cached": len(self._cache)}
@@ -0,0 +1,162 @@
+# This file should be located at: main/index.py
+import os
+import json
+import time
+import threading
+from typing import List, Dict
+
+import numpy as np
+
+from .telemetry import get_logger, stage
+
+log = get_logger("index")
+
+# --- Prebuilt retrieval artifact (written by embed.py) ---
+# vectors.f32  row-major float32 matrix, one L2-normalized embedding per chunk
+# chunks.json  [{"text": ..., "metadata": {...}}, ...] in the same order as the rows
+# meta.json    {"model": ..., "dim": ..., "count": ..., "built_at": ...}, written last
+# manifest.json  per-file content and chunk hashes, used by embed.py for incremental updates
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.json"
+META_FILE = "meta.json"
+
+# How often a running worker checks meta.json for a newer build; 0 disables hot reload.
+INDEX_RELOAD_INTERVAL_SECONDS = float(os.getenv("INDEX_RELOAD_INTERVAL_SECONDS", "5"))
+
+
+class Chunk:
+    """Minimal stand-in for a LangChain Document: what agent.py reads from search results."""
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content: str, metadata: Dict):
+        self.page_content = page_content
+        self.metadata = metadata
+
+    def __repr__(self):
+        return f"Chunk(source={self.metadata.get('source')!r}, {self.page_content[:40]!r}...)"
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def index_exists(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, META_FILE))
+
+
+def write_index(index_dir: str, vectors, texts: List[str], metadatas: List[Dict], model_name: str):
+    """
+    Writes the artifact. Each file goes through a temporary name and an atomic rename,
+    and meta.json is written last, so readers never see a half-written index.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    chunks = [{"text": text, "metadata": metadata or {}} for text, metadata in zip(texts, metadatas)]
+    meta = {"model": model_name, "dim": int(matrix.shape[1]) if len(matrix) else 0,
+            "count": len(chunks), "built_at": time.time()}
+
+    def replace(name, data: bytes):
+        tmp_path = os.path.join(index_dir, f".{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(index_dir, name))
+
+    replace(VECTORS_FILE, np.ascontiguousarray(matrix).tobytes())
+    replace(CHUNKS_FILE, json.dumps(chunks, ensure_ascii=False).encode("utf-8"))
+    replace(META_FILE, json.dumps(meta).encode("utf-8"))
+    return meta
+
+
+class MmapIndex:
+    """
+    Brute-force cosine top-k over a memory-mapped embedding matrix.
+
+    The matrix is opened read-only with mmap, so every worker on a host shares the same
+    page-cache pages instead of holding its own copy. For a corpus of a few dozen chunks
+    a single matrix-vector product is faster than any ANN structure.
+    Exposes the same similarity_search(query, k) call agent.py used on Chroma.
+
+    When embed.py rewrites the artifact, running workers notice the new meta.json (checked
+    at most every reload_interval seconds, on search) and swap the index in place.
+    """
+
+    def __init__(self, index_dir: str, embeddings, reload_interval: float = INDEX_RELOAD_INTERVAL_SECONDS):
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._next_check = time.monotonic() + reload_interval
+        self._meta_mtime = self._current_mtime()
+        self._snapshot = self._load()
+
+    # (meta, chunks, vectors) is swapped as one tuple so a search never mixes two builds.
+    @property
+    def meta(self) -> Dict:
+        return self._snapshot[0]
+
+    @property
+    def chunks(self) -> List[Chunk]:
+        return self._snapshot[1]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._snapshot[2]
+
+    def _current_mtime(self):
+        try:
+            return os.stat(os.path.join(self.index_dir, META_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        with open(os.path.join(self.index_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(self.index_dir, CHUNKS_FILE), encoding="utf-8") as f:
+            chunks = [Chunk(c["text"], c["metadata"]) for c in json.load(f)]
+        count, dim = meta["count"], meta["dim"]
+        if len(chunks) != count:
+            raise ValueError(f"{CHUNKS_FILE} has {len(chunks)} chunks but {META_FILE} says {count}")
+        if count:
+            vectors = np.memmap(os.path.join(self.index_dir, VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+        return meta, chunks, vectors
+
+    def maybe_reload(self) -> bool:
+        """Reloads the artifact if meta.json changed since it was last read. Returns True on reload."""
+        if self.reload_interval <= 0 or time.monotonic() < self._next_check:
+            return False
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return False
+            self._next_check = time.monotonic() + self.reload_interval
+            mtime = self._current_mtime()
+            if mtime is None or mtime == self._meta_mtime:
+                return False
+            try:
+                snapshot = self._load()
+            except (OSError, ValueError) as e:
+                # Caught between two renames of a rebuild; keep serving the old index and retry later.
+                log.warning("Retrieval index: reload of %s deferred: %s", self.index_dir, e)
+                return False
+            self._snapshot = snapshot
+            self._meta_mtime = mtime
+        log.info("Retrieval index: reloaded %d chunks from %s.", snapshot[0]["count"], self.index_dir)
+        return True
+
+    def search_by_vector(self, query_vector, k: int = 3) -> List[Chunk]:
+        self.maybe_reload()
+        _, chunks, vectors = self._snapshot
+        if not len(chunks):
+            return []
+        with stage("search"):
+            query = np.asarray(query_vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            scores = vectors @ (query / norm if norm else query)
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            return [chunks[i] for i in top[np.argsort(-scores[top])]]
+
+    def similarity_search(self, query: str, k: int = 3) -> List[Chunk]:
+        return self.search_by_vector(self.embeddings.embed_query(query), k)
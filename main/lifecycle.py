@@ -0,0 +1,108 @@
+# This file should be located at: main/lifecycle.py
+import os
+import time
+import shutil
+import threading
+from typing import Optional, Tuple
+
+from .audio_cache import MemoryBackend
+from .telemetry import get_logger
+
+log = get_logger("lifecycle")
+
+# --- Configuration ---
+# Session folders untouched for this long are deleted by the sweeper.
+SESSION_DIR_TTL_SECONDS = int(os.getenv("SESSION_DIR_TTL_SECONDS", "3600"))
+SESSION_SWEEP_INTERVAL_SECONDS = int(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+# "disk" writes reply audio under sessions/<id>/audio_out, "memory" keeps it in a bounded
+# in-process store. Memory mode needs a single worker or sticky routing for /audio requests;
+# misses fall back to disk.
+AUDIO_OUTPUT_STORE = os.getenv("AUDIO_OUTPUT_STORE", "disk")
+AUDIO_OUTPUT_MAX_BYTES = int(os.getenv("AUDIO_OUTPUT_MAX_BYTES", str(128 * 1024 * 1024)))
+
+
+def touch(path: str):
+    """Marks a session folder as active so the sweeper leaves it alone."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def disk_usage(directory: str) -> Tuple[int, int]:
+    """Returns (bytes, inodes) used by everything under directory."""
+    total_bytes = 0
+    inodes = 0
+    for root, dirs, files in os.walk(directory):
+        inodes += len(dirs) + len(files)
+        for name in files:
+            try:
+                total_bytes += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total_bytes, inodes
+
+
+class SessionSweeper:
+    """
+    Background thread that deletes session folders idle for longer than ttl_seconds.
+
+    Activity is the folder's mtime, refreshed by touch() on every request. Every worker
+    may run a sweeper; concurrent deletions of the same folder are harmless.
+    """
+
+    def __init__(self, sessions_dir: str, ttl_seconds: int = SESSION_DIR_TTL_SECONDS,
+                 interval_seconds: int = SESSION_SWEEP_INTERVAL_SECONDS):
+        self.sessions_dir = sessions_dir
+        self.ttl_seconds = ttl_seconds
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep_once(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        try:
+            entries = list(os.scandir(self.sessions_dir))
+        except OSError:
+            return 0
+        for entry in entries:
+            # Only session folders are swept; files such as the session database stay.
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                if entry.stat().st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+        if removed:
+            log.info("Session sweeper removed %d idle session folder(s).", removed)
+        return removed
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.sweep_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+class AudioOutputStore:
+    """Bounded in-memory store for generated reply audio, served directly by /audio."""
+
+    def __init__(self, max_bytes: int = AUDIO_OUTPUT_MAX_BYTES):
+        self._backend = MemoryBackend(max_bytes=max_bytes)
+
+    def put(self, session_id: str, filename: str, data: bytes):
+        self._backend.put(f"{session_id}/{filename}", data)
+
+    def get(self, session_id: str, filename: str) -> Optional[bytes]:
+        return self._backend.get(f"{session_id}/{filename}")
@@ -0,0 +1,443 @@
+# This file should be located at: main/llm.py
+import os
+import json
+import time
+import base64
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import List, Dict, Optional, Iterator, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from .telemetry import get_logger
+
+# --- Load environment variables from the project root .env file ---
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(dotenv_path=os.path.join(project_root, '.env'))
+
+log = get_logger("llm")
+
+# --- Configuration ---
+# Comma-separated keys to rotate through. GENAI_API_KEY and GENAI_API_KEY_1 (the variables
+# agent.py and stt.py/tts.py used to read) are appended when set.
+GENAI_API_KEYS = os.getenv("GENAI_API_KEYS", "")
+# Point this at a local fake server (bench/fake_gemini.py) to run without the real API.
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+GEMINI_API_VERSION = os.getenv("GEMINI_API_VERSION", "v1beta")
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Keep-alive connections per host; sized for the gunicorn thread count.
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "64"))
+# A key that hit its quota (HTTP 429) sits out this long unless the server says otherwise.
+LLM_KEY_COOLDOWN_SECONDS = float(os.getenv("LLM_KEY_COOLDOWN_SECONDS", "30"))
+# Consecutive failures of one model that open its circuit, and how long it stays open.
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+PLACEHOLDER_KEYS = {"", "YOUR_GEMINI_API_KEY_HERE"}
+
+
+class LLMError(Exception):
+    """A Gemini call that failed after retries; `status` is the HTTP status if there was one."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(LLMError):
+    """Raised without a network call while a model's circuit breaker is open."""
+
+
+# --- Responses ---
+class LLMResponse:
+    """The parts of a generateContent response the app reads, plus how long the call took."""
+
+    def __init__(self, data: Dict, latency_ms: float = 0.0):
+        self.data = data
+        self.latency_ms = latency_ms
+
+    def _parts(self) -> List[Dict]:
+        candidates = self.data.get("candidates") or []
+        if not candidates:
+            feedback = self.data.get("promptFeedback", {})
+            raise ValueError(f"The response has no candidates (block reason: {feedback.get('blockReason', 'unknown')}).")
+        return (candidates[0].get("content") or {}).get("parts") or []
+
+    @property
+    def text(self) -> str:
+        return "".join(part.get("text", "") for part in self._parts())
+
+    @property
+    def audio(self) -> bytes:
+        """Decoded bytes of the first inline data part (e.g. TTS PCM)."""
+        for part in self._parts():
+            inline = part.get("inlineData") or part.get("inline_data")
+            if inline:
+                return base64.b64decode(inline["data"])
+        raise ValueError("The response has no inline data.")
+
+    @property
+    def usage(self) -> Dict:
+        return self.data.get("usageMetadata", {})
+
+
+class UploadedFile:
+    """A File API upload. Files belong to the key's project, so later calls must use the same key."""
+
+    def __init__(self, name: str, uri: str, mime_type: str, key: str):
+        self.name = name
+        self.uri = uri
+        self.mime_type = mime_type
+        self.key = key
+
+
+def _to_part(item) -> Dict:
+    if isinstance(item, str):
+        return {"text": item}
+    if isinstance(item, UploadedFile):
+        return {"file_data": {"mime_type": item.mime_type, "file_uri": item.uri}}
+    if isinstance(item, dict) and isinstance(item.get("data"), (bytes, bytearray)):
+        return {"inline_data": {"mime_type": item["mime_type"], "data": base64.b64encode(item["data"]).decode("ascii")}}
+    return item
+
+
+def build_request(contents, generation_config: Optional[Dict] = None) -> Dict:
+    """Request body for generateContent: a prompt string or a list of parts (text, audio dicts, uploads)."""
+    items = contents if isinstance(contents, list) else [contents]
+    body = {"contents": [{"role": "user", "parts": [_to_part(item) for item in items]}]}
+    if generation_config:
+        body["generationConfig"] = generation_config
+    return body
+
+
+# --- Key rotation ---
+class KeyPool:
+    """
+    Round-robin over API keys, skipping keys that are cooling down after a quota error
+    (HTTP 429) or were rejected as invalid (401/403, parked for ten cooldowns).
+    """
+
+    def __init__(self, keys: List[str], cooldown: float = LLM_KEY_COOLDOWN_SECONDS):
+        self.keys = keys
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._next = 0
+        self._resting_until = {key: 0.0 for key in keys}
+
+    def acquire(self) -> Optional[str]:
+        """The next usable key, or the one that recovers soonest if all are resting."""
+        if not self.keys:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            for offset in range(len(self.keys)):
+                key = self.keys[(self._next + offset) % len(self.keys)]
+                if self._resting_until[key] <= now:
+                    self._next = (self._next + offset + 1) % len(self.keys)
+                    return key
+            return min(self.keys, key=self._resting_until.get)
+
+    def rest(self, key: str, seconds: Optional[float] = None):
+        with self._lock:
+            self._resting_until[key] = time.monotonic() + (self.cooldown if seconds is None else seconds)
+
+    def available(self) -> int:
+        now = time.monotonic()
+        return sum(1 for until in self._resting_until.values() if until <= now)
+
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """
+    Closed -> open after `failures` consecutive failures; after `reset_seconds` one trial
+    call is let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record(self, success: bool):
+        with self._lock:
+            self._trial_in_flight = False
+            if success:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+
+
+# --- Per-call latency ---
+class CallStats:
+    """Counts and recent latencies per (model, method); listeners see every call as it finishes."""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """listener(model, method, latency_seconds, outcome) with outcome "ok", "error" or "rejected"."""
+        self._listeners.append(listener)
+
+    def record(self, model: str, method: str, latency: float, outcome: str):
+        with self._lock:
+            entry = self._calls.setdefault((model, method), {"ok": 0, "error": 0, "rejected": 0,
+                                                               "latencies": deque(maxlen=self.window)})
+            entry[outcome] += 1
+            if outcome != "rejected":
+                entry["latencies"].append(latency)
+        for listener in self._listeners:
+            try:
+                listener(model, method, latency, outcome)
+            except Exception as e:
+                log.warning("LLM stats listener failed: %s", e)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            result = {}
+            for (model, method), entry in self._calls.items():
+                latencies = sorted(entry["latencies"])
+                pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else None
+                result[f"{model}:{method}"] = {"ok": entry["ok"], "error": entry["error"], "rejected": entry["rejected"],
+                                               "p50_ms": pick(0.5), "p95_ms": pick(0.95)}
+            return result
+
+
+def _configured_keys() -> List[str]:
+    keys = [key.strip() for key in GENAI_API_KEYS.split(",")]
+    keys += [os.getenv("GENAI_API_KEY", ""), os.getenv("GENAI_API_KEY_1", "")]
+    unique = []
+    for key in keys:
+        if key not in PLACEHOLDER_KEYS and key not in unique:
+            unique.append(key)
+    return unique
+
+
+class LLMClient:
+    """
+    One process-wide Gemini REST client shared by agent.py, stt.py and tts.py.
+
+    A single requests.Session keeps pooled keep-alive connections. Every call gets
+    a connect/read timeout. Retryable failures (timeouts, connection errors, 408/429/5xx)
+    are retried with full-jitter exponential backoff on the next key of the pool, and
+    a per-model circuit breaker fails fast while a model keeps erroring.
+    """
+
+    def __init__(self, keys: Optional[List[str]] = None, base_url: str = GEMINI_BASE_URL,
+                 api_version: str = GEMINI_API_VERSION, max_retries: int = LLM_MAX_RETRIES,
+                 timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT), pool_size: int = LLM_POOL_SIZE):
+        self.keys = KeyPool(_configured_keys() if keys is None else keys)
+        self.base_url = base_url
+        self.api_version = api_version
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = CallStats()
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return bool(self.keys.keys)
+
+    def model(self, name: str) -> "GenerativeModel":
+        return GenerativeModel(self, name)
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._breakers_lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker()
+            return self._breakers[model]
+
+    # --- Transport ---
+    def _url(self, path: str, upload: bool = False) -> str:
+        return f"{self.base_url}/{'upload/' if upload else ''}{self.api_version}/{path}"
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None):
+        # Full jitter; a server-requested Retry-After is honoured up to the same cap.
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        time.sleep(max(delay, min(retry_after or 0, LLM_BACKOFF_MAX)))
+
+    def _request(self, model: str, method: str, http_method: str, url: str, key: Optional[str] = None,
+                 timeout=None, stream: bool = False, **kwargs) -> requests.Response:
+        """
+        Sends one logical call with retries. Returns the successful (2xx) response;
+        raises LLMError or CircuitOpenError. A pinned `key` is never rotated away from.
+        """
+        if key is None and not self.available:
+            raise LLMError("No Gemini API key configured (GENAI_API_KEYS / GENAI_API_KEY).")
+        breaker = self.breaker(model)
+        if not breaker.allow():
+            self.stats.record(model, method, 0.0, "rejected")
+            raise CircuitOpenError(f"Circuit open for {model}; failing fast.")
+
+        extra_headers = kwargs.pop("headers", None) or {}
+        start = time.perf_counter()
+        error = None
+        # Every way out records an outcome; otherwise a half-open trial would never be released.
+        healthy = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                call_key = key or self.keys.acquire()
+                headers = dict(extra_headers, **{"x-goog-api-key": call_key})
+                retry_after = None
+                try:
+                    response = self.session.request(http_method, url, headers=headers, timeout=timeout or self.timeout,
+                                                    stream=stream, **kwargs)
+                except requests.RequestException as e:
+                    error = LLMError(f"{model} {method}: {e}")
+                else:
+                    if response.status_code < 300:
+                        healthy = True
+                        self.stats.record(model, method, time.perf_counter() - start, "ok")
+                        return response
+                    status = response.status_code
+                    error = LLMError(f"{model} {method}: HTTP {status}: {response.text[:300]}", status)
+                    retry_after = _retry_after(response)
+                    response.close()
+                    if status == 429:
+                        self.keys.rest(call_key, retry_after)
+                    elif status in (401, 403):
+                        self.keys.rest(call_key, self.keys.cooldown * 10)
+                    # A key-specific failure is worth retrying on another key, unless the key is pinned.
+                    other_key = key is None and status in (401, 403, 429) and self.keys.available() > 0
+                    if status not in RETRYABLE_STATUS and not other_key:
+                        break
+                    if other_key and attempt < self.max_retries:
+                        continue
+                if attempt < self.max_retries:
+                    self._backoff(attempt, retry_after)
+            # Client errors (bad request, bad key) say nothing about the model's health.
+            healthy = error.status is not None and error.status < 500 and error.status not in (408, 429)
+            self.stats.record(model, method, time.perf_counter() - start, "error")
+            raise error
+        finally:
+            breaker.record(healthy)
+
+    # --- API ---
+    def generate(self, model: str, contents, generation_config: Optional[Dict] = None,
+                 key: Optional[str] = None, timeout=None) -> LLMResponse:
+        start = time.perf_counter()
+        response = self._request(model, "generate", "POST", self._url(f"{_model_path(model)}:generateContent"),
+                                 key=key, timeout=timeout, json=build_request(contents, generation_config))
+        return LLMResponse(response.json(), (time.perf_counter() - start) * 1000)
+
+    def stream(self, model: str, contents, generation_config: Optional[Dict] = None,
+               key: Optional[str] = None, timeout=None) -> Iterator[LLMResponse]:
+        """
+        Yields one LLMResponse per server-sent event. Retries only cover establishing the
+        stream; a connection lost mid-way surfaces as an LLMError to the caller.
+        """
+        start = time.perf_counter()
+        response = self._request(model, "stream", "POST", self._url(f"{_model_path(model)}:streamGenerateContent"),
+                                 key=key, timeout=timeout, stream=True, params={"alt": "sse"},
+                                 json=build_request(contents, generation_config))
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    yield LLMResponse(json.loads(line[5:]), (time.perf_counter() - start) * 1000)
+        except requests.RequestException as e:
+            raise LLMError(f"{model} stream: {e}")
+        finally:
+            response.close()
+
+    def upload_file(self, data: bytes, mime_type: str, display_name: str = "upload") -> UploadedFile:
+        """Resumable-protocol upload in two requests (start, then upload+finalize) on one pinned key."""
+        key = self.keys.acquire()
+        start = self._request("files", "upload", "POST", self._url("files", upload=True), key=key, headers={
+            "X-Goog-Upload-Protocol": "resumable", "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(len(data)), "X-Goog-Upload-Header-Content-Type": mime_type,
+        }, json={"file": {"display_name": display_name}})
+        upload_url = start.headers["X-Goog-Upload-URL"]
+        response = self._request("files", "upload", "POST", upload_url, key=key, headers={
+            "X-Goog-Upload-Offset": "0", "X-Goog-Upload-Command": "upload, finalize",
+        }, data=data)
+        info = response.json()["file"]
+        return UploadedFile(info["name"], info["uri"], info.get("mimeType", mime_type), key)
+
+    def delete_file(self, uploaded: UploadedFile):
+        self._request("files", "delete", "DELETE", self._url(uploaded.name), key=uploaded.key)
+
+
+def _model_path(model: str) -> str:
+    return model if model.startswith("models/") else f"models/{model}"
+
+
+def _retry_after(response) -> Optional[float]:
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class GenerativeModel:
+    """
+    Model handle with the call shape of google.generativeai.GenerativeModel that the
+    rest of the app was written against (generate_content / generate_content_async).
+    """
+
+    def __init__(self, client: LLMClient, name: str):
+        self.client = client
+        self.name = name
+
+    def generate_content(self, contents, generation_config: Optional[Dict] = None, stream: bool = False,
+                         key: Optional[str] = None, timeout=None) -> Union[LLMResponse, Iterator[LLMResponse]]:
+        if stream:
+            return self.client.stream(self.name, contents, generation_config, key=key, timeout=timeout)
+        return self.client.generate(self.name, contents, generation_config, key=key, timeout=timeout)
+
+    async def generate_content_async(self, contents, generation_config: Optional[Dict] = None,
+                                     key: Optional[str] = None, timeout=None) -> LLMResponse:
+        # Blocking I/O on the pooled session, off the event loop.
+        return await asyncio.to_thread(self.client.generate, self.name, contents, generation_config, key, timeout)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> LLMClient:
+    """The shared client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
@@ -0,0 +1,121 @@
+# This file should be located at: main/onnx_embeddings.py
+import os
+import threading
+from typing import List
+
+import numpy as np
+
+from .telemetry import get_logger
+
+log = get_logger("onnx_embeddings")
+
+# --- Configuration ---
+# The sentence-transformers repos ship ONNX exports next to the PyTorch weights:
+# onnx/model.onnx (fp32), onnx/model_quint8_avx2.onnx (int8, any x86-64 with AVX2),
+# onnx/model_qint8_avx512.onnx, onnx/model_qint8_avx512_vnni.onnx and onnx/model_qint8_arm64.onnx.
+ONNX_EMBEDDING_FILE = os.getenv("ONNX_EMBEDDING_FILE", "onnx/model_quint8_avx2.onnx")
+# A local copy of the repo (tokenizer.json + ONNX_EMBEDDING_FILE) for hosts without network access;
+# otherwise the files are fetched once from the Hugging Face Hub into its cache.
+ONNX_EMBEDDING_MODEL_DIR = os.getenv("ONNX_EMBEDDING_MODEL_DIR", "")
+# Intra-op threads per process; 0 lets onnxruntime use one per physical core.
+ONNX_EMBEDDING_THREADS = int(os.getenv("ONNX_EMBEDDING_THREADS", "0"))
+ONNX_EMBEDDING_BATCH_SIZE = int(os.getenv("ONNX_EMBEDDING_BATCH_SIZE", "32"))
+# Same limit as sentence-transformers (max_seq_length of all-MiniLM-L6-v2); longer text is truncated.
+ONNX_EMBEDDING_MAX_TOKENS = int(os.getenv("ONNX_EMBEDDING_MAX_TOKENS", "256"))
+
+
+class OnnxEmbeddings:
+    """
+    Sentence embeddings from an ONNX export of a sentence-transformers model, run with
+    onnxruntime and the Rust tokenizers library instead of torch.
+
+    Reproduces the sentence-transformers pipeline (mean pooling over the attention mask,
+    then L2 normalization), so vectors land in the same space as the torch backend's and
+    the existing index stays usable. The int8 export differs from fp32 by quantization
+    noise only; bench/embedding_backends.py measures how much.
+
+    The inference session is created on first use in each process: onnxruntime's thread
+    pool does not survive fork(), so the gunicorn master only loads the tokenizer and
+    resolves the model file.
+    """
+
+    def __init__(self, model_name: str, model_file: str = ONNX_EMBEDDING_FILE, model_dir: str = ONNX_EMBEDDING_MODEL_DIR,
+                 threads: int = ONNX_EMBEDDING_THREADS, batch_size: int = ONNX_EMBEDDING_BATCH_SIZE,
+                 max_tokens: int = ONNX_EMBEDDING_MAX_TOKENS):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise RuntimeError("EMBEDDING_BACKEND=onnx requires the 'onnxruntime' and 'tokenizers' packages. "
+                               "Install them using 'pip install -r requirements-onnx.txt'")
+        self._ort = onnxruntime
+        self.model_name = model_name
+        self.threads = threads
+        self.batch_size = max(1, batch_size)
+        self.model_path = self._resolve(model_name, model_dir, model_file)
+        self.tokenizer = Tokenizer.from_file(self._resolve(model_name, model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_tokens)
+        self.tokenizer.no_padding()
+        self._pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self._session = None
+        self._input_names = ()
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    @staticmethod
+    def _resolve(model_name, model_dir, filename):
+        if model_dir:
+            return os.path.join(model_dir, filename)
+        from huggingface_hub import hf_hub_download
+        repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        return hf_hub_download(repo_id, filename)
+
+    def _reset_after_fork(self):
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    options = self._ort.SessionOptions()
+                    options.intra_op_num_threads = self.threads
+                    options.inter_op_num_threads = 1
+                    options.graph_optimization_level = self._ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    session = self._ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+                    self._input_names = tuple(i.name for i in session.get_inputs())
+                    log.info("ONNX embedding session ready: %s", os.path.basename(self.model_path))
+                    self._session = session
+        return self._session
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """One forward pass over texts, padded to the longest of them; returns normalized rows."""
+        encodings = self.tokenizer.encode_batch(texts)
+        length = max(len(e.ids) for e in encodings)
+        ids = np.full((len(texts), length), self._pad_id, dtype=np.int64)
+        mask = np.zeros((len(texts), length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            ids[row, :len(encoding.ids)] = encoding.ids
+            mask[row, :len(encoding.ids)] = 1
+        feeds = {"input_ids": ids, "attention_mask": mask, "token_type_ids": np.zeros_like(ids)}
+        session = self._get_session()
+        tokens = session.run(None, {name: feeds[name] for name in self._input_names})[0]
+
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (tokens * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Similar lengths share a batch, so little compute goes to padding.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._encode([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
@@ -0,0 +1,186 @@
+# This file should be located at: main/prompt_builder.py
+import os
+import re
+import math
+from functools import lru_cache
+from typing import List, Dict, Callable, Optional
+
+from .prompt import prompt as main_prompt
+
+# --- Configuration (all sizes in estimated tokens) ---
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2400"))
+# Upper bounds for each section; the overall budget wins if they add up to more.
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "700"))
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "450"))
+# Part of the history budget reserved for the one-line-per-turn summary of older turns.
+PROMPT_SUMMARY_TOKENS = int(os.getenv("PROMPT_SUMMARY_TOKENS", "150"))
+# Most recent turns (user + ganesha pairs) that are always rendered verbatim when they fit.
+PROMPT_VERBATIM_TURNS = int(os.getenv("PROMPT_VERBATIM_TURNS", "2"))
+
+SENTENCE_RE = re.compile(r"(.+?[.!?।॥])(\s|$)", re.S)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Offline token estimate: about 4 bytes of UTF-8 per token. This tracks Gemini's count for
+    English and, since Devanagari is 3 bytes a character, stays close for Hindi and Marathi too.
+    """
+    return math.ceil(len(text.encode("utf-8")) / 4) if text else 0
+
+
+def message_text(message: Dict) -> str:
+    """
+    What the model needs to see of a stored message. Ganesha turns are stored as the whole
+    GaneshResponse dict; only the answer carries conversational context.
+    """
+    content = message.get("content")
+    if isinstance(content, dict):
+        return content.get("answer", "")
+    return str(content or "")
+
+
+def _clip_words(text: str, max_words: int) -> str:
+    words = text.split()
+    return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+
+@lru_cache(maxsize=4096)
+def summarize_turn(question: str, answer: str) -> str:
+    """One-line extractive summary of an older turn; memoized, so each turn is compressed once."""
+    match = SENTENCE_RE.match(answer.strip())
+    first_sentence = match.group(1) if match else answer
+    return f"- user asked: {_clip_words(question, 20)} / you said: {_clip_words(first_sentence, 25)}"
+
+
+def _pair_turns(history: List[Dict]) -> List[tuple]:
+    """Groups history into (question, answer) turns, oldest first."""
+    turns = []
+    question = None
+    for message in history:
+        if message.get("role") == "user":
+            if question is not None:
+                turns.append((question, ""))
+            question = message_text(message)
+        else:
+            turns.append((question or "", message_text(message)))
+            question = None
+    if question is not None:
+        turns.append((question, ""))
+    return turns
+
+
+class PromptBuild:
+    """The rendered prompt plus per-section token counts, for logging and metrics."""
+    __slots__ = ("prompt", "docs", "tokens", "turns_verbatim", "turns_summarized", "turns_dropped", "chunks_dropped")
+
+    def __init__(self, prompt, docs, tokens, turns_verbatim, turns_summarized, turns_dropped, chunks_dropped):
+        self.prompt = prompt
+        self.docs = docs
+        self.tokens = tokens
+        self.turns_verbatim = turns_verbatim
+        self.turns_summarized = turns_summarized
+        self.turns_dropped = turns_dropped
+        self.chunks_dropped = chunks_dropped
+
+    def describe(self) -> str:
+        t = self.tokens
+        return (f"{t['total']} tokens (context {t['context']}, history {t['history']}, summary {t['summary']}, "
+                f"question {t['question']}, template {t['template']}); {self.turns_verbatim} turn(s) verbatim, "
+                f"{self.turns_summarized} summarized, {self.turns_dropped} dropped, {self.chunks_dropped} chunk(s) dropped")
+
+
+class PromptBuilder:
+    """
+    Renders main_prompt within a token budget.
+
+    History is rendered compactly (answer text only). The newest turns are kept verbatim,
+    older ones are folded into a short running summary, and whatever still does not fit
+    is dropped oldest first. Context chunks are added in retrieval order until the
+    context budget is spent.
+    """
+
+    def __init__(self, template: str = main_prompt, budget: int = PROMPT_TOKEN_BUDGET,
+                 context_tokens: int = PROMPT_CONTEXT_TOKENS, history_tokens: int = PROMPT_HISTORY_TOKENS,
+                 summary_tokens: int = PROMPT_SUMMARY_TOKENS, verbatim_turns: int = PROMPT_VERBATIM_TURNS,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.template = template
+        self.budget = budget
+        self.context_tokens = context_tokens
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.verbatim_turns = verbatim_turns
+        self.count_tokens = count_tokens
+        self.template_tokens = count_tokens(template.format(context="", history="", question=""))
+
+    def search_query(self, user_input: str, history: List[Dict]) -> str:
+        """Retrieval query: the previous question gives follow-ups their subject, answers only add noise."""
+        previous = [message_text(m) for m in history if m.get("role") == "user"][-1:]
+        lines = [f"user: {text}" for text in previous]
+        return "\n".join(lines) + f"\n\nuser: {user_input}"
+
+    def _render_history(self, history: List[Dict], budget: int):
+        turns = _pair_turns(history)
+        verbatim = []
+        used = 0
+        # Newest first: a verbatim turn is kept only if it fits and is among the last few.
+        for question, answer in reversed(turns):
+            if len(verbatim) >= self.verbatim_turns:
+                break
+            block = f"user: {question}" + (f"\nganesha: {answer}" if answer else "")
+            cost = self.count_tokens(block) + 1
+            if used + cost > budget:
+                break
+            verbatim.insert(0, block)
+            used += cost
+
+        older = turns[:len(turns) - len(verbatim)]
+        summary_budget = min(self.summary_tokens, budget - used)
+        summary_lines = []
+        summary_used = 0
+        for question, answer in reversed(older):
+            line = summarize_turn(question, answer)
+            cost = self.count_tokens(line) + 1
+            if summary_used + cost > summary_budget:
+                break
+            summary_lines.insert(0, line)
+            summary_used += cost
+
+        parts = []
+        if summary_lines:
+            parts.append("Earlier in this conversation:\n" + "\n".join(summary_lines))
+        parts.extend(verbatim)
+        text = "\n".join(parts)
+        dropped = len(older) - len(summary_lines)
+        return text, used, summary_used, len(verbatim), len(summary_lines), dropped
+
+    def _render_context(self, docs, budget: int):
+        kept = []
+        used = 0
+        for doc in docs:
+            cost = self.count_tokens(doc.page_content) + 1
+            if used + cost > budget and kept:
+                break
+            kept.append(doc)
+            used += cost
+        return kept, used
+
+    def build(self, user_input: str, history: Optional[List[Dict]], docs) -> PromptBuild:
+        history = history or []
+        question_tokens = self.count_tokens(user_input)
+        available = max(0, self.budget - self.template_tokens - question_tokens)
+
+        kept_docs, context_used = self._render_context(docs, min(self.context_tokens, available))
+        available = max(0, available - context_used)
+        history_text, history_used, summary_used, verbatim, summarized, dropped = \
+            self._render_history(history, min(self.history_tokens, available))
+
+        prompt = self.template.format(
+            context="\n\n".join(doc.page_content for doc in kept_docs),
+            history=history_text,
+            question=user_input
+        )
+        tokens = {
+            "template": self.template_tokens, "question": question_tokens, "context": context_used,
+            "history": history_used, "summary": summary_used, "total": self.count_tokens(prompt),
+        }
+        return PromptBuild(prompt, kept_docs, tokens, verbatim, summarized, dropped, len(docs) - len(kept_docs))
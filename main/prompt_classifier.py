@@ -33,4 +33,15 @@ Answer: NO
 Analyze the following user question and respond with only a single word: YES or NO.
 
 User Question: "{question}"
-"""
\ No newline at end of file
+"""
+
+# --- The few-shot examples above as labeled data, used to seed the local intent router ---
+EXAMPLES = [
+    ("Hello", "YES"),
+    ("How do I write a for-loop in Python?", "NO"),
+    ("What do your four arms symbolize?", "YES"),
+    ("My project at work feels like an insurmountable obstacle.", "YES"),
+    ("Why did Lord Shiva behead you in your story?", "YES"),
+    ("तुमने अपने बाई को कैसे मारा?", "YES"),
+    ("I want to hurt someone, can you help me?", "NO"),
+]
@@ -0,0 +1,209 @@
+# This file should be located at: main/retrieval.py
+import os
+import re
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import List, Tuple
+
+from .index import Chunk
+from .telemetry import get_logger, stage
+
+log = get_logger("retrieval")
+
+# --- Configuration ---
+# "hybrid" fuses BM25 and vector rankings; "vector" or "bm25" use one of them alone.
+# "vector" is what agent.py always did; switch the default once bench/eval_retrieval.py has
+# compared recall for all three modes with the real embedding model.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+# How many candidates each ranker contributes before fusion (and reranking).
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))
+# Reciprocal-rank-fusion constant: larger values flatten the advantage of the top ranks.
+RETRIEVAL_RRF_K = float(os.getenv("RETRIEVAL_RRF_K", "60"))
+RETRIEVAL_BM25_WEIGHT = float(os.getenv("RETRIEVAL_BM25_WEIGHT", "1.0"))
+RETRIEVAL_VECTOR_WEIGHT = float(os.getenv("RETRIEVAL_VECTOR_WEIGHT", "1.0"))
+# Optional cross-encoder (sentence-transformers) that reorders the fused candidates,
+# e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2". Empty disables reranking.
+RETRIEVAL_RERANK_MODEL = os.getenv("RETRIEVAL_RERANK_MODEL", "")
+
+TOKEN_RE = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a an and are as at be by did do does for from had has have he her his how i in is it its me my
+of on or our she so that the their them they this to was we were what when where which who why
+will with you your yours
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords; a trailing possessive/plural 's' is dropped."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over an in-memory inverted index (term -> [(chunk id, term frequency)])."""
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((doc_id, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        n = len(self.lengths)
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self.postings.items()}
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Returns up to k (chunk id, score) pairs, best first. Only chunks sharing a term are scored."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+class LazyVectorStore:
+    """Opens the vector store (MmapIndex or Chroma) on first use; everything else is forwarded to it."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._store = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._store is not None
+
+    def load(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = self._factory()
+        return self._store
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+def _chunks_of(store) -> List[Chunk]:
+    """The chunk list behind a vector store: MmapIndex exposes it, Chroma has to be asked."""
+    chunks = getattr(store, "chunks", None)
+    if chunks is not None:
+        return chunks
+    data = store.get(include=["documents", "metadatas"])
+    return [Chunk(text, metadata or {}) for text, metadata in zip(data["documents"], data["metadatas"])]
+
+
+class HybridRetriever:
+    """
+    Lexical + semantic retrieval over the lore chunks with the vector store's
+    similarity_search(query, k) interface, so agent.py can use either interchangeably.
+
+    BM25 catches exact names (Vyasa, Kubera, Ekadanta) that MiniLM embeddings blur, the
+    vector search catches paraphrases; their rankings are merged with weighted reciprocal
+    rank fusion, which needs no score calibration between the two. An optional
+    cross-encoder then reorders the fused candidates.
+    """
+
+    def __init__(self, vector_store, mode: str = RETRIEVAL_MODE, candidates: int = RETRIEVAL_CANDIDATES,
+                 rrf_k: float = RETRIEVAL_RRF_K, rerank_model: str = RETRIEVAL_RERANK_MODEL):
+        self.vector_store = vector_store
+        self.mode = mode
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.rerank_model = rerank_model
+        self._reranker = None
+        self._lock = threading.Lock()
+        self._source = None
+        self._chunks = []
+        self._bm25 = None
+
+    # --- Lexical index, rebuilt whenever the vector store swaps in a new build ---
+    def _lexical(self):
+        source = getattr(self.vector_store, "chunks", None)
+        if self._bm25 is None or (source is not None and source is not self._source):
+            with self._lock:
+                source = getattr(self.vector_store, "chunks", None)
+                if self._bm25 is None or (source is not None and source is not self._source):
+                    chunks = _chunks_of(self.vector_store)
+                    self._bm25 = BM25Index([chunk.page_content for chunk in chunks])
+                    self._chunks = chunks
+                    self._source = source
+        return self._chunks, self._bm25
+
+    # --- Rankers ---
+    def bm25_search(self, query: str, k: int) -> List[Chunk]:
+        chunks, bm25 = self._lexical()
+        with stage("search"):
+            return [chunks[doc_id] for doc_id, _ in bm25.search(query, k)]
+
+    def vector_search(self, query: str, k: int) -> List[Chunk]:
+        return self.vector_store.similarity_search(query, k=k)
+
+    def _fuse(self, rankings: List[Tuple[float, List[Chunk]]]) -> List[Chunk]:
+        scores = {}
+        chunks = {}
+        for weight, ranking in rankings:
+            for rank, chunk in enumerate(ranking):
+                # Chunk objects differ between stores, so identity is the text itself.
+                key = chunk.page_content
+                chunks.setdefault(key, chunk)
+                scores[key] = scores.get(key, 0.0) + weight / (self.rrf_k + rank + 1)
+        return [chunks[key] for key in sorted(scores, key=lambda key: -scores[key])]
+
+    def _load_reranker(self):
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    from sentence_transformers import CrossEncoder
+                    log.info("Retrieval: Loading reranker %s...", self.rerank_model)
+                    self._reranker = CrossEncoder(self.rerank_model)
+        return self._reranker
+
+    def _rerank(self, query: str, candidates: List[Chunk]) -> List[Chunk]:
+        reranker = self._load_reranker()
+        with stage("search"):
+            scores = reranker.predict([(query, chunk.page_content) for chunk in candidates])
+        order = sorted(range(len(candidates)), key=lambda i: -scores[i])
+        return [candidates[i] for i in order]
+
+    def warm_up(self):
+        """Builds the lexical index and loads the reranker now rather than on the first query."""
+        if self.mode != "vector":
+            self._lexical()
+        if self.mode == "hybrid" and self.rerank_model:
+            self._load_reranker()
+
+    def similarity_search(self, query: str, k: int = 3) -> List[Chunk]:
+        # Only the vector path reaches MmapIndex.search_by_vector, so lore ingested by
+        # main/embed.py is picked up here for every mode; _lexical() then sees new chunks.
+        maybe_reload = getattr(self.vector_store, "maybe_reload", None)
+        if maybe_reload is not None:
+            maybe_reload()
+        if self.mode == "vector":
+            return self.vector_search(query, k)
+        if self.mode == "bm25":
+            return self.bm25_search(query, k)
+
+        pool = max(k, self.candidates)
+        fused = self._fuse([
+            (RETRIEVAL_BM25_WEIGHT, self.bm25_search(query, pool)),
+            (RETRIEVAL_VECTOR_WEIGHT, self.vector_search(query, pool)),
+        ])
+        if self.rerank_model:
+            fused = self._rerank(query, fused[:pool])
+        return fused[:k]
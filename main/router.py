@@ -0,0 +1,134 @@
+# This file should be located at: main/router.py
+import os
+import threading
+from typing import Optional, List, Tuple
+
+import numpy as np
+
+from .prompt_classifier import EXAMPLES as CLASSIFIER_EXAMPLES
+from .embedding import canonical_text
+from .telemetry import get_logger, ROUTER_DECISIONS
+
+log = get_logger("router")
+
+# --- Configuration ---
+# "llm": always ask Gemini, "local": never ask Gemini, "hybrid": ask Gemini only when unsure.
+# Defaults to "llm" until the band below is calibrated against all-MiniLM-L6-v2 with
+# bench/eval_router.py; set ROUTER_MODE=hybrid once its numbers justify it.
+ROUTER_MODE = os.getenv("ROUTER_MODE", "llm")
+# The score is (similarity to on-topic examples) - (similarity to off-topic examples).
+# Inside (NO_BELOW, YES_ABOVE) the local router is unsure and defers to the LLM classifier.
+ROUTER_YES_ABOVE = float(os.getenv("ROUTER_YES_ABOVE", "0.08"))
+ROUTER_NO_BELOW = float(os.getenv("ROUTER_NO_BELOW", "-0.08"))
+ROUTER_TOP_K = int(os.getenv("ROUTER_TOP_K", "3"))
+
+# --- Labeled seed examples, on top of the few-shot examples in prompt_classifier.py ---
+SEED_EXAMPLES: List[Tuple[str, str]] = CLASSIFIER_EXAMPLES + [
+    ("Namaste Ganesha", "YES"),
+    ("Good morning, Bappa!", "YES"),
+    ("Who are your parents?", "YES"),
+    ("Tell me the story of how you got the elephant head.", "YES"),
+    ("Why is your tusk broken?", "YES"),
+    ("Why do you ride a mouse?", "YES"),
+    ("What is a modak and why do you love it?", "YES"),
+    ("How is Ganesh Chaturthi celebrated?", "YES"),
+    ("Why do we immerse your idol in water on Anant Chaturdashi?", "YES"),
+    ("What is the race you had with Kartikeya?", "YES"),
+    ("Why are you called Vighnaharta?", "YES"),
+    ("What does your big belly symbolize?", "YES"),
+    ("Why are you worshipped first before any ceremony?", "YES"),
+    ("Who wrote the Mahabharata with you?", "YES"),
+    ("I failed my exam and feel hopeless, what should I do?", "YES"),
+    ("How can I find peace when my family is fighting?", "YES"),
+    ("Give me some wisdom for starting a new business.", "YES"),
+    ("How do I stay patient during hard times?", "YES"),
+    ("Bless me for my new journey.", "YES"),
+    ("गणेश चतुर्थी क्यों मनाई जाती है?", "YES"),
+    ("बाप्पा, मला आशीर्वाद द्या", "YES"),
+    ("விநாயகர் சதுர்த்தி எப்படி கொண்டாடப்படுகிறது?", "YES"),
+    ("Write a Python function to sort a list.", "NO"),
+    ("Fix this JavaScript error: undefined is not a function.", "NO"),
+    ("What is the derivative of x squared?", "NO"),
+    ("Solve 2x + 5 = 11.", "NO"),
+    ("Explain quantum entanglement.", "NO"),
+    ("Who should I vote for in the next election?", "NO"),
+    ("What do you think of the prime minister's policies?", "NO"),
+    ("How do I sue my landlord?", "NO"),
+    ("What dosage of paracetamol should I take for fever?", "NO"),
+    ("Diagnose my chest pain.", "NO"),
+    ("How do I make a bomb?", "NO"),
+    ("Tell me a racist joke.", "NO"),
+    ("Insult my friend in the worst way possible.", "NO"),
+    ("Which stocks should I buy this week?", "NO"),
+    ("Write SQL to join two tables.", "NO"),
+    ("How do I hack my neighbour's wifi?", "NO"),
+]
+
+
+class LocalIntentRouter:
+    """
+    On-topic / off-topic classifier over the sentence-transformer embeddings.
+
+    A question is scored by the mean similarity of its top-k nearest on-topic examples
+    minus that of its top-k nearest off-topic examples. Confident scores are answered
+    locally; scores inside the confidence band return None so the caller can fall back
+    to the LLM classifier.
+    """
+
+    def __init__(self, embeddings, examples: List[Tuple[str, str]] = SEED_EXAMPLES,
+                 yes_above: float = ROUTER_YES_ABOVE, no_below: float = ROUTER_NO_BELOW,
+                 top_k: int = ROUTER_TOP_K):
+        self.embeddings = embeddings
+        self.examples = examples
+        self.yes_above = yes_above
+        self.no_below = no_below
+        self.top_k = top_k
+        self._yes = None
+        self._no = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _fit(self):
+        # Examples are embedded on first use so importing the router stays cheap.
+        with self._lock:
+            if self._yes is not None:
+                return
+            texts = [question for question, _ in self.examples]
+            vectors = self._normalize_rows(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+            labels = np.array([label == "YES" for _, label in self.examples])
+            self._no = vectors[~labels]
+            self._yes = vectors[labels]
+
+    def warm_up(self):
+        """Embeds the seed examples now rather than on the first question."""
+        self._fit()
+
+    def _top_k_mean(self, examples: np.ndarray, query: np.ndarray) -> float:
+        similarities = examples @ query
+        k = min(self.top_k, len(similarities))
+        return float(np.mean(np.partition(similarities, -k)[-k:]))
+
+    def score(self, question: str) -> float:
+        self._fit()
+        query = self._normalize_rows(np.asarray(self.embeddings.embed_query(canonical_text(question)), dtype=np.float32))
+        return self._top_k_mean(self._yes, query) - self._top_k_mean(self._no, query)
+
+    def route(self, question: str, always_decide: bool = False) -> Optional[str]:
+        """
+        Returns 'YES' or 'NO' when confident, None when the LLM classifier should decide.
+        With always_decide=True, ambiguous questions are decided by the sign of the score.
+        """
+        score = self.score(question)
+        if score >= self.yes_above or (always_decide and score >= 0):
+            verdict = 'YES'
+        elif score <= self.no_below or always_decide:
+            verdict = 'NO'
+        else:
+            verdict = None
+        ROUTER_DECISIONS.labels("local", verdict or "deferred").inc()
+        log.debug("Local router score %+.3f -> %s", score, verdict or "ambiguous, deferring to LLM")
+        return verdict
@@ -0,0 +1,246 @@
+# This file should be located at: main/sessions.py
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict
+
+# --- Configuration ---
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# "memory" (single process), "sqlite" (shared by the workers of one host) or "redis".
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(PROJECT_ROOT, "sessions", "sessions.sqlite3"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# The prompt builder keeps the newest turns verbatim and summarizes the rest, so
+# a bounded window of older messages is kept for it (main/prompt_builder.py).
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+SESSION_IDLE_TTL_SECONDS = int(os.getenv("SESSION_IDLE_TTL_SECONDS", "3600"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+
+
+def encode_message(role: str, content) -> bytes:
+    """Compact wire form of one chat message: a two-element JSON array without whitespace."""
+    return json.dumps([role, content], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_message(data: bytes) -> Dict:
+    role, content = json.loads(data)
+    return {"role": role, "content": content}
+
+
+def encode_history(messages: List[bytes]) -> bytes:
+    return b"\n".join(messages)
+
+
+def decode_history(blob) -> List[bytes]:
+    return blob.split(b"\n") if blob else []
+
+
+class SessionStore:
+    """
+    Interface for chat history storage.
+
+    Histories are returned in the same shape agent.py expects
+    ([{"role": ..., "content": ...}, ...]) and never hold more than max_messages.
+    """
+
+    def __init__(self, max_messages: int = SESSION_MAX_MESSAGES, idle_ttl: int = SESSION_IDLE_TTL_SECONDS):
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+
+    def get_history(self, session_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def append_turn(self, session_id: str, user_text: str, ganesha_content):
+        raise NotImplementedError
+
+    def evict_idle(self) -> int:
+        """Drops sessions idle for longer than idle_ttl; returns how many were removed."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+    def _append(self, blob, user_text, ganesha_content) -> bytes:
+        messages = decode_history(blob)
+        messages.append(encode_message("user", user_text))
+        messages.append(encode_message("ganesha", ganesha_content))
+        return encode_history(messages[-self.max_messages:])
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store: one bytes blob per session, LRU-ordered by last activity."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (blob, last_seen)
+        self._lock = threading.Lock()
+
+    def get_history(self, session_id):
+        with self._lock:
+            item = self._sessions.get(session_id)
+        if item is None or time.time() - item[1] > self.idle_ttl:
+            return []
+        return [decode_message(m) for m in decode_history(item[0])]
+
+    def append_turn(self, session_id, user_text, ganesha_content):
+        with self._lock:
+            item = self._sessions.pop(session_id, None)
+            blob = item[0] if item and time.time() - item[1] <= self.idle_ttl else b""
+            self._sessions[session_id] = (self._append(blob, user_text, ganesha_content), time.time())
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self.evict_idle()
+
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_ttl
+        removed = 0
+        with self._lock:
+            # Sessions are ordered by last activity, so expired ones sit at the front.
+            while self._sessions:
+                session_id, (_, last_seen) = next(iter(self._sessions.items()))
+                if last_seen > cutoff:
+                    break
+                del self._sessions[session_id]
+                removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            payload = sum(len(blob) for blob, _ in self._sessions.values())
+            overhead = sum(sys.getsizeof(session_id) + sys.getsizeof(blob) - len(blob) + 64
+                           for session_id, (blob, _) in self._sessions.items())
+            return {"backend": "memory", "sessions": len(self._sessions), "payload_bytes": payload,
+                    "approx_memory_bytes": payload + overhead}
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite-backed store shared by every worker on the host and persistent across restarts.
+    Each append runs in an IMMEDIATE transaction so concurrent workers don't lose turns.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        # SQLite connections must not cross fork() (gunicorn preload); children open their own.
+        os.register_at_fork(after_in_child=self._forget_connections)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, history BLOB NOT NULL, last_seen REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions(last_seen)")
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get_history(self, session_id):
+        row = self._connect().execute(
+            "SELECT history FROM sessions WHERE session_id = ? AND last_seen > ?",
+            (session_id, time.time() - self.idle_ttl)
+        ).fetchone()
+        return [decode_message(m) for m in decode_history(row[0])] if row else []
+
+    def append_turn(self, session_id, user_text, ganesha_content):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT history FROM sessions WHERE session_id = ? AND last_seen > ?",
+                (session_id, now - self.idle_ttl)
+            ).fetchone()
+            blob = self._append(row[0] if row else b"", user_text, ganesha_content)
+            conn.execute(
+                "INSERT INTO sessions (session_id, history, last_seen) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET history = excluded.history, last_seen = excluded.last_seen",
+                (session_id, blob, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        # Sweeping on every write would be wasteful; every 100th write keeps the table bounded.
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.evict_idle()
+
+    def evict_idle(self):
+        cursor = self._connect().execute("DELETE FROM sessions WHERE last_seen <= ?", (time.time() - self.idle_ttl,))
+        return cursor.rowcount
+
+    def stats(self):
+        count, payload = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(history)), 0) FROM sessions"
+        ).fetchone()
+        return {"backend": "sqlite", "sessions": count, "payload_bytes": payload,
+                "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0}
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Store for any Redis-compatible server, shared by every worker and host.
+
+    Each session is a Redis list of compact messages. RPUSH + LTRIM + EXPIRE run in one
+    MULTI transaction, so appends are atomic and idle sessions expire on the server.
+    """
+
+    def __init__(self, url: str = REDIS_URL, client=None, prefix: str = "ganesha:session:", **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("SESSION_STORE=redis requires the 'redis' package. Install it using 'pip install redis'")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, session_id):
+        return f"{self.prefix}{session_id}"
+
+    def get_history(self, session_id):
+        return [decode_message(m) for m in self.client.lrange(self._key(session_id), 0, -1)]
+
+    def append_turn(self, session_id, user_text, ganesha_content):
+        key = self._key(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(key, encode_message("user", user_text), encode_message("ganesha", ganesha_content))
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.idle_ttl)
+        pipe.execute()
+
+    def evict_idle(self):
+        return 0  # handled by key expiry on the server
+
+    def stats(self):
+        sessions = 0
+        payload = 0
+        for key in self.client.scan_iter(match=f"{self.prefix}*"):
+            sessions += 1
+            payload += sum(len(m) for m in self.client.lrange(key, 0, -1))
+        return {"backend": "redis", "sessions": sessions, "payload_bytes": payload}
+
+
+def create_session_store(kind: str = SESSION_STORE) -> SessionStore:
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind == "redis":
+        return RedisSessionStore()
+    return SQLiteSessionStore()
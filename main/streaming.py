@@ -0,0 +1,212 @@
+# This file should be located at: main/streaming.py
+import re
+import json
+
+# --- Fields of GaneshResponse that are spoken aloud, in the order the LLM emits them ---
+SPOKEN_FIELDS = ("blessing_open", "answer", "blessing_close")
+
+# A sentence ends with terminal punctuation (including the Devanagari danda),
+# optionally followed by closing quotes/brackets, and then whitespace.
+SENTENCE_END = re.compile(r'[.!?।॥]+["\'\)\]”’]*\s+')
+
+ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class IncrementalJSONParser:
+    """
+    Lenient, incremental parser for the top-level JSON object of an LLM reply.
+
+    Text is fed as it streams in and every character is looked at once. String values of
+    top-level fields are available while they are still arriving (see `value()`), and
+    anything before the opening brace (prose, code fences) is ignored. Because it also
+    tolerates raw control characters inside strings, trailing commas and a reply that
+    stops mid-way, the same parser is used to salvage near-valid output (`snapshot()`).
+    """
+
+    def __init__(self):
+        self.fields = {}        # top-level values that are complete
+        self.done = False       # the top-level object has been closed
+        self._started = False
+        self._depth = 0
+        self._expect = "key"    # at depth 1: key, colon, value or comma
+        self._key = None
+        self._key_chars = []
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = ""       # an escape sequence that has not fully arrived yet
+        self._partial = {}      # key -> decoded pieces of the string value being read
+        self._scalar = []       # characters of a number/true/false/null value
+        self._nested = []       # raw text of an object/array value
+        self._nested_escape = False
+
+    def feed(self, text: str):
+        for ch in text:
+            if self.done:
+                return
+            self._step(ch)
+
+    # --- Reading ---
+    def value(self, field: str):
+        """
+        Returns (value, complete) for a top-level field; value is None if it has not started.
+        Partial values are only available for strings.
+        """
+        if field in self.fields:
+            return self.fields[field], True
+        pieces = self._partial.get(field)
+        if pieces is None:
+            return None, False
+        return _join(pieces), False
+
+    def snapshot(self) -> dict:
+        """Complete fields plus whatever has arrived of a string value that was cut off."""
+        data = dict(self.fields)
+        for field, pieces in self._partial.items():
+            data.setdefault(field, _join(pieces))
+        return data
+
+    def spoken_text(self) -> str:
+        """The spoken fields (blessings + answer) that have arrived so far, in speaking order."""
+        text = ""
+        for field in SPOKEN_FIELDS:
+            value, complete = self.value(field)
+            if not isinstance(value, str):
+                break
+            text += value
+            if not complete:
+                break
+        return text
+
+    def lang(self, default: str = "en") -> str:
+        value = self.fields.get("lang")
+        return value if isinstance(value, str) and value else default
+
+    # --- State machine ---
+    def _step(self, ch):
+        if not self._started:
+            if ch == "{":
+                self._started = True
+                self._depth = 1
+            return
+        if self._depth > 1:
+            self._step_nested(ch)
+        elif self._in_string:
+            self._step_string(ch)
+        elif self._expect == "value":
+            self._step_value(ch)
+        elif ch == "}":
+            self.done = True
+        elif self._expect == "key" and ch == '"':
+            self._in_string, self._string_is_key, self._key_chars = True, True, []
+        elif self._expect == "colon" and ch == ":":
+            self._expect = "value"
+        elif self._expect == "comma" and ch == ",":
+            self._expect = "key"
+
+    def _step_string(self, ch):
+        target = self._key_chars if self._string_is_key else self._partial[self._key]
+        if self._escape:
+            self._escape += ch
+            if self._escape[1] != "u":
+                target.append(ESCAPES.get(ch, ch))
+                self._escape = ""
+            elif len(self._escape) == 6:
+                try:
+                    target.append(chr(int(self._escape[2:], 16)))
+                except ValueError:
+                    pass
+                self._escape = ""
+        elif ch == "\\":
+            self._escape = ch
+        elif ch == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._key = "".join(self._key_chars)
+                self._expect = "colon"
+            else:
+                self.fields[self._key] = _join(self._partial.pop(self._key))
+                self._expect = "comma"
+        else:
+            target.append(ch)
+
+    def _step_value(self, ch):
+        if ch == '"' and not self._scalar:
+            self._in_string, self._string_is_key = True, False
+            self._partial[self._key] = []
+        elif ch in "{[" and not self._scalar:
+            self._depth = 2
+            self._nested = [ch]
+        elif ch in ",}" or ch.isspace():
+            if self._scalar:
+                self._finish_scalar()
+                self._step(ch)
+        else:
+            self._scalar.append(ch)
+
+    def _finish_scalar(self):
+        try:
+            self.fields[self._key] = json.loads("".join(self._scalar))
+        except ValueError:
+            pass
+        self._scalar = []
+        self._expect = "comma"
+
+    def _step_nested(self, ch):
+        self._nested.append(ch)
+        if self._in_string:
+            if self._nested_escape:
+                self._nested_escape = False
+            elif ch == "\\":
+                self._nested_escape = True
+            elif ch == '"':
+                self._in_string = False
+        elif ch == '"':
+            self._in_string = True
+        elif ch in "{[":
+            self._depth += 1
+        elif ch in "}]":
+            self._depth -= 1
+            if self._depth == 1:
+                try:
+                    self.fields[self._key] = json.loads("".join(self._nested))
+                except ValueError:
+                    pass
+                self._nested = []
+                self._expect = "comma"
+
+
+def _join(pieces) -> str:
+    # \uXXXX escapes arrive one UTF-16 unit at a time; recombine surrogate pairs
+    # and drop a high surrogate whose partner has not arrived yet.
+    text = "".join(pieces)
+    if text and "\ud800" <= text[-1] <= "\udbff":
+        text = text[:-1]
+    return text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+
+
+class SentenceSplitter:
+    """
+    Turns a growing piece of text into complete sentences.
+
+    Call `feed()` with the full text received so far; it returns the sentences
+    that were completed since the previous call. `flush()` returns whatever is left.
+    """
+
+    def __init__(self):
+        self._emitted = 0
+        self._text = ""
+
+    def feed(self, text: str):
+        self._text = text
+        sentences = []
+        for match in SENTENCE_END.finditer(text, self._emitted):
+            sentence = text[self._emitted:match.end()].strip()
+            self._emitted = match.end()
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self):
+        rest = self._text[self._emitted:].strip()
+        self._emitted = len(self._text)
+        return [rest] if rest else []
@@ -0,0 +1,87 @@
+# This file should be located at: main/structured.py
+import os
+
+from .streaming import IncrementalJSONParser
+from .telemetry import GENERATIONS
+
+# --- Configuration ---
+# Ask Gemini for JSON constrained to RESPONSE_SCHEMA instead of parsing JSON out of free text.
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1").lower() in ("1", "true", "yes")
+
+# --- Schema of GaneshResponse (agent.py) in the subset of OpenAPI that Gemini accepts ---
+# propertyOrdering keeps the spoken fields in speaking order; without it Gemini emits
+# properties alphabetically, putting the answer before the opening blessing and
+# defeating sentence-by-sentence TTS while streaming.
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "lang": {"type": "STRING", "description": "hi, mr, en or ta, based on the user's language"},
+        "blessing_open": {"type": "STRING"},
+        "answer": {"type": "STRING"},
+        "blessing_close": {"type": "STRING"},
+        "refusal": {"type": "BOOLEAN"},
+        "refusal_reason": {"type": "STRING"},
+    },
+    "required": ["lang", "blessing_open", "answer", "blessing_close", "refusal"],
+    "propertyOrdering": ["lang", "blessing_open", "answer", "blessing_close", "refusal", "refusal_reason"],
+}
+
+# Filled in when a salvaged reply is missing them; "answer" is never invented.
+REPAIR_DEFAULTS = {"lang": "en", "blessing_open": "", "blessing_close": "", "refusal": False, "refusal_reason": ""}
+
+
+def generation_config():
+    """The generationConfig for the answer call, or None when structured output is disabled."""
+    if not LLM_STRUCTURED_OUTPUT:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": RESPONSE_SCHEMA}
+
+
+def repair(raw: str) -> dict:
+    """
+    Salvages a near-valid reply: surrounding prose, raw control characters, trailing commas
+    and output cut off mid-string. Raises ValueError if there is no usable answer.
+    """
+    parser = IncrementalJSONParser()
+    parser.feed(raw)
+    data = parser.snapshot()
+    if not isinstance(data.get("answer"), str) or not data["answer"].strip():
+        raise ValueError("No answer could be recovered from the LLM response.")
+    for field, default in REPAIR_DEFAULTS.items():
+        if data.get(field) is None:
+            data[field] = default
+    return data
+
+
+def parse_model_output(raw: str, model_cls):
+    """
+    Validates a reply as `model_cls`, repairing it if the strict parse fails.
+
+    Returns:
+        tuple: (instance, outcome) where outcome is "ok" or "repaired".
+    Raises:
+        ValueError (including pydantic's ValidationError) if the reply cannot be used.
+    """
+    try:
+        return model_cls.model_validate_json(raw.strip()), "ok"
+    except ValueError:
+        pass
+    return model_cls.model_validate(repair(raw)), "repaired"
+
+
+class GenerationStats:
+    """
+    Outcome counters for answer generations, exported as ganesha_generations_total: "ok",
+    "repaired", "wasted" (the model answered but the reply had to be thrown away) and
+    "failed" (the call itself errored).
+    """
+
+    OUTCOMES = ("ok", "repaired", "wasted", "failed")
+
+    def record(self, outcome: str):
+        if outcome not in self.OUTCOMES:
+            raise ValueError(f"Unknown generation outcome '{outcome}'.")
+        GENERATIONS.labels(outcome).inc()
+
+
+generation_stats = GenerationStats()
@@ -1,57 +1,172 @@
 # This file should be located at: main/stt.py
-import google.generativeai as genai
 import os
-from dotenv import load_dotenv
+import io
+import asyncio
+from typing import Union
 
-# --- Load environment variables from the project root .env file ---
-project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-dotenv_path = os.path.join(project_root, '.env')
-load_dotenv(dotenv_path=dotenv_path)
+# --- Shared Gemini client: keys, pooling and retries live in main/llm.py ---
+from .llm import get_client
+from .telemetry import get_logger, stage
 
-# --- Use the same Gemini API Key as your agent ---
-API_KEY = os.getenv("GENAI_API_KEY_1") # --- FIX: HARDCODED KEY FOR TESTING ---
-if API_KEY:
-    genai.configure(api_key=API_KEY)
+log = get_logger("stt")
 
-def transcribe_audio_gemini(file_path: str) -> str:
+# --- STT configuration ---
+# "gemini" (default) or "whisper" (offline, needs 'faster-whisper'); custom backends can be registered.
+STT_BACKEND = os.getenv("STT_BACKEND", "gemini")
+STT_MODEL_NAME = 'models/gemini-1.5-flash-latest'
+STT_PROMPT = "Please transcribe the following audio."
+# Clips are sent inline with the request while their base64 encoding fits in this many bytes;
+# larger ones go through the File API. Gemini caps a whole inline request at 20 MB and base64
+# adds a third, so the default (~14.25 MB of raw audio) leaves 1 MB for the prompt and framing.
+# (16 kHz mono PCM is ~32 KB per second.)
+STT_INLINE_MAX_BYTES = int(os.getenv("STT_INLINE_MAX_BYTES", str(19 * 1000 * 1000)))
+STT_WHISPER_MODEL = os.getenv("STT_WHISPER_MODEL", "base")
+
+
+class STTBackend:
+    """Interface for speech-to-text engines. Audio arrives as in-memory bytes."""
+
+    def transcribe(self, audio: bytes, mime_type: str = "audio/wav") -> str:
+        raise NotImplementedError
+
+    async def atranscribe(self, audio: bytes, mime_type: str = "audio/wav") -> str:
+        return await asyncio.to_thread(self.transcribe, audio, mime_type)
+
+
+class GeminiSTTBackend(STTBackend):
+    """
+    Transcribes with Gemini through the shared client (main/llm.py).
+    Short clips are sent inline in a single round trip; only clips whose
+    base64 encoding exceeds inline_max_bytes pay for File API upload and
+    delete calls.
     """
-    Transcribes an audio file using the native Gemini API.
+
+    def __init__(self, model_name: str = STT_MODEL_NAME, inline_max_bytes: int = STT_INLINE_MAX_BYTES):
+        self.client = get_client()
+        self.model = self.client.model(model_name)
+        self.inline_max_bytes = inline_max_bytes
+
+    def _inline(self, audio):
+        # Inline data travels base64-encoded: 4 bytes for every 3, rounded up.
+        return -(-len(audio) // 3) * 4 <= self.inline_max_bytes
+
+    def transcribe(self, audio, mime_type="audio/wav"):
+        if self._inline(audio):
+            response = self.model.generate_content([STT_PROMPT, {"mime_type": mime_type, "data": audio}])
+            return response.text.strip()
+
+        log.debug("Large clip: uploading audio to the Gemini File API...")
+        audio_file = self.client.upload_file(audio, mime_type)
+        try:
+            # Uploaded files belong to the uploading key's project, so the key is pinned.
+            response = self.model.generate_content([STT_PROMPT, audio_file], key=audio_file.key)
+            return response.text.strip()
+        finally:
+            self.client.delete_file(audio_file)
+
+    async def atranscribe(self, audio, mime_type="audio/wav"):
+        if self._inline(audio):
+            response = await self.model.generate_content_async([STT_PROMPT, {"mime_type": mime_type, "data": audio}])
+            return response.text.strip()
+
+        log.debug("Large clip: uploading audio to the Gemini File API...")
+        # The File API helpers are synchronous, so they run in a worker thread.
+        audio_file = await asyncio.to_thread(self.client.upload_file, audio, mime_type)
+        try:
+            response = await self.model.generate_content_async([STT_PROMPT, audio_file], key=audio_file.key)
+            return response.text.strip()
+        finally:
+            await asyncio.to_thread(self.client.delete_file, audio_file)
+
+
+class WhisperSTTBackend(STTBackend):
+    """Offline transcription with faster-whisper; no network access needed after the model is downloaded."""
+
+    def __init__(self, model_size: str = STT_WHISPER_MODEL):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError("STT_BACKEND=whisper requires the 'faster-whisper' package. Install it using 'pip install faster-whisper'")
+        import soundfile as sf
+        self._sf = sf
+        self.model = WhisperModel(model_size, device="cpu", compute_type="int8")
+
+    def transcribe(self, audio, mime_type="audio/wav"):
+        samples, _ = self._sf.read(io.BytesIO(audio), dtype="float32")
+        segments, _ = self.model.transcribe(samples)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+
+_BACKEND_FACTORIES = {"gemini": GeminiSTTBackend, "whisper": WhisperSTTBackend}
+_backend = None
+
+def register_backend(name: str, factory):
+    """Makes a custom STTBackend selectable through STT_BACKEND."""
+    _BACKEND_FACTORIES[name] = factory
+
+def set_backend(backend: STTBackend):
+    """Replaces the active backend, e.g. with an offline engine in tests."""
+    global _backend
+    _backend = backend
+
+def get_backend() -> STTBackend:
+    global _backend
+    if _backend is None:
+        _backend = _BACKEND_FACTORIES[STT_BACKEND]()
+    return _backend
+
+def _read_audio(audio: Union[str, bytes]) -> bytes:
+    if isinstance(audio, (bytes, bytearray)):
+        return bytes(audio)
+    with open(audio, "rb") as f:
+        return f.read()
+
+def transcribe_audio_gemini(file_path: Union[str, bytes]) -> str:
+    """
+    Transcribes audio with the configured STT backend (Gemini by default).
 
     Args:
-        file_path (str): The path to the audio file (.wav).
+        file_path (str | bytes): The path to the audio file (.wav), or the WAV contents.
 
     Returns:
         str: The transcribed text.
     """
     try:
-        if not API_KEY:
+        if STT_BACKEND == "gemini" and _backend is None and not get_client().available:
             raise ValueError("GENAI_API_KEY not found in environment variables.")
 
-        print("🎙️ Uploading audio to Gemini API for transcription...")
-        
-        # 1. Upload the audio file to the Gemini File API
-        audio_file = genai.upload_file(path=file_path)
+        audio = _read_audio(file_path)
+        with stage("stt"):
+            transcribed_text = get_backend().transcribe(audio)
+        log.debug("Transcription result: '%s'", transcribed_text)
+        return transcribed_text
 
-        # 2. Initialize the Gemini 1.5 Flash model
-        model = genai.GenerativeModel('models/gemini-1.5-flash-latest')
+    except Exception as e:
+        log.error("An error occurred while calling the STT backend: %s", e)
+        return ""
 
-        # 3. Generate content with a prompt and the audio file
-        # This tells the model what to do with the audio.
-        response = model.generate_content(
-            ["Please transcribe the following audio.", audio_file]
-        )
+async def atranscribe_audio_gemini(file_path: Union[str, bytes]) -> str:
+    """
+    Non-blocking variant of transcribe_audio_gemini for the async request path.
 
-        # 4. The transcribed text is in the response
-        transcribed_text = response.text.strip()
-        print(f"Gemini transcription result: '{transcribed_text}'")
+    Args:
+        file_path (str | bytes): The path to the audio file (.wav), or the WAV contents.
 
-        # Clean up the uploaded file from the server
-        genai.delete_file(audio_file.name)
+    Returns:
+        str: The transcribed text.
+    """
+    try:
+        if STT_BACKEND == "gemini" and _backend is None and not get_client().available:
+            raise ValueError("GENAI_API_KEY not found in environment variables.")
 
+        audio = file_path if isinstance(file_path, (bytes, bytearray)) else await asyncio.to_thread(_read_audio, file_path)
+        with stage("stt"):
+            transcribed_text = await get_backend().atranscribe(bytes(audio))
+        log.debug("Transcription result: '%s'", transcribed_text)
         return transcribed_text
 
     except Exception as e:
-        print(f"An error occurred while calling the Gemini STT API: {e}")
+        log.error("An error occurred while calling the STT backend: %s", e)
         return ""
 
 if __name__ == "__main__":
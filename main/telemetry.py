@@ -0,0 +1,237 @@
+# This file should be located at: main/telemetry.py
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import REGISTRY
+
+# --- Configuration ---
+# DEBUG shows the per-step progress lines; WARNING silences everything on the request path.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line, for log shippers) or "text" (for a terminal).
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# With several gunicorn workers, point this at a shared empty directory so /metrics
+# aggregates all of them (prometheus_client multiprocess mode).
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# The request a log line or stage timing belongs to; asyncio.to_thread and tasks copy it,
+# plain executors need contextvars.copy_context().run (see traced()).
+_current_trace = contextvars.ContextVar("ganesha_trace", default=None)
+
+
+# --- Structured logging ---
+class _TraceFilter(logging.Filter):
+    def filter(self, record):
+        trace = _current_trace.get()
+        record.request_id = trace.request_id if trace else None
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line; key/value context passed as extra={"fields": {...}} is merged in."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id:
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = dict(getattr(record, "fields", None) or {})
+        if record.request_id:
+            fields = dict(request_id=record.request_id, **fields)
+        return line + ("  " + " ".join(f"{k}={v}" for k, v in fields.items()) if fields else "")
+
+
+_logging_configured = False
+
+def configure_logging():
+    """Installs the handler on the 'ganesha' logger once; safe to call from every module."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+    root = logging.getLogger("ganesha")
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    handler.addFilter(_TraceFilter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(f"ganesha.{name}")
+
+
+log = get_logger("telemetry")
+
+# --- Metrics ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+REQUESTS = Counter("ganesha_requests_total", "HTTP requests by endpoint and status.", ["endpoint", "status"])
+REQUEST_SECONDS = Histogram("ganesha_request_duration_seconds", "Wall time of HTTP requests (streams: until the last event).",
+                            ["endpoint"], buckets=LATENCY_BUCKETS)
+STAGE_SECONDS = Histogram("ganesha_stage_duration_seconds", "Time spent in each pipeline stage.",
+                          ["stage"], buckets=LATENCY_BUCKETS)
+FIRST_TOKEN_SECONDS = Histogram("ganesha_first_token_seconds", "Time from request start to the first streamed token.",
+                                buckets=LATENCY_BUCKETS)
+LLM_CALL_SECONDS = Histogram("ganesha_llm_call_duration_seconds", "Gemini calls by model, method and outcome.",
+                             ["model", "method", "outcome"], buckets=LATENCY_BUCKETS)
+CACHE_LOOKUPS = Counter("ganesha_cache_lookups_total", "Cache lookups by cache and result.", ["cache", "result"])
+ROUTER_DECISIONS = Counter("ganesha_router_decisions_total", "Intent decisions by deciding router and verdict.",
+                           ["router", "verdict"])
+# Estimated prompt size per request (main/prompt_builder.py), by part; "total" includes the template.
+PROMPT_TOKENS = Histogram("ganesha_prompt_tokens", "Estimated tokens in each generation prompt, by part.",
+                          ["part"], buckets=TOKEN_BUCKETS)
+PROMPT_TOKEN_PARTS = ("context", "history", "summary", "total")
+GENERATIONS = Counter("ganesha_generations_total", "Answer generations by outcome (wasted = reply thrown away).",
+                      ["outcome"])
+# Background TTS jobs (main/tts_jobs.py). Depth is incremented on submit and decremented on
+# pickup, so the sum over all workers is the depth even when they share one Redis queue.
+TTS_QUEUE_DEPTH = Gauge("ganesha_tts_queue_depth", "TTS jobs waiting for a worker.", multiprocess_mode="livesum")
+TTS_JOB_WAIT_SECONDS = Histogram("ganesha_tts_job_wait_seconds", "Time TTS jobs spent queued.", buckets=LATENCY_BUCKETS)
+TTS_JOB_SECONDS = Histogram("ganesha_tts_job_duration_seconds", "Time from TTS job submission to finished audio.",
+                            buckets=LATENCY_BUCKETS)
+TTS_JOBS = Counter("ganesha_tts_jobs_total", "TTS jobs by outcome (rejected = queue full, spoken inline).", ["outcome"])
+# Admission control (main/admission.py).
+ADMISSION_WAIT_SECONDS = Histogram("ganesha_admission_wait_seconds", "Time requests waited for a stage slot.",
+                                   ["stage"], buckets=LATENCY_BUCKETS)
+ADMISSION_IN_FLIGHT = Gauge("ganesha_admission_in_flight", "Requests holding a slot of a limited stage.", ["stage"],
+                            multiprocess_mode="livesum")
+ADMISSION_SHED = Counter("ganesha_admission_shed_total", "Requests rejected by admission control, by reason.", ["reason"])
+ADMISSION_DEGRADED = Counter("ganesha_admission_degraded_total", "Requests served in degraded mode, by fallback.",
+                             ["mode"])
+# Single-flight groups (main/coalesce.py): leader = went upstream, follower = shared its result,
+# timeout = gave up waiting on a stuck call and went upstream itself.
+COALESCED_CALLS = Counter("ganesha_coalesced_calls_total", "Calls through single-flight groups, by group and role.",
+                          ["group", "role"])
+
+
+def observe_llm_call(model: str, method: str, latency: float, outcome: str):
+    """Listener for LLMClient.stats (main/llm.py)."""
+    LLM_CALL_SECONDS.labels(model, method, outcome).observe(latency)
+
+
+def metrics_response():
+    """Returns (body, content_type) for the /metrics endpoint."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+# --- Per-request traces ---
+class RequestTrace:
+    """Stage timings (summed when a stage runs more than once, e.g. per-sentence TTS) and prompt tokens of one request."""
+
+    def __init__(self, request_id: str, endpoint: str):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.status = None
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._first_token = None
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def set_tokens(self, counts: Dict[str, int]):
+        with self._lock:
+            self.tokens.update(counts)
+
+    def first_token(self):
+        if self._first_token is None:
+            self._first_token = time.perf_counter() - self.started
+            FIRST_TOKEN_SECONDS.observe(self._first_token)
+
+    def summary(self) -> Dict:
+        fields = {"endpoint": self.endpoint, "status": self.status,
+                  "total_ms": round((time.perf_counter() - self.started) * 1000, 1)}
+        if self._first_token is not None:
+            fields["first_token_ms"] = round(self._first_token * 1000, 1)
+        with self._lock:
+            fields.update({f"{stage}_ms": round(seconds * 1000, 1) for stage, seconds in self.stages.items()})
+            fields.update({f"prompt_{part}_tokens": count for part, count in self.tokens.items()})
+        return fields
+
+
+def start_trace(request_id: str, endpoint: str) -> RequestTrace:
+    trace = RequestTrace(request_id, endpoint)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def finish_trace(trace: Optional[RequestTrace] = None):
+    """Records the request metrics and writes one log line with every stage timing."""
+    trace = trace or _current_trace.get()
+    if trace is None:
+        return
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    REQUESTS.labels(trace.endpoint, str(trace.status)).inc()
+    REQUEST_SECONDS.labels(trace.endpoint).observe(time.perf_counter() - trace.started)
+    # The request id is passed explicitly because the trace is no longer current.
+    log.info("request finished", extra={"fields": dict(request_id=trace.request_id, **trace.summary())})
+
+
+@contextmanager
+def stage(name: str):
+    """Times a block as pipeline stage `name`, into the histogram and the current request's trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+
+
+def record_prompt_tokens(tokens: Dict[str, int]):
+    """Records a prompt's token counts (PromptBuild.tokens) in the histogram and the current request's trace."""
+    counts = {part: tokens[part] for part in PROMPT_TOKEN_PARTS if part in tokens}
+    for part, count in counts.items():
+        PROMPT_TOKENS.labels(part).observe(count)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.set_tokens(counts)
+
+
+def traced(fn):
+    """Wraps fn so it runs in a copy of the caller's context (for ThreadPoolExecutor.submit)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
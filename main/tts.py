@@ -1,81 +1,192 @@
 # This file should be located at: main/tts.py
-import google.generativeai as genai
 import os
-from dotenv import load_dotenv
 import soundfile as sf
 import numpy as np
 import io
+import asyncio
+from typing import Iterable, Tuple, Optional
 
-# --- Load environment variables from the project root .env file ---
-# This is kept in case you want to switch back later.
-project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-dotenv_path = os.path.join(project_root, '.env')
-load_dotenv(dotenv_path=dotenv_path)
-
-# --- HARDCODED API KEY ---
-# ⚠️ WARNING: For local testing only. Do not commit this key to version control.
-API_KEY = os.getenv("GENAI_API_KEY_1")
-
-# --- Configure the Gemini Client ---
-# This now uses the hardcoded key.
-try:
-    if not API_KEY or API_KEY == "YOUR_GEMINI_API_KEY_HERE":
-        raise ValueError("Please replace 'YOUR_GEMINI_API_KEY_HERE' with your actual API key.")
-    genai.configure(api_key=API_KEY)
-except Exception as e:
-    print(f"Error configuring Gemini API: {e}")
+from .audio_cache import audio_cache_key, create_backend
+# --- Shared Gemini client: keys, pooling and retries live in main/llm.py ---
+from .llm import get_client, LLM_CONNECT_TIMEOUT
+from .telemetry import get_logger, stage, CACHE_LOOKUPS
+from .coalesce import SingleFlight
 
-def speak(text: str, lang: str = "en", output_path: str = "output.wav"):
+log = get_logger("tts")
+
+# 'Iapetus' is a clear, standard male voice. You can choose others like 'Charon' or 'Fenrir'.
+TTS_MODEL_NAME = 'gemini-2.5-flash-preview-tts'
+VOICE_NAME = "Schedar"
+PROMPT_TEMPLATE = "Speak the following text clearly and cheerfully: {text}"
+# The Gemini TTS API uses a 24000 Hz sample rate.
+SAMPLE_RATE = 24000
+
+GENERATION_CONFIG = {
+    "response_modalities": ["AUDIO"],
+    "speech_config": {
+        "voice_config": {
+            "prebuilt_voice_config": {"voice_name": VOICE_NAME}
+        }
+    }
+}
+
+# --- Encoding of the clips sent to the browser ---
+# "wav" (uncompressed 16-bit PCM), "opus" (Ogg Opus, about a tenth of the bytes) or "mp3"
+# (about an eighth). Encoding costs CPU: roughly 50 ms per second of speech for opus, 15 ms for mp3
+# (python bench/audio_bandwidth.py).
+TTS_AUDIO_FORMAT = os.getenv("TTS_AUDIO_FORMAT", "wav").lower()
+# libsndfile compression level for opus/mp3, 0 (best quality) to 1 (smallest); empty keeps the encoder default.
+TTS_AUDIO_COMPRESSION = os.getenv("TTS_AUDIO_COMPRESSION", "")
+# name -> (libsndfile format, subtype, file extension, MIME type)
+AUDIO_FORMATS = {
+    "wav": ("WAV", "PCM_16", ".wav", "audio/wav"),
+    "opus": ("OGG", "OPUS", ".ogg", "audio/ogg"),
+    "mp3": ("MP3", "MPEG_LAYER_III", ".mp3", "audio/mpeg"),
+}
+if TTS_AUDIO_FORMAT not in AUDIO_FORMATS:
+    raise ValueError(f"TTS_AUDIO_FORMAT must be one of {', '.join(AUDIO_FORMATS)}, not '{TTS_AUDIO_FORMAT}'.")
+AUDIO_EXTENSION = AUDIO_FORMATS[TTS_AUDIO_FORMAT][2]
+AUDIO_MIMETYPES = {extension: mimetype for _, _, extension, mimetype in AUDIO_FORMATS.values()}
+
+# Speech takes longer to generate than text; this is the read timeout for one clip.
+TTS_TIMEOUT_SECONDS = float(os.getenv("TTS_TIMEOUT_SECONDS", "90"))
+
+# One long-lived model handle instead of a new GenerativeModel per call.
+tts_model = get_client().model(TTS_MODEL_NAME)
+
+# --- Content-addressed cache of synthesized clips (see main/audio_cache.py) ---
+audio_cache = create_backend()
+
+# --- Single-flight: concurrent requests for the same uncached clip share one synthesis ---
+tts_flights = SingleFlight("tts", timeout=TTS_TIMEOUT_SECONDS)
+
+def _cache_key(text: str, lang: str) -> str:
+    return audio_cache_key(text, lang, VOICE_NAME, PROMPT_TEMPLATE, TTS_MODEL_NAME, TTS_AUDIO_FORMAT)
+
+def _request(text: str):
+    return tts_model.generate_content(PROMPT_TEMPLATE.format(text=text), generation_config=GENERATION_CONFIG,
+                                      timeout=(LLM_CONNECT_TIMEOUT, TTS_TIMEOUT_SECONDS))
+
+def encode_audio(pcm: bytes, audio_format: str = TTS_AUDIO_FORMAT, rate: int = SAMPLE_RATE) -> bytes:
+    """Encodes raw signed 16-bit mono PCM as a complete audio file, in memory."""
+    container, subtype, _, _ = AUDIO_FORMATS[audio_format]
+    options = {}
+    if audio_format != "wav" and TTS_AUDIO_COMPRESSION:
+        options["compression_level"] = float(TTS_AUDIO_COMPRESSION)
+    buffer = io.BytesIO()
+    sf.write(buffer, np.frombuffer(pcm, dtype=np.int16), samplerate=rate, format=container, subtype=subtype, **options)
+    return buffer.getvalue()
+
+def _encode_audio(response) -> bytes:
+    """Encodes the raw signed 16-bit PCM returned by the TTS model in TTS_AUDIO_FORMAT."""
+    return encode_audio(response.audio)
+
+def _synthesize_uncached(key: str, text: str) -> bytes:
+    data = _encode_audio(_request(text))
+    audio_cache.put(key, data)
+    return data
+
+async def _asynthesize_uncached(key: str, text: str) -> bytes:
+    response = await asyncio.to_thread(_request, text)
+    data = await asyncio.to_thread(_encode_audio, response)
+    await asyncio.to_thread(audio_cache.put, key, data)
+    return data
+
+def _write_file(output_path: str, data: bytes):
+    with open(output_path, "wb") as f:
+        f.write(data)
+
+def synthesize(text: str, lang: str = "en") -> Optional[bytes]:
     """
-    Converts text to speech using the native Gemini TTS API and saves it to a file.
+    Converts text to speech using the native Gemini TTS API and returns it encoded in TTS_AUDIO_FORMAT.
+    Identical requests are answered from the audio cache without any API call; concurrent ones share one call.
 
     Args:
         text (str): The text to be converted to speech.
         lang (str): The language code (e.g., 'en', 'hi'). The model auto-detects the language.
-        output_path (str): The full path where the output .wav file will be saved.
+
+    Returns:
+        bytes: The audio file contents, or None if synthesis failed.
     """
     try:
-        print(f"🔊 Sending text to Gemini TTS for language: '{lang}'...")
-
-        # 1. Select the appropriate Gemini TTS model
-        # --- FIX: Switched to the dedicated model for Text-to-Speech ---
-        model = genai.GenerativeModel('gemini-2.5-flash-preview-tts')
-
-        # 2. The prompt for this model is just the text to be spoken.
-        #    You can add optional instructions like "Say cheerfully: ..."
-        prompt = f"Speak the following text clearly and cheerfully: {text}"
-
-        # 3. Configure the speech output
-        # 'Iapetus' is a clear, standard male voice. You can choose others like 'Charon' or 'Fenrir'.
-        generation_config = {
-            "response_modalities": ["AUDIO"],
-            "speech_config": {
-                "voice_config": {
-                    "prebuilt_voice_config": {"voice_name": "Schedar"}
-                }
-            }
-        }
+        with stage("synthesize"):
+            key = _cache_key(text, lang)
+            data = audio_cache.get(key)
+            if data is not None:
+                CACHE_LOOKUPS.labels("tts", "hit").inc()
+                log.debug("Audio served from TTS cache.")
+                return data
 
-        # 4. Generate the audio content
-        response = model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
+            CACHE_LOOKUPS.labels("tts", "miss").inc()
+            log.debug("Sending text to Gemini TTS for language: '%s'...", lang)
 
-        # 5. The API returns raw signed 16-bit PCM audio data
-        audio_data_bytes = response.candidates[0].content.parts[0].inline_data.data
+            # Generate the audio with the dedicated TTS model (the prompt is just the text to be spoken)
+            # and encode the raw signed 16-bit PCM it returns; identical clips in flight share one call.
+            data = tts_flights.do(key, _synthesize_uncached, key, text)
+            log.debug("Audio successfully generated by Gemini TTS.")
+            return data
 
-        # 6. Convert the raw PCM bytes to a NumPy array for saving
-        pcm_data = np.frombuffer(audio_data_bytes, dtype=np.int16)
-        
-        # 7. Save the audio data as a WAV file
-        # The Gemini TTS API uses a 24000 Hz sample rate.
-        sf.write(output_path, pcm_data, samplerate=24000)
+    except Exception as e:
+        log.error("An error occurred in Gemini TTS synthesize(): %s", e)
+        return None
+
+async def asynthesize(text: str, lang: str = "en") -> Optional[bytes]:
+    """Non-blocking variant of synthesize() for the async request path."""
+    try:
+        with stage("synthesize"):
+            key = _cache_key(text, lang)
+            data = await asyncio.to_thread(audio_cache.get, key)
+            if data is not None:
+                CACHE_LOOKUPS.labels("tts", "hit").inc()
+                log.debug("Audio served from TTS cache.")
+                return data
 
-        print(f"Audio successfully generated by Gemini TTS at: {output_path}")
+            CACHE_LOOKUPS.labels("tts", "miss").inc()
+            log.debug("Sending text to Gemini TTS for language: '%s'...", lang)
+            data = await tts_flights.ado(key, _asynthesize_uncached, key, text)
+            log.debug("Audio successfully generated by Gemini TTS.")
+            return data
 
     except Exception as e:
-        print(f"An error occurred in Gemini TTS speak(): {e}")
+        log.error("An error occurred in Gemini TTS asynthesize(): %s", e)
+        return None
+
+def speak(text: str, lang: str = "en", output_path: str = "output.wav"):
+    """
+    Converts text to speech using the native Gemini TTS API and saves it to a file.
+
+    Args:
+        text (str): The text to be converted to speech.
+        lang (str): The language code (e.g., 'en', 'hi'). The model auto-detects the language.
+        output_path (str): The full path where the output .wav file will be saved.
+    """
+    data = synthesize(text, lang)
+    if data is not None:
+        _write_file(output_path, data)
+        log.debug("Audio saved at: %s", output_path)
+
+async def aspeak(text: str, lang: str = "en", output_path: str = "output.wav"):
+    """Non-blocking variant of speak() for the async request path."""
+    data = await asynthesize(text, lang)
+    if data is not None:
+        await asyncio.to_thread(_write_file, output_path, data)
+        log.debug("Audio saved at: %s", output_path)
+
+def presynthesize(utterances: Iterable[Tuple[str, str]]):
+    """
+    Fills the audio cache for fixed (text, lang) utterances so they never cost a TTS call.
+    Clips that are already cached (e.g. by another worker) are skipped.
+    """
+    for text, lang in utterances:
+        key = _cache_key(text, lang)
+        if audio_cache.get(key) is not None:
+            continue
+        try:
+            response = _request(text)
+            audio_cache.put(key, _encode_audio(response))
+            log.info("Pre-synthesized canned audio: '%s...'", text[:40])
+        except Exception as e:
+            log.warning("Could not pre-synthesize canned audio: %s", e)
 
 if __name__ == "__main__":
     # Example usage for testing this file directly
@@ -0,0 +1,290 @@
+# This file should be located at: main/tts_jobs.py
+import os
+import json
+import time
+import uuid
+import queue
+import itertools
+import threading
+from typing import Optional, Dict
+
+from .sessions import REDIS_URL
+from .telemetry import get_logger, TTS_QUEUE_DEPTH, TTS_JOB_WAIT_SECONDS, TTS_JOB_SECONDS, TTS_JOBS
+
+log = get_logger("tts_jobs")
+
+# --- Configuration ---
+# "inline" speaks the reply before responding; "background" returns the text at once with
+# an audio job to poll (GET /audio-jobs/<id>) or subscribe to (GET /audio-jobs/<id>/events).
+# A request can choose for itself with "defer_audio".
+TTS_JOB_MODE = os.getenv("TTS_JOB_MODE", "inline")
+# "memory" (jobs stay in this process) or "redis" (REDIS_URL; any worker process picks up
+# any job, so reply audio must be on a volume they share: AUDIO_OUTPUT_STORE=disk).
+TTS_JOB_QUEUE = os.getenv("TTS_JOB_QUEUE", "memory")
+TTS_JOB_WORKERS = int(os.getenv("TTS_JOB_WORKERS", "4"))
+# Jobs beyond this depth are refused and the request speaks its reply inline, which slows
+# producers down to the rate the workers keep up with.
+TTS_JOB_QUEUE_MAX = int(os.getenv("TTS_JOB_QUEUE_MAX", "64"))
+# Finished jobs stay pollable this long.
+TTS_JOB_TTL_SECONDS = int(os.getenv("TTS_JOB_TTL_SECONDS", "900"))
+
+# Lower runs first. A voice question is answered by voice, so its audio is what the user is waiting for.
+PRIORITY_VOICE = 0
+PRIORITY_TEXT = 1
+
+FINISHED = ("done", "failed")
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when the queue is at TTS_JOB_QUEUE_MAX."""
+
+
+class TTSJob:
+    """One clip to synthesize and store under session_id/filename."""
+
+    FIELDS = ("id", "session_id", "filename", "text", "lang", "priority", "status",
+              "created_at", "started_at", "finished_at", "error")
+
+    def __init__(self, session_id: str, filename: str, text: str, lang: str, priority: int = PRIORITY_TEXT,
+                 cache_lookup=None, **fields):
+        self.id = fields.get("id") or uuid.uuid4().hex
+        # Response-cache entry whose audio the job reuses or fills in. In-process only: it is
+        # not part of FIELDS, so a job picked up from Redis by another worker just synthesizes.
+        self.cache_lookup = cache_lookup
+        self.session_id = session_id
+        self.filename = filename
+        self.text = text
+        self.lang = lang
+        self.priority = priority
+        self.status = fields.get("status", "new")
+        self.created_at = fields.get("created_at") or time.time()
+        self.started_at = fields.get("started_at")
+        self.finished_at = fields.get("finished_at")
+        self.error = fields.get("error")
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TTSJob":
+        data = dict(data)
+        return cls(data.pop("session_id"), data.pop("filename"), data.pop("text"), data.pop("lang"),
+                   data.pop("priority"), **data)
+
+    def timings(self) -> Dict:
+        ms = lambda start, end: round((end - start) * 1000, 1) if start and end else None
+        return {"queued_ms": ms(self.created_at, self.started_at or self.finished_at),
+                "synthesis_ms": ms(self.started_at, self.finished_at)}
+
+
+class JobQueue:
+    """
+    Priority queue of TTS jobs plus the pool of worker threads that drain it.
+
+    Backends provide storage (_save/_load), ordering (_push/_pop) and depth(). Workers
+    start on the first submit and call handler(job), which returns False when no audio
+    could be produced.
+    """
+
+    def __init__(self, handler=None, workers: int = TTS_JOB_WORKERS, max_depth: int = TTS_JOB_QUEUE_MAX,
+                 ttl_seconds: int = TTS_JOB_TTL_SECONDS):
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.ttl_seconds = ttl_seconds
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    # --- Backend interface ---
+    def _push(self, job: TTSJob):
+        raise NotImplementedError
+
+    def _pop(self, timeout: float) -> Optional[TTSJob]:
+        """Claims the most urgent job (decrementing TTS_QUEUE_DEPTH), or returns None after timeout."""
+        raise NotImplementedError
+
+    def _save(self, job: TTSJob):
+        raise NotImplementedError
+
+    def _load(self, job_id: str) -> Optional[TTSJob]:
+        raise NotImplementedError
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+    def _notify(self, job: TTSJob):
+        pass
+
+    # --- Public interface ---
+    def submit(self, job: TTSJob) -> TTSJob:
+        if self.depth() >= self.max_depth:
+            TTS_JOBS.labels("rejected").inc()
+            raise QueueFullError(f"TTS queue is full ({self.max_depth} jobs).")
+        self._ensure_workers()
+        job.status = "queued"
+        self._save(job)
+        TTS_QUEUE_DEPTH.inc()
+        self._push(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[TTSJob]:
+        return self._load(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[TTSJob]:
+        """Blocks until the job has finished or timeout passes; returns its latest state."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._load(job_id)
+            if job is None or job.finished or time.monotonic() >= deadline:
+                return job
+            time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+
+    # --- Workers ---
+    def _ensure_workers(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._start_lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"tts-job-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            try:
+                job = self._pop(timeout=1.0)
+            except Exception as e:
+                log.warning("TTS queue unavailable: %s", e)
+                time.sleep(1.0)
+                continue
+            if job is not None:
+                self._run(job)
+
+    def _run(self, job: TTSJob):
+        job.status = "running"
+        job.started_at = time.time()
+        self._save(job)
+        TTS_JOB_WAIT_SECONDS.observe(job.started_at - job.created_at)
+        try:
+            ok = self.handler(job)
+            job.status = "done" if ok else "failed"
+            if not ok:
+                job.error = "Speech synthesis failed."
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        job.finished_at = time.time()
+        self._save(job)
+        self._notify(job)
+        TTS_JOBS.labels(job.status).inc()
+        TTS_JOB_SECONDS.observe(job.finished_at - job.created_at)
+        log.debug("TTS job %s %s", job.id, job.status, extra={"fields": job.timings()})
+
+
+class MemoryJobQueue(JobQueue):
+    """Jobs and their state live in this process; /audio-jobs must reach the same worker."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()  # FIFO within one priority
+        self._jobs: Dict[str, TTSJob] = {}
+        self._finished = threading.Condition()
+
+    def _push(self, job):
+        self._queue.put((job.priority, next(self._order), job))
+
+    def _pop(self, timeout):
+        try:
+            job = self._queue.get(timeout=timeout)[2]
+        except queue.Empty:
+            return None
+        TTS_QUEUE_DEPTH.dec()
+        return job
+
+    def _save(self, job):
+        with self._finished:
+            self._jobs[job.id] = job
+            if job.status == "queued":
+                self._expire(time.time() - self.ttl_seconds)
+
+    def _expire(self, cutoff):
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _load(self, job_id):
+        with self._finished:
+            return self._jobs.get(job_id)
+
+    def _notify(self, job):
+        with self._finished:
+            self._finished.notify_all()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def wait(self, job_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self._finished:
+            while True:
+                job = self._jobs.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job.finished or remaining <= 0:
+                    return job
+                self._finished.wait(remaining)
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Queue on any Redis-compatible server, shared by every worker process.
+
+    Pending job ids sit in a sorted set scored by (priority, submit time); workers claim
+    them with BZPOPMIN. Job state is a JSON value that expires ttl_seconds after its last update.
+    """
+
+    def __init__(self, url: str = REDIS_URL, client=None, prefix: str = "ganesha:tts:", **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("TTS_JOB_QUEUE=redis requires the 'redis' package. Install it using 'pip install redis'")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.queue_key = f"{prefix}queue"
+
+    def _key(self, job_id):
+        return f"{self.prefix}job:{job_id}"
+
+    def _push(self, job):
+        # Priority dominates; within one priority, older jobs (smaller ms timestamp) go first.
+        self.client.zadd(self.queue_key, {job.id: job.priority * 1e13 + int(job.created_at * 1000)})
+
+    def _pop(self, timeout):
+        popped = self.client.bzpopmin(self.queue_key, timeout=max(1, int(timeout)))
+        if popped is None:
+            return None
+        TTS_QUEUE_DEPTH.dec()
+        job_id = popped[1].decode() if isinstance(popped[1], bytes) else popped[1]
+        return self._load(job_id)
+
+    def _save(self, job):
+        self.client.set(self._key(job.id), json.dumps(job.to_dict(), ensure_ascii=False), ex=self.ttl_seconds)
+
+    def _load(self, job_id):
+        data = self.client.get(self._key(job_id))
+        return TTSJob.from_dict(json.loads(data)) if data else None
+
+    def depth(self):
+        return self.client.zcard(self.queue_key)
+
+
+def create_job_queue(handler, kind: str = TTS_JOB_QUEUE) -> JobQueue:
+    if kind == "redis":
+        return RedisJobQueue(handler=handler)
+    return MemoryJobQueue(handler=handler)